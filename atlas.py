@@ -0,0 +1,152 @@
+"""Piece sprites packed into one pre-scaled surface per square size.
+
+Loading the pieces used to mean decoding twelve PNGs and scaling each of them
+at every launch, for one fixed square size. A SpriteAtlas holds all twelve
+pieces side by side in a single surface of the size needed. It is built the
+first time it is drawn from and saved to a cache directory as raw RGBA pixels,
+in a file named after the square size and the modification times of the
+source images, so later launches read one file without decoding or scaling
+anything, and changing an image or the window size builds a new atlas. Pieces
+are drawn by blitting their sub-rect of the atlas.
+
+Usage:
+    python atlas.py --size 60   # time per-image loading against the atlas, cold and cached
+"""
+import argparse
+import glob
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+import pygame
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
+CACHE_DIR = os.environ.get('CHESS_ATLAS_CACHE',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), '.atlas_cache'))
+
+# Board characters of the pieces, in their order in the atlas
+PIECES = 'PNBRQKpnbrqk'
+
+
+def image_path(piece, image_dir=IMAGE_DIR):
+    """Path of the source image of a piece given by its board character."""
+    return os.path.join(image_dir, ('w' if piece.isupper() else 'b') + piece.lower() + '.png')
+
+
+class SpriteAtlas:
+    """All piece sprites at one square size in a single surface, loaded on first use."""
+
+    def __init__(self, square_size, image_dir=IMAGE_DIR, cache_dir=None):
+        self.square_size = square_size
+        self.image_dir = image_dir
+        self.cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+        self.rects = {piece: pygame.Rect(index * square_size, 0, square_size, square_size)
+                      for index, piece in enumerate(PIECES)}
+        self._surface = None
+
+    @property
+    def surface(self):
+        if self._surface is None:
+            self._surface = self.load()
+        return self._surface
+
+    def cache_path(self):
+        """Cache file for this size and the current source images."""
+        stamps = [(piece, os.stat(image_path(piece, self.image_dir)).st_mtime_ns) for piece in PIECES]
+        digest = hashlib.sha1(repr(stamps).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'atlas-{self.square_size}-{digest}.rgba')
+
+    def load(self):
+        """Returns the atlas surface from the cache, building and caching it if needed."""
+        path = self.cache_path()
+        size = (self.square_size * len(PIECES), self.square_size)
+        try:
+            with open(path, 'rb') as f:
+                surface = pygame.image.frombytes(f.read(), size, 'RGBA')
+        except (OSError, ValueError):
+            surface = self.build()
+            self.save(surface, path)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha() # Blits fastest in the display's pixel format
+        return surface
+
+    def build(self):
+        """Decodes and scales the source images into a new atlas surface."""
+        size = self.square_size
+        surface = pygame.Surface((size * len(PIECES), size), pygame.SRCALPHA)
+        for piece, rect in self.rects.items():
+            image = pygame.image.load(image_path(piece, self.image_dir))
+            surface.blit(pygame.transform.scale(image, (size, size)), rect)
+        return surface
+
+    def save(self, surface, path):
+        """Writes surface to the cache and removes atlases of this size built from older images."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temporary = path + '.tmp'
+            with open(temporary, 'wb') as f:
+                f.write(pygame.image.tobytes(surface, 'RGBA'))
+            os.replace(temporary, path)
+            for stale in glob.glob(os.path.join(self.cache_dir, f'atlas-{self.square_size}-*.rgba')):
+                if stale != path:
+                    os.remove(stale)
+        except OSError:
+            pass # A read-only cache only costs the next launch a rebuild
+
+    def blit(self, target, piece, dest):
+        """Draws piece (a board character) onto target at dest and returns the rect drawn."""
+        return target.blit(self.surface, dest, self.rects[piece])
+
+
+_atlases = {}
+
+
+def get_atlas(square_size, image_dir=IMAGE_DIR, cache_dir=None):
+    """Returns the atlas for square_size, creating it (but not loading it) on the first call."""
+    key = (square_size, image_dir, CACHE_DIR if cache_dir is None else cache_dir)
+    if key not in _atlases:
+        _atlases[key] = SpriteAtlas(square_size, image_dir, cache_dir)
+    return _atlases[key]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time loading the piece sprites.")
+    parser.add_argument('--size', type=int, default=60, help="square size in pixels")
+    parser.add_argument('--repeat', type=int, default=5, help="runs of each method; the best is reported")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    pygame.display.set_mode((8 * args.size, 8 * args.size))
+
+    def best(load):
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            load()
+            times.append(time.perf_counter() - start)
+        return min(times) * 1000
+
+    def per_image():
+        for piece in PIECES:
+            pygame.transform.scale(pygame.image.load(image_path(piece)), (args.size, args.size)).convert_alpha()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        def cold():
+            for path in glob.glob(os.path.join(cache_dir, '*.rgba')):
+                os.remove(path)
+            SpriteAtlas(args.size, cache_dir=cache_dir).load()
+
+        results = [('per-image load and scale', best(per_image)), ('atlas, cold cache', best(cold))]
+        SpriteAtlas(args.size, cache_dir=cache_dir).load()
+        results.append(('atlas, cached', best(lambda: SpriteAtlas(args.size, cache_dir=cache_dir).load())))
+    for name, milliseconds in results:
+        print(f"{name:>26}: {milliseconds:7.2f} ms")
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
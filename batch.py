@@ -0,0 +1,286 @@
+"""Batched evaluation, attack maps and check detection with NumPy.
+
+For analysis jobs over many positions at once. pack() turns N positions into
+an (N, 64) int8 array of Position piece codes, and to_planes() into
+(N, 12, 8, 8) one-hot planes. Attacks are computed on uint64 bitboards with
+bit row * 8 + col set where a piece stands: one shift-and-mask array
+operation moves every piece of the batch one step in a direction, so the
+cost per position is a few hundred machine operations rather than a Python
+loop over the squares.
+
+Every function gives exactly the result of its scalar counterpart:
+evaluate_batch() matches engine.evaluate_position, attack_maps() matches
+Position.attack_map and in_check() matches Position.in_check.
+
+NumPy is only needed by this module.
+
+Usage:
+    python batch.py --positions 100000
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from engine import SQUARE_SCORES
+from position import BLACK, COLOR_SHIFT, SQUARES, WHITE, Position
+from rules import BOARD_SIZE, create_board, is_in_check
+
+# Piece code of each of the 12 planes: white P N B R Q K, then black p n b r q k
+PLANE_CODES = np.array([color << COLOR_SHIFT | kind for color in (WHITE, BLACK) for kind in range(1, 7)],
+                       dtype=np.int8)
+PIECE_PLANES = 6
+
+# Material plus piece-square score of square * 15 + piece code, for one flat lookup
+_SCORES_BY_SQUARE = np.array(SQUARE_SCORES, dtype=np.int32).T.ravel()
+_SQUARE_OFFSETS = (np.arange(SQUARES) * len(SQUARE_SCORES)).astype(np.int16)
+
+# Rows processed at a time, so the intermediate arrays stay in cache
+CHUNK_ROWS = 16384
+
+_FULL = np.uint64(0xFFFFFFFFFFFFFFFF)
+_BYTE_LOW_BITS = np.uint64(0x0101010101010101)
+# Multiplying bytes that are 0 or 1 by this moves byte j's bit to bit 56 + j
+_GATHER = np.uint64(0x0102040810204080)
+_GATHER_SHIFT = np.uint64(56)
+_COLUMN_0 = _BYTE_LOW_BITS
+# Masks clearing the columns a shift towards higher columns wraps into, and back
+_NOT_COL_0 = _FULL ^ _COLUMN_0
+_NOT_COL_01 = _NOT_COL_0 & (_FULL ^ (_COLUMN_0 << np.uint64(1)))
+_NOT_COL_7 = _FULL ^ (_COLUMN_0 << np.uint64(7))
+_NOT_COL_67 = _NOT_COL_7 & (_FULL ^ (_COLUMN_0 << np.uint64(6)))
+_COLUMN_MASKS = {-2: _NOT_COL_67, -1: _NOT_COL_7, 0: _FULL, 1: _NOT_COL_0, 2: _NOT_COL_01}
+
+
+def _step(dr, dc):
+    """Returns (shift, mask) moving every bit by dr rows and dc columns."""
+    return dr * BOARD_SIZE + dc, _COLUMN_MASKS[dc]
+
+
+def _shift(bb, step):
+    shift, mask = step
+    if shift > 0:
+        return (bb << np.uint64(shift)) & mask
+    return (bb >> np.uint64(-shift)) & mask
+
+
+def _ray(pieces, empty, step):
+    """Squares attacked along step by the sliders in pieces, up to and including the first occupied square.
+
+    A Kogge-Stone fill: the rays grow 1, 2 and then 4 squares at a time
+    through empty squares, so a ray of any length takes three rounds.
+    """
+    shift, mask = step
+    propagate = empty & mask
+    if shift > 0:
+        for distance in (shift, 2 * shift, 4 * shift):
+            pieces = pieces | (propagate & (pieces << np.uint64(distance)))
+            propagate = propagate & (propagate << np.uint64(distance))
+        return (pieces << np.uint64(shift)) & mask
+    for distance in (-shift, -2 * shift, -4 * shift):
+        pieces = pieces | (propagate & (pieces >> np.uint64(distance)))
+        propagate = propagate & (propagate >> np.uint64(distance))
+    return (pieces >> np.uint64(-shift)) & mask
+
+
+ROOK_STEPS = tuple(_step(dr, dc) for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1)))
+BISHOP_STEPS = tuple(_step(dr, dc) for dr, dc in ((-1, -1), (-1, 1), (1, -1), (1, 1)))
+KNIGHT_STEPS = tuple(_step(dr, dc) for dr, dc in ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                                                  (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_STEPS = ROOK_STEPS + BISHOP_STEPS
+# White pawns attack towards row 0, black pawns towards row 7
+PAWN_STEPS = (tuple(_step(-1, dc) for dc in (-1, 1)), tuple(_step(1, dc) for dc in (-1, 1)))
+
+
+def _chunked(function, *arrays):
+    """Applies function to CHUNK_ROWS rows of arrays at a time and joins the results."""
+    rows = len(arrays[0])
+    if rows <= CHUNK_ROWS:
+        return function(*arrays)
+    return np.concatenate([function(*(array[start:start + CHUNK_ROWS] for array in arrays))
+                           for start in range(0, rows, CHUNK_ROWS)])
+
+
+# --- Packing ---
+
+def pack(positions):
+    """Packs Positions into ((N, 64) int8 piece codes, (N,) int8 sides to move)."""
+    positions = list(positions)
+    codes = np.frombuffer(b''.join([position.squares for position in positions]), dtype=np.int8)
+    sides = np.fromiter((position.side for position in positions), dtype=np.int8, count=len(positions))
+    return codes.reshape(len(positions), SQUARES), sides
+
+
+def pack_boards(boards, players):
+    """Packs list boards and their players to move, as pack() does for Positions."""
+    return pack(Position.from_board(board, player) for board, player in zip(boards, players))
+
+
+def to_planes(codes):
+    """Returns (N, 12, 8, 8) int8 one-hot planes in PLANE_CODES order."""
+    planes = codes[:, None, :] == PLANE_CODES[None, :, None]
+    return planes.astype(np.int8).reshape(len(codes), len(PLANE_CODES), BOARD_SIZE, BOARD_SIZE)
+
+
+def _bit_planes(codes):
+    """Returns four (N,) uint64 bitboards holding bit k of every square's piece code.
+
+    Bits 0-2 are the piece type and bit 3 the colour, so every piece bitboard
+    is a few ands of these, without comparing all 64 squares once per piece.
+    """
+    words = np.ascontiguousarray(codes).view('<u8') # Eight squares per word, one byte each
+    planes = []
+    for bit in range(4):
+        gathered = (((words >> np.uint64(bit)) & _BYTE_LOW_BITS) * _GATHER) >> _GATHER_SHIFT
+        planes.append(gathered.astype(np.uint8).view('<u8')[:, 0])
+    return planes
+
+
+def bitboards(codes):
+    """Returns (N, 12) uint64 bitboards in PLANE_CODES order."""
+    planes = _bit_planes(codes)
+    inverted = [~plane for plane in planes]
+    boards = np.empty((len(codes), len(PLANE_CODES)), dtype=np.uint64)
+    for index, code in enumerate(PLANE_CODES.tolist()):
+        board = _FULL
+        for bit in range(4):
+            board = board & (planes[bit] if code >> bit & 1 else inverted[bit])
+        boards[:, index] = board
+    return boards
+
+
+# --- Evaluation and attacks ---
+
+def _evaluate(codes):
+    return _SCORES_BY_SQUARE[codes + _SQUARE_OFFSETS].sum(axis=1, dtype=np.int32)
+
+
+def evaluate_batch(codes):
+    """Returns (N,) int32 material and piece-square scores from white's point of view."""
+    return _chunked(_evaluate, codes)
+
+
+def _attack_bitboards(boards):
+    empty = ~np.bitwise_or.reduce(boards, axis=1)
+    attacks = np.empty((len(boards), 2), dtype=np.uint64)
+    for color in (WHITE, BLACK):
+        base = color * PIECE_PLANES
+        pawns, knights, bishops, rooks, queens, kings = (boards[:, base + index] for index in range(PIECE_PLANES))
+        side = np.zeros(len(boards), dtype=np.uint64)
+        for step in PAWN_STEPS[color]:
+            side |= _shift(pawns, step)
+        for step in KNIGHT_STEPS:
+            side |= _shift(knights, step)
+        for step in KING_STEPS:
+            side |= _shift(kings, step)
+        for steps, sliders in ((ROOK_STEPS, rooks | queens), (BISHOP_STEPS, bishops | queens)):
+            for step in steps:
+                side |= _ray(sliders, empty, step)
+        attacks[:, color] = side
+    return attacks
+
+
+def attack_bitboards(boards):
+    """Returns (N, 2) uint64 bitboards of the squares attacked by white and by black."""
+    return _chunked(_attack_bitboards, boards)
+
+
+def attack_maps(codes):
+    """Returns (N, 2, 64) bool maps of the squares attacked by white and by black."""
+    attacks = attack_bitboards(bitboards(codes))
+    return np.unpackbits(attacks.view(np.uint8), bitorder='little').reshape(len(codes), 2, SQUARES).astype(bool)
+
+
+def _in_check(codes, sides):
+    # Looks outwards from each king, as Position.is_attacked does, instead of
+    # building both sides' full attack maps
+    type_0, type_1, type_2, black = _bit_planes(codes)
+    occupied = type_0 | type_1 | type_2
+    enemy = occupied & (black ^ (sides.astype(np.uint64) * _FULL))
+    not_0, not_1, not_2 = ~type_0, ~type_1, ~type_2
+    kings = (occupied ^ enemy) & not_0 & type_1 & type_2
+    empty = ~occupied
+
+    hits = np.zeros(len(codes), dtype=np.uint64)
+    rooks = enemy & type_2 & not_1 # Rooks and queens
+    for step in ROOK_STEPS:
+        hits |= _ray(kings, empty, step) & rooks
+    bishops = enemy & type_0 & (type_1 ^ type_2) # Bishops and queens
+    for step in BISHOP_STEPS:
+        hits |= _ray(kings, empty, step) & bishops
+    knights = enemy & not_0 & type_1 & not_2
+    for step in KNIGHT_STEPS:
+        hits |= _shift(kings, step) & knights
+    enemy_kings = enemy & not_0 & type_1 & type_2
+    for step in KING_STEPS:
+        hits |= _shift(kings, step) & enemy_kings
+    # An enemy pawn attacks the king from where the king's own pawn would attack
+    pawn_squares = [_shift(kings, PAWN_STEPS[color][0]) | _shift(kings, PAWN_STEPS[color][1])
+                    for color in (WHITE, BLACK)]
+    hits |= np.where(sides == WHITE, pawn_squares[WHITE], pawn_squares[BLACK]) & enemy & type_0 & not_1 & not_2
+    return hits != 0
+
+
+def in_check(codes, sides):
+    """Returns (N,) bool flags telling whether the side to move's king is attacked."""
+    return _chunked(_in_check, codes, sides)
+
+
+# --- Benchmark ---
+
+def random_positions(count, seed=0, max_plies=80):
+    """Returns count Positions reached by random legal moves from the start position."""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        position = Position.from_board(create_board())
+        for _ in range(rng.randrange(max_plies)):
+            moves = position.legal_moves()
+            if not moves:
+                break
+            position.make_move(rng.choice(moves))
+        position.history = []
+        positions.append(position)
+    return positions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare batched and scalar evaluation and check detection.")
+    parser.add_argument('--positions', type=int, default=100000, help="positions in the batch")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # A few thousand distinct positions, repeated to the batch size
+    distinct = random_positions(min(args.positions, 2000), args.seed)
+    positions = [distinct[index % len(distinct)] for index in range(args.positions)]
+    boards = [(position.to_board(), position.player) for position in positions]
+
+    def rate(function):
+        start = time.perf_counter()
+        result = function()
+        return result, len(positions) / (time.perf_counter() - start)
+
+    scalar, rules_rate = rate(lambda: [is_in_check(board, player) for board, player in boards])
+    _, position_rate = rate(lambda: [position.in_check() for position in positions])
+    (codes, sides), pack_rate = rate(lambda: pack(positions))
+    flags, check_rate = rate(lambda: in_check(codes, sides))
+    scores, evaluate_rate = rate(lambda: evaluate_batch(codes))
+    _, attack_rate = rate(lambda: attack_maps(codes))
+
+    if flags.tolist() != scalar:
+        print("Batched in_check does not match is_in_check", file=sys.stderr)
+        return 1
+    print(f"Positions: {len(positions)} ({sum(scalar)} in check, mean score {scores.mean():.1f})")
+    print(f"rules.is_in_check:  {rules_rate:>12,.0f} positions/sec")
+    print(f"Position.in_check:  {position_rate:>12,.0f} positions/sec")
+    print(f"pack:               {pack_rate:>12,.0f} positions/sec")
+    print(f"in_check:           {check_rate:>12,.0f} positions/sec ({check_rate / rules_rate:.0f}x is_in_check)")
+    print(f"evaluate_batch:     {evaluate_rate:>12,.0f} positions/sec")
+    print(f"attack_maps:        {attack_rate:>12,.0f} positions/sec")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""Opening book stored as sorted fixed-width records and read through mmap.
+
+A book file is a 16-byte header followed by 12-byte records of
+(Zobrist key, move, weight), sorted by key and move. OpeningBook maps the
+file and binary-searches it, so opening a book reads nothing but the header
+and a book of millions of entries takes no Python heap. Keys are Position
+keys, so the side to move is part of the key, and moves are Position int
+moves.
+
+Usage:
+    python book.py build games.pgn --output book.bin --max-plies 16
+    python book.py probe --fen "<fen>" --book book.bin
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from perft import format_move
+from pgn import read_games, replay
+from position import PAWN, PROMOTION_ROW, QUEEN, SQUARES, Position, move_to_tuple
+from rules import BOARD_SIZE, create_board
+
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin')
+
+MAGIC = b'CHBK'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQ') # Magic, version, record size, record count
+RECORD = struct.Struct('<QHH') # Key, move, weight
+_KEY = struct.Struct('<Q')
+
+DEFAULT_MAX_PLIES = 16
+MAX_WEIGHT = 0xFFFF
+
+
+class OpeningBook:
+    """Read-only opening book backed by a memory-mapped book file."""
+
+    def __init__(self, path=BOOK_FILE):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not an opening book")
+        magic, version, record_size, count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size or \
+           len(self.map) != HEADER.size + count * RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is not an opening book of version {VERSION}")
+        self.count = count
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _key_at(self, index):
+        return _KEY.unpack_from(self.map, HEADER.size + index * RECORD.size)[0]
+
+    def entries(self, key):
+        """Returns the (move, weight) pairs stored for key, in move order."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        offset = HEADER.size + lo * RECORD.size
+        while lo < self.count:
+            record_key, move, weight = RECORD.unpack_from(self.map, offset)
+            if record_key != key:
+                break
+            found.append((move, weight))
+            lo += 1
+            offset += RECORD.size
+        return found
+
+    def choose(self, position, rng=random):
+        """Returns a legal book move for position picked by weight, or None if it is out of book.
+
+        The stored moves are checked against the legal moves, so a key
+        collision can never produce an illegal move.
+        """
+        entries = self.entries(position.key)
+        if not entries:
+            return None
+        legal = set(position.legal_moves())
+        entries = [(move, weight) for move, weight in entries if move in legal and weight > 0]
+        if not entries:
+            return None
+        return rng.choices([move for move, _ in entries], weights=[weight for _, weight in entries])[0]
+
+    def choose_move(self, board, player, rng=random):
+        """Returns a book move for a list board as a ((row, col), (row, col)) tuple, or None."""
+        move = self.choose(Position.from_board(board, player), rng)
+        return None if move is None else move_to_tuple(move)
+
+
+def open_book(path=BOOK_FILE):
+    """Returns an OpeningBook for path, or None if there is no book there."""
+    return OpeningBook(path) if os.path.exists(path) else None
+
+
+# --- Building ---
+
+def count_book_moves(games, max_plies=DEFAULT_MAX_PLIES, counts=None):
+    """Counts how often each (key, move) is played in the first max_plies of games.
+
+    Games stop counting at their first illegal move; underpromotions are
+    left out, since book moves always promote to a queen.
+    """
+    counts = {} if counts is None else counts
+    for game in games:
+        try:
+            for ply, position in enumerate(replay(game)):
+                if ply >= max_plies:
+                    break
+                move, piece, key = position.last_move()
+                end = move % SQUARES
+                if piece & 7 == PAWN and end // BOARD_SIZE == PROMOTION_ROW[position.side ^ 1] and \
+                   position.squares[end] & 7 != QUEEN:
+                    continue
+                entry = (key, move)
+                counts[entry] = counts.get(entry, 0) + 1
+        except ValueError:
+            continue
+    return counts
+
+
+def write_book(counts, path, min_count=1):
+    """Writes counts from count_book_moves to path as a sorted book file; returns the record count."""
+    entries = sorted((key, move, min(count, MAX_WEIGHT)) for (key, move), count in counts.items()
+                     if count >= min_count)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(entries)))
+        for entry in entries:
+            f.write(RECORD.pack(*entry))
+    os.replace(temporary, path) # A reader never sees a half-written book
+    return len(entries)
+
+
+def build_book(pgn_paths, path=BOOK_FILE, max_plies=DEFAULT_MAX_PLIES, min_count=1):
+    """Builds a book file from PGN files and returns the number of records written."""
+    counts = {}
+    for pgn_path in pgn_paths:
+        count_book_moves(read_games(pgn_path), max_plies, counts)
+    return write_book(counts, path, min_count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query an opening book.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="build a book from PGN files")
+    build.add_argument('pgn', nargs='+', help="PGN files to read")
+    build.add_argument('--output', default=BOOK_FILE, help="book file to write")
+    build.add_argument('--max-plies', type=int, default=DEFAULT_MAX_PLIES, help="plies of each game to include")
+    build.add_argument('--min-count', type=int, default=1, help="leave out moves played fewer times than this")
+    probe = commands.add_parser('probe', help="list the book moves of a position")
+    probe.add_argument('--fen', help="position to look up (default: the start position)")
+    probe.add_argument('--book', default=BOOK_FILE, help="book file to read")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        records = build_book(args.pgn, args.output, args.max_plies, args.min_count)
+        print(f"Wrote {records} records to {args.output}")
+        return 0
+
+    position = Position.from_fen(args.fen) if args.fen else Position.from_board(create_board())
+    with OpeningBook(args.book) as book:
+        entries = book.entries(position.key)
+    for move, weight in sorted(entries, key=lambda entry: -entry[1]):
+        print(f"{format_move(move_to_tuple(move))} {weight}")
+    if not entries:
+        print("Position is not in the book")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,239 +1,252 @@
+import os
 import pygame
 import sys
-import random
+import threading
+import time
+
+import instrumentation
+from atlas import get_atlas
+from book import open_book
+from engine import Engine
+from rules import (
+    BOARD_SIZE, create_board, find_king, get_all_valid_moves, is_in_check, is_path_clear, is_valid_move, make_move,
+)
+from tablebase import open_tablebases
 
 # --- Constants ---
-BOARD_SIZE = 8
+# The window starts at this size; resize_display() changes these three
 SQUARE_SIZE = 60
 WIDTH = BOARD_SIZE * SQUARE_SIZE
 HEIGHT = BOARD_SIZE * SQUARE_SIZE
+MIN_SQUARE_SIZE = 20
 
 # Colors
 LIGHT_BROWN = (205, 133, 63)
 DARK_BROWN = (139, 69, 19)
 
-# --- Game Setup ---
-pygame.init()
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Chess")
+# Seconds the computer may think about each move
+COMPUTER_MOVE_TIME = 1.0
 
-# --- Functions ---
-PIECE_IMAGES = {}
-
-def load_images():
-    pieces = ['bb', 'bk', 'bn', 'bp', 'bq', 'br', 'wB', 'wK', 'wN', 'wP', 'wQ', 'wR']
-    for piece in pieces:
-        PIECE_IMAGES[piece] = pygame.transform.scale(pygame.image.load(f"images/{piece}.png"), (SQUARE_SIZE, SQUARE_SIZE))
-
-def create_board():
-    """Creates the initial chess board setup."""
-    return [
-        ['r', 'n', 'b', 'q', 'k', 'b', 'n', 'r'],
-        ['p', 'p', 'p', 'p', 'p', 'p', 'p', 'p'],
-        [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-        [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-        [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-        [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-        ['P', 'P', 'P', 'P', 'P', 'P', 'P', 'P'],
-        ['R', 'N', 'B', 'Q', 'K', 'B', 'N', 'R']
-    ]
-
-def draw_board(board, selected_pos=None):
-    """Draws the chessboard and pieces."""
-    for row in range(BOARD_SIZE):
-        for col in range(BOARD_SIZE):
-            color = LIGHT_BROWN if (row + col) % 2 == 0 else DARK_BROWN
-            pygame.draw.rect(screen, color, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-            piece = board[row][col]
-            if piece != ' ':
-                # Determine the correct image key based on piece character
-                image_key = 'w' + piece.upper() if piece.isupper() else 'b' + piece.lower()
-                screen.blit(PIECE_IMAGES[image_key], (col * SQUARE_SIZE, row * SQUARE_SIZE))
-            
-            if selected_pos and selected_pos == (row, col):
-                pygame.draw.rect(screen, (255, 255, 0), (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE), 3) # Yellow highlight
-
-def is_path_clear(board, start_pos, end_pos):
-    start_row, start_col = start_pos
-    end_row, end_col = end_pos
+# If set, the instrumentation stats are written to this JSON file when the game ends
+STATS_FILE = os.environ.get('CHESS_STATS')
+# If set, tracing is enabled at this level ('error', 'warning', 'info' or 'debug')
+TRACE_LEVEL = os.environ.get('CHESS_TRACE')
 
-    # Horizontal move
-    if start_row == end_row:
-        step = 1 if end_col > start_col else -1
-        for col in range(start_col + step, end_col, step):
-            if board[start_row][col] != ' ':
-                return False
-        return True
-    # Vertical move
-    elif start_col == end_col:
-        step = 1 if end_row > start_row else -1
-        for row in range(start_row + step, end_row, step):
-            if board[row][start_col] != ' ':
-                return False
-        return True
-    # Diagonal move
-    elif abs(start_row - end_row) == abs(start_col - end_col):
-        row_step = 1 if end_row > start_row else -1
-        col_step = 1 if end_col > start_col else -1
-        r, c = start_row + row_step, start_col + col_step
-        while r != end_row:
-            if board[r][c] != ' ':
-                return False
-            r += row_step
-            c += col_step
-        return True
-    return False # Not a straight or diagonal move
-
-def is_valid_move(board, start_pos, end_pos, current_player, check_for_check=True):
-    """Checks if a move is valid according to chess rules."""
-    start_row, start_col = start_pos
-    end_row, end_col = end_pos
-    piece = board[start_row][start_col]
-    target_piece = board[end_row][end_col]
+# Upper bound on frames drawn per second
+FPS = 60
+HIGHLIGHT_COLOR = (255, 255, 0)
 
-    # Basic checks
-    if start_pos == end_pos:
-        print("is_valid_move: start_pos == end_pos")
-        return False
-    if not (0 <= end_row < BOARD_SIZE and 0 <= end_col < BOARD_SIZE):
-        print("is_valid_move: end_pos out of bounds")
-        return False
+# Seconds a message stays over the board
+MESSAGE_TIME = 2.0
+MESSAGE_COLOR = (255, 0, 0)
+THINKING_COLOR = (255, 255, 255)
+THINKING_BACKGROUND = (0, 0, 0)
 
-    # Check if the piece belongs to the current player
-    if (current_player == 'white' and piece.islower()) or \
-       (current_player == 'black' and piece.isupper()):
-        print(f"is_valid_move: piece {piece} does not belong to current player {current_player}")
-        return False
+# --- Game Setup ---
+# The display is created by init_display() when the game starts, so importing
+# this module has no pygame side effects.
+screen = None
+# The piece sprites at SQUARE_SIZE; the atlas is only read from disk when first drawn
+sprites = None
 
-    # Check if target square contains own piece
-    if (current_player == 'white' and target_piece.isupper()) or \
-       (current_player == 'black' and target_piece.islower()):
-        print(f"is_valid_move: target square {target_piece} contains own piece for player {current_player}")
+# --- Functions ---
+def init_display():
+    """Initializes the pygame modules the game uses and opens the game window."""
+    global screen, sprites
+    # pygame.init() would also start the audio and joystick subsystems, which can take longer than the rest
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
+    pygame.display.set_caption("Chess")
+    sprites = get_atlas(SQUARE_SIZE)
+
+def resize_display(width, height):
+    """Fits the board to a resized window; returns True if the square size changed."""
+    global SQUARE_SIZE, WIDTH, HEIGHT, screen, sprites
+    square_size = max(min(width, height) // BOARD_SIZE, MIN_SQUARE_SIZE)
+    if square_size == SQUARE_SIZE:
+        if (width, height) != (WIDTH, HEIGHT):
+            screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE) # Snap back to the board
         return False
-
-    # Pawn moves
-    if piece.lower() == 'p':
-        # White pawns (moving up, decreasing row index)
-        if current_player == 'white':
-            # Single square move
-            if end_col == start_col and end_row == start_row - 1 and target_piece == ' ':
-                print("is_valid_move: White pawn single move valid")
-                return True
-            # Two square initial move
-            if start_row == 6 and end_col == start_col and end_row == start_row - 2 and target_piece == ' ' and board[start_row - 1][start_col] == ' ':
-                print("is_valid_move: White pawn two square initial move valid")
-                return True
-            # Capture
-            if abs(end_col - start_col) == 1 and end_row == start_row - 1 and target_piece != ' ' and target_piece.islower():
-                print("is_valid_move: White pawn capture valid")
-                return True
-        # Black pawns (moving down, increasing row index)
+    SQUARE_SIZE = square_size
+    WIDTH = HEIGHT = BOARD_SIZE * SQUARE_SIZE
+    screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
+    sprites = get_atlas(SQUARE_SIZE)
+    return True
+
+def render_checkerboard():
+    """Renders the empty board once, so frames copy it instead of drawing 64 rectangles."""
+    surface = pygame.Surface((WIDTH, HEIGHT))
+    for row in range(BOARD_SIZE):
+        for col in range(BOARD_SIZE):
+            color = LIGHT_BROWN if (row + col) % 2 == 0 else DARK_BROWN
+            pygame.draw.rect(surface, color, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+    return surface.convert() if pygame.display.get_surface() else surface
+
+def draw_square(surface, background, board, row, col, selected_pos):
+    """Draws one square from the pre-rendered background, its piece and any highlight."""
+    rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+    surface.blit(background, rect, rect)
+    piece = board[row][col]
+    if piece != ' ':
+        sprites.blit(surface, piece, rect)
+    if selected_pos == (row, col):
+        pygame.draw.rect(surface, HIGHLIGHT_COLOR, rect, 3) # Yellow highlight
+    return rect
+
+class BoardRenderer:
+    """Draws the board, repainting only the squares that changed since the last frame.
+
+    The checkerboard is rendered once. Each frame compares the board and the
+    selection with what was last drawn and redraws just those squares, so a
+    frame costs the same however long the game runs, and nothing at all when
+    nothing changed.
+    """
+
+    def __init__(self, surface):
+        self.surface = surface
+        self.background = render_checkerboard()
+        self.drawn_board = None
+        self.drawn_selection = None
+
+    def resize(self, surface):
+        """Switches to a resized display surface: re-renders the checkerboard and redraws everything."""
+        self.surface = surface
+        self.background = render_checkerboard()
+        self.invalidate()
+
+    def invalidate(self):
+        """Forces a full redraw, e.g. after an overlay was drawn over the board."""
+        self.drawn_board = None
+
+    def invalidate_rect(self, rect):
+        """Forces a redraw of the squares under rect, e.g. where an overlay was removed."""
+        if self.drawn_board is None:
+            return
+        for row in range(max(rect.top // SQUARE_SIZE, 0), min((rect.bottom - 1) // SQUARE_SIZE + 1, BOARD_SIZE)):
+            for col in range(max(rect.left // SQUARE_SIZE, 0), min((rect.right - 1) // SQUARE_SIZE + 1, BOARD_SIZE)):
+                self.drawn_board[row][col] = None
+
+    def draw(self, board, selected_pos=None):
+        """Draws what changed and returns the dirty rects to pass to pygame.display.update."""
+        if self.drawn_board is None:
+            squares = [(row, col) for row in range(BOARD_SIZE) for col in range(BOARD_SIZE)]
         else:
-            # Single square move
-            if end_col == start_col and end_row == start_row + 1 and target_piece == ' ':
-                print("is_valid_move: Black pawn single move valid")
-                return True
-            # Two square initial move
-            if start_row == 1 and end_col == start_col and end_row == start_row + 2 and target_piece == ' ' and board[start_row + 1][start_col] == ' ':
-                print("is_valid_move: Black pawn two square initial move valid")
-                return True
-            # Capture
-            if abs(end_col - start_col) == 1 and end_row == start_row + 1 and target_piece != ' ' and target_piece.isupper():
-                print("is_valid_move: Black pawn capture valid")
-                return True
-        print("is_valid_move: Pawn move invalid by pawn rules")
-        return False # If none of the above pawn moves are valid
-
-    # Rook moves
-    elif piece.lower() == 'r':
-        if (start_row == end_row or start_col == end_col) and is_path_clear(board, start_pos, end_pos):
-            print("is_valid_move: Rook move valid")
-            return True
-    # Knight moves
-    elif piece.lower() == 'n':
-        dr = abs(start_row - end_row)
-        dc = abs(start_col - end_col)
-        if (dr == 1 and dc == 2) or (dr == 2 and dc == 1):
-            print("is_valid_move: Knight move valid")
-            return True
-    # Bishop moves
-    elif piece.lower() == 'b':
-        if abs(start_row - end_row) == abs(start_col - end_col) and is_path_clear(board, start_pos, end_pos):
-            print("is_valid_move: Bishop move valid")
-            return True
-    # Queen moves
-    elif piece.lower() == 'q':
-        if ((start_row == end_row or start_col == end_col) or \
-            (abs(start_row - end_row) == abs(start_col - end_col))) and \
-           is_path_clear(board, start_pos, end_pos):
-            print("is_valid_move: Queen move valid")
-            return True
-    # King moves
-    elif piece.lower() == 'k':
-        dr = abs(start_row - end_row)
-        dc = abs(start_col - end_col)
-        if dr <= 1 and dc <= 1:
-            print("is_valid_move: King move valid")
-            return True
-
-    print("is_valid_move: No specific piece rule matched")
-    return False
-
-def find_king(board, player):
-    king_piece = 'K' if player == 'white' else 'k'
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            if board[r][c] == king_piece:
-                return r, c
-    return None
-
-def is_in_check(board, player):
-    king_pos = find_king(board, player)
-    if king_pos is None:
-        return False # Should not happen in a valid game
-
-    opponent_player = 'black' if player == 'white' else 'white'
-
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            piece = board[r][c]
-            if piece != ' ':
-                # Check if the piece belongs to the opponent
-                if (opponent_player == 'white' and piece.isupper()) or \
-                   (opponent_player == 'black' and piece.islower()):
-                    if is_valid_move(board, (r, c), king_pos, opponent_player, check_for_check=False): # Don't recurse for check
-                        return True
-    return False
-
-def get_all_valid_moves(board, player):
-    valid_moves = []
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            piece = board[r][c]
-            if piece != ' ':
-                if (player == 'white' and piece.isupper()) or \
-                   (player == 'black' and piece.islower()):
-                    for end_row in range(BOARD_SIZE):
-                        for end_col in range(BOARD_SIZE):
-                            if is_valid_move(board, (r, c), (end_row, end_col), player, check_for_check=False):
-                                # Simulate the move to check for check
-                                original_piece = board[end_row][end_col]
-                                board[end_row][end_col] = piece
-                                board[r][c] = ' '
-                                if not is_in_check(board, player):
-                                    valid_moves.append(((r, c), (end_row, end_col)))
-                                # Undo the move
-                                board[r][c] = piece
-                                board[end_row][end_col] = original_piece
-    return valid_moves
-
-def display_message(message):
-    font = pygame.font.Font(None, 74)
-    text_surface = font.render(message, True, (255, 0, 0)) # Red color for messages
-    text_rect = text_surface.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-    screen.blit(text_surface, text_rect)
-    pygame.display.flip()
-    pygame.time.wait(2000) # Display message for 2 seconds
+            squares = [(row, col) for row in range(BOARD_SIZE) for col in range(BOARD_SIZE)
+                       if board[row][col] != self.drawn_board[row][col]]
+            if selected_pos != self.drawn_selection:
+                squares.extend(pos for pos in (self.drawn_selection, selected_pos) if pos is not None)
+
+        dirty = [draw_square(self.surface, self.background, board, row, col, selected_pos) for row, col in squares]
+        self.drawn_board = [row[:] for row in board]
+        self.drawn_selection = selected_pos
+        return dirty
+
+class Overlay:
+    """A line of text drawn over the board without blocking the event loop.
+
+    show() sets the text, optionally for a number of seconds. Each frame,
+    update() runs before BoardRenderer.draw() so the squares under a removed
+    or changed text are repainted, and draw() runs after it to paint the text
+    again wherever the board was redrawn under it.
+    """
+
+    def __init__(self, font_size, color, background=None, center=None, topleft=None):
+        self.font_size = font_size
+        self.color = color
+        self.background = background
+        self.center = center
+        self.topleft = topleft
+        self.font = None
+        self.text = None
+        self.expires = None
+        self.drawn_text = None
+        self.rect = None
+
+    def show(self, text, seconds=None):
+        self.text = text
+        self.expires = time.perf_counter() + seconds if seconds is not None else None
+
+    def hide(self):
+        self.text = None
+        self.expires = None
+
+    @property
+    def active(self):
+        return self.text is not None
+
+    def update(self, renderer):
+        if self.expires is not None and time.perf_counter() >= self.expires:
+            self.hide()
+        if self.text != self.drawn_text and self.rect is not None:
+            renderer.invalidate_rect(self.rect)
+            self.rect = None
+
+    def draw(self, surface, dirty):
+        """Paints the text if it changed or the board under it was redrawn; returns the rects to update."""
+        if self.text is None:
+            self.drawn_text = None
+            return []
+        if self.text == self.drawn_text and self.rect.collidelist(dirty) == -1:
+            return []
+        if self.font is None:
+            self.font = pygame.font.Font(None, self.font_size)
+        text_surface = self.font.render(self.text, True, self.color, self.background)
+        if self.center is not None:
+            self.rect = text_surface.get_rect(center=self.center)
+        else:
+            self.rect = text_surface.get_rect(topleft=self.topleft)
+        surface.blit(text_surface, self.rect)
+        self.drawn_text = self.text
+        return [self.rect]
+
+class ComputerPlayer:
+    """Searches for the computer's move on a background thread.
+
+    The event loop starts a search with start() and collects the result with
+    poll() once it is done, so the window keeps handling input and redrawing
+    while the engine thinks. The search is pure Python, so it shares the
+    interpreter with the event loop; the loop sleeps between frames, which
+    leaves the search almost all of the CPU.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.thread = None
+        self.result = None
+
+    @property
+    def thinking(self):
+        return self.thread is not None
+
+    def start(self, board, player, time_limit):
+        """Starts searching a copy of board for player."""
+        self.result = None
+        self.engine.reset_stop()
+        self.thread = threading.Thread(target=self._search, args=([row[:] for row in board], player, time_limit),
+                                       daemon=True)
+        self.thread.start()
+
+    def _search(self, board, player, time_limit):
+        start = time.perf_counter()
+        result = self.engine.search(board, player, time_limit=time_limit)
+        instrumentation.record_time('computer_move', time.perf_counter() - start)
+        self.result = result
+
+    def poll(self):
+        """Returns the SearchResult once the search has finished, otherwise None."""
+        if self.thread is None or self.thread.is_alive():
+            return None
+        self.thread = None
+        return self.result
+
+    def cancel(self):
+        """Stops a running search and discards its result."""
+        if self.thread is not None:
+            self.engine.stop()
+            self.thread.join()
+            self.thread = None
+        self.result = None
 
 def display_promotion_choice(current_player):
     promotion_options = ['Q', 'R', 'B', 'N']
@@ -256,23 +269,19 @@ def display_promotion_choice(current_player):
 
     option_rects = []
     for i, piece_char in enumerate(promotion_options):
-        piece_image_key = 'w' + piece_char.upper() if current_player == 'white' else 'b' + piece_char.lower()
-        piece_image = PIECE_IMAGES[piece_image_key]
-        
         x = box_x + i * SQUARE_SIZE
         y = box_y
-        screen.blit(piece_image, (x, y))
-        option_rects.append(pygame.Rect(x, y, SQUARE_SIZE, SQUARE_SIZE))
+        option_rects.append(sprites.blit(screen, piece_char, (x, y)))
 
     pygame.display.flip()
 
     while True:
-        for event in pygame.event.get():
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                mouseX, mouseY = event.pos
-                for i, rect in enumerate(option_rects):
-                    if rect.collidepoint(mouseX, mouseY):
-                        return promotion_options[i]
+        event = pygame.event.wait() # Sleep until there is input
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            mouseX, mouseY = event.pos
+            for i, rect in enumerate(option_rects):
+                if rect.collidepoint(mouseX, mouseY):
+                    return promotion_options[i]
 
 def handle_pawn_promotion(board, end_pos, current_player):
     end_row, end_col = end_pos
@@ -293,20 +302,52 @@ def handle_pawn_promotion(board, end_pos, current_player):
 
 def main():
     """Main function to run the game.""" 
-    load_images()
+    start = time.perf_counter()
+    if TRACE_LEVEL:
+        instrumentation.set_trace_level(TRACE_LEVEL)
+    init_display()
     board = create_board()
-
+    renderer = BoardRenderer(screen)
     selected_piece = None
     selected_pos = None
     current_player = 'white' # 'white' or 'black'
 
+    pygame.display.update(renderer.draw(board, selected_pos)) # First frame
+    instrumentation.record_time('first_frame', time.perf_counter() - start)
+    if instrumentation.TRACING:
+        instrumentation.trace('info', f"First frame after {time.perf_counter() - start:.3f}s")
+
+    # Nothing below is needed before the player's first move
+    # Endings the tables cover are played from them; generate some with tablebase.py
+    computer = ComputerPlayer(Engine(tablebases=open_tablebases()))
+    book = open_book() # None if there is no book.bin; build one with book.py
+    clock = pygame.time.Clock()
+    message = Overlay(74, MESSAGE_COLOR, center=(WIDTH // 2, HEIGHT // 2))
+    thinking = Overlay(30, THINKING_COLOR, THINKING_BACKGROUND, topleft=(4, 4))
+    game_over = False
+
     running = True
     while running:
-        for event in pygame.event.get():
+        if current_player == 'white' and not message.active:
+            # Nothing changes until the player does something, so sleep until then
+            events = [pygame.event.wait()] + pygame.event.get()
+        else:
+            events = pygame.event.get()
+
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
 
-            if event.type == pygame.MOUSEBUTTONDOWN and current_player == 'white':
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.invalidate()
+
+            if event.type == pygame.VIDEORESIZE:
+                resize_display(event.w, event.h)
+                renderer.resize(screen) # The display surface is new even when the size snapped back
+                message.center = (WIDTH // 2, HEIGHT // 2)
+
+            if event.type == pygame.MOUSEBUTTONDOWN and current_player == 'white' and \
+               0 <= event.pos[0] < WIDTH and 0 <= event.pos[1] < HEIGHT: # Not in the margin of a resized window
                 mouseX, mouseY = event.pos
                 clicked_col = mouseX // SQUARE_SIZE
                 clicked_row = mouseY // SQUARE_SIZE
@@ -320,23 +361,21 @@ def main():
                             selected_pos = (clicked_row, clicked_col)
                 else:
                     # Try to move the selected piece
-                    if is_valid_move(board, selected_pos, (clicked_row, clicked_col), current_player, check_for_check=True):
-                        print(f"Executing move from {selected_pos} to {(clicked_row, clicked_col)}")
-                        original_target_piece = board[clicked_row][clicked_col]
+                    move = (selected_pos, (clicked_row, clicked_col))
+                    if move in get_all_valid_moves(board, current_player):
+                        if instrumentation.TRACING:
+                            instrumentation.trace('info', f"Executing move from {selected_pos} to {(clicked_row, clicked_col)}")
                         board[clicked_row][clicked_col] = selected_piece
                         board[selected_pos[0]][selected_pos[1]] = ' '
-
-                        if is_in_check(board, current_player):
-                            # Undo the move if it results in check
-                            board[selected_pos[0]][selected_pos[1]] = selected_piece
-                            board[clicked_row][clicked_col] = original_target_piece
-                            display_message("Invalid move: King is in check!")
-                        else:
-                            if handle_pawn_promotion(board, (clicked_row, clicked_col), current_player):
-                                display_message("Pawn Promoted!")
-                            selected_piece = None
-                            selected_pos = None
-                            current_player = 'black' # Switch turns
+                        if handle_pawn_promotion(board, (clicked_row, clicked_col), current_player):
+                            renderer.invalidate() # The promotion dialog covered the board
+                            message.show("Pawn Promoted!", MESSAGE_TIME)
+                        selected_piece = None
+                        selected_pos = None
+                        current_player = 'black' # Switch turns
+                    elif is_valid_move(board, selected_pos, (clicked_row, clicked_col), current_player):
+                        # The piece can move there, but it would leave the king in check
+                        message.show("Invalid move: King is in check!", MESSAGE_TIME)
                     else:
                         # If the move is invalid, check if the user clicked on the same piece to deselect it
                         # or on another one of their own pieces to select it.
@@ -354,25 +393,47 @@ def main():
                             # If it's an invalid move to an empty square or opponent's piece, keep the current selection
                             # so the user can try another destination.
 
-        if current_player == 'black' and running: # Computer's turn
-            valid_moves = get_all_valid_moves(board, 'black')
-            if valid_moves:
-                move = random.choice(valid_moves)
-                start_pos, end_pos = move
-                piece_to_move = board[start_pos[0]][start_pos[1]]
-                board[end_pos[0]][end_pos[1]] = piece_to_move
-                board[start_pos[0]][start_pos[1]] = ' '
-                current_player = 'white' # Switch turns
-            else:
-                if is_in_check(board, 'black'):
-                    display_message("Checkmate! White wins!")
+        if current_player == 'black' and running and not game_over: # Computer's turn
+            if not computer.thinking:
+                book_move = book.choose_move(board, 'black') if book is not None else None
+                if book_move is not None:
+                    make_move(board, book_move)
+                    current_player = 'white' # Switch turns
                 else:
-                    display_message("Stalemate!")
-                running = False
-
-        draw_board(board, selected_pos)
-        pygame.display.flip()
+                    computer.start(board, 'black', COMPUTER_MOVE_TIME)
+            result = computer.poll()
+            if result is not None:
+                if result.move is not None:
+                    make_move(board, result.move) # Promotes to a queen
+                    current_player = 'white' # Switch turns
+                else:
+                    if is_in_check(board, 'black'):
+                        message.show("Checkmate! White wins!", MESSAGE_TIME)
+                    else:
+                        message.show("Stalemate!", MESSAGE_TIME)
+                    game_over = True
+        if game_over and not message.active:
+            running = False
 
+        if computer.thinking:
+            thinking.show("Thinking" + "." * (int(time.perf_counter() * 3) % 4))
+        else:
+            thinking.hide()
+
+        thinking.update(renderer)
+        message.update(renderer)
+        dirty = renderer.draw(board, selected_pos)
+        dirty += thinking.draw(screen, dirty)
+        dirty += message.draw(screen, dirty)
+        if dirty:
+            pygame.display.update(dirty)
+        clock.tick(FPS)
+
+    computer.cancel()
+    if book is not None:
+        book.close()
+    if STATS_FILE:
+        instrumentation.dump_stats(STATS_FILE)
     pygame.quit()
     sys.exit()
 
@@ -0,0 +1,453 @@
+"""Alpha-beta search engine for the computer player.
+
+The search is a negamax alpha-beta with iterative deepening and a capture-only
+quiescence search. Moves are ordered by the best move of the previous
+iteration, MVV-LVA for captures, then killer moves and the history heuristic
+for quiet moves. Every search runs under a time and/or node budget: when the
+budget runs out the best move found so far is returned, so the time spent on a
+move is bounded by the budget rather than by the depth reached.
+"""
+import time
+
+import instrumentation
+from position import PIECE_CHARS, SQUARES, Position, move_to_tuple
+from rules import BOARD_SIZE
+from tablebase import distance
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# --- Evaluation ---
+PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 0}
+
+# Piece-square tables from white's point of view, row 0 is the 8th rank
+PIECE_SQUARE_TABLES = {
+    'p': (
+          0,   0,   0,   0,   0,   0,   0,   0,
+         50,  50,  50,  50,  50,  50,  50,  50,
+         10,  10,  20,  30,  30,  20,  10,  10,
+          5,   5,  10,  25,  25,  10,   5,   5,
+          0,   0,   0,  20,  20,   0,   0,   0,
+          5,  -5, -10,   0,   0, -10,  -5,   5,
+          5,  10,  10, -20, -20,  10,  10,   5,
+          0,   0,   0,   0,   0,   0,   0,   0,
+    ),
+    'n': (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ),
+    'b': (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ),
+    'r': (
+          0,   0,   0,   0,   0,   0,   0,   0,
+          5,  10,  10,  10,  10,  10,  10,   5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+          0,   0,   0,   5,   5,   0,   0,   0,
+    ),
+    'q': (
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+         -5,   0,   5,   5,   5,   5,   0,  -5,
+          0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+    ),
+    'k': (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+         20,  20,   0,   0,   0,   0,  20,  20,
+         20,  30,  10,   0,   0,  10,  30,  20,
+    ),
+}
+
+MATE_SCORE = 100000
+# Scores beyond this are mates, with the distance to mate in the remainder
+MATE_THRESHOLD = MATE_SCORE - 1000
+INFINITY = MATE_SCORE + 1
+
+MAX_DEPTH = 64
+# How many nodes are searched between two checks of the clock
+CHECK_INTERVAL = 256
+
+# Move ordering bonuses, kept apart so every capture sorts before every quiet move
+PV_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 24
+KILLER_SCORE = 1 << 20
+
+
+def _square_scores():
+    """Material plus piece-square score of every piece code on every square, from white's point of view."""
+    table = []
+    for char in PIECE_CHARS:
+        if char == ' ':
+            table.append((0,) * SQUARES)
+            continue
+        kind = char.lower()
+        if char.isupper():
+            table.append(tuple(PIECE_VALUES[kind] + PIECE_SQUARE_TABLES[kind][square] for square in range(SQUARES)))
+        else:
+            # Mirror the rows for black
+            table.append(tuple(-PIECE_VALUES[kind] - PIECE_SQUARE_TABLES[kind][square ^ (SQUARES - BOARD_SIZE)]
+                               for square in range(SQUARES)))
+    return tuple(table)
+
+
+SQUARE_SCORES = _square_scores()
+# Piece values by piece type, for MVV-LVA
+KIND_VALUES = tuple(PIECE_VALUES.get(char, 0) for char in PIECE_CHARS[8:])
+
+
+def evaluate(board):
+    """Returns the material and piece-square score of a list board from white's point of view."""
+    return evaluate_position(Position.from_board(board))
+
+
+def evaluate_position(position):
+    """Returns the material and piece-square score of a Position from white's point of view."""
+    squares = position.squares
+    white, black = position.pieces
+    return sum([SQUARE_SCORES[squares[square]][square] for square in white]) + \
+        sum([SQUARE_SCORES[squares[square]][square] for square in black])
+
+
+def score_to_tt(score, ply):
+    """Converts a mate score from distance-to-root to distance-to-node for storing."""
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    """Converts a stored mate score back to distance-to-root at ply."""
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+def score_from_tablebase(value):
+    """Converts a tablebase value to a search score; both count plies to mate."""
+    if value > 0:
+        return MATE_SCORE - value
+    if value < 0:
+        return -MATE_SCORE + distance(value)
+    return 0
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when the budget is used up or the search is stopped."""
+
+
+class SearchResult:
+    """The outcome of a search: best move, its score, depth reached and nodes searched."""
+
+    __slots__ = ('move', 'score', 'depth', 'nodes', 'seconds')
+
+    def __init__(self, move, score, depth, nodes, seconds):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+
+    def __repr__(self):
+        return (f"SearchResult(move={self.move}, score={self.score}, depth={self.depth}, "
+                f"nodes={self.nodes}, seconds={self.seconds:.3f})")
+
+
+class Engine:
+    """Iterative deepening alpha-beta search with a time or node budget.
+
+    History scores and the transposition table are kept between searches, so
+    reusing one Engine for a whole game gives better move ordering than a new
+    one per move. hash_mb sets the size of the transposition table. With
+    tablebases (a tablebase.Tablebases), positions the tables cover are
+    answered from them at once, without searching.
+    """
+
+    def __init__(self, hash_mb=16, tablebases=None):
+        self.tt = TranspositionTable(hash_mb)
+        self.tablebases = tablebases
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.history = {}
+        self.nodes = 0
+        self.deadline = None
+        self.node_limit = None
+        self.root_best = None
+        self.stopped = False
+
+    def stop(self):
+        """Asks a search running on another thread to return its best move so far."""
+        self.stopped = True
+
+    def reset_stop(self):
+        """Clears an earlier stop().
+
+        The search never clears the flag itself: a caller starting a search
+        on another thread calls this before starting the thread, so that a
+        stop() sent right after the start is not lost.
+        """
+        self.stopped = False
+
+    def search(self, board, player, time_limit=None, node_limit=None, max_depth=MAX_DEPTH):
+        """Searches a list board for player and returns a SearchResult.
+
+        time_limit is in seconds and node_limit in nodes; with neither, the
+        search runs to max_depth. The move in the result is a
+        ((row, col), (row, col)) tuple, or None if player has no moves.
+
+        A stop() stays in effect until reset_stop(): an engine reused after
+        stop() returns from every search at once until the flag is cleared.
+        """
+        result = self.search_position(Position.from_board(board, player), time_limit, node_limit, max_depth)
+        if result.move is not None:
+            result.move = move_to_tuple(result.move)
+        return result
+
+    def search_position(self, position, time_limit=None, node_limit=None, max_depth=MAX_DEPTH, info=None):
+        """Searches a Position and returns a SearchResult with an int move.
+
+        The position is left as it was passed in. If info is given, it is
+        called with a SearchResult after every completed iteration. As with
+        search(), an earlier stop() aborts it until reset_stop() is called.
+        """
+        start = time.perf_counter()
+        self.nodes = 0
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.node_limit = node_limit
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.tt.new_search()
+
+        moves = position.legal_moves()
+        if not moves:
+            score = -MATE_SCORE if position.in_check() else 0
+            return SearchResult(None, score, 0, 0, time.perf_counter() - start)
+
+        if self.tablebases is not None:
+            probed = self.tablebases.best_move(position)
+            if probed is not None:
+                move, value = probed
+                score = score_from_tablebase(value)
+                if instrumentation.TRACING:
+                    instrumentation.trace('info', f"search: tablebase score {score}")
+                return SearchResult(move, score, 0, 0, time.perf_counter() - start)
+
+        entry = self.tt.probe(position.key)
+        best_move = self.order_moves(position, moves, 0, entry[3] if entry else None)[0]
+        best_score = 0
+        depth_reached = 0
+        for depth in range(1, max_depth + 1):
+            self.root_best = None
+            try:
+                best_move, best_score = self.search_root(position, moves, depth, best_move)
+            except SearchAborted:
+                # The previous best move is searched first, so any root move
+                # that completed in the unfinished iteration is at least as good
+                if self.root_best is not None:
+                    best_move, best_score = self.root_best
+                break
+            depth_reached = depth
+            if info is not None:
+                info(SearchResult(best_move, best_score, depth, self.nodes, time.perf_counter() - start))
+            if abs(best_score) >= MATE_THRESHOLD or len(moves) == 1:
+                break
+            # An iteration takes several times as long as the one before it,
+            # so there is no point starting one that cannot finish
+            if self.deadline is not None and time.perf_counter() > start + (self.deadline - start) / 2:
+                break
+
+        seconds = time.perf_counter() - start
+        instrumentation.count('searches')
+        instrumentation.count('nodes', self.nodes)
+        instrumentation.record_time('search', seconds)
+        if instrumentation.TRACING:
+            instrumentation.trace('info', f"search: depth {depth_reached} score {best_score} "
+                                          f"nodes {self.nodes} in {seconds:.3f}s")
+        return SearchResult(best_move, best_score, depth_reached, self.nodes, seconds)
+
+    def search_moves(self, position, moves, depth, time_limit=None, node_limit=None):
+        """Searches only the given root moves of position to depth and returns a SearchResult.
+
+        This is one iteration of search_position over part of the root
+        moves, so the root can be split between processes. If the budget runs
+        out or the search is stopped first, the result has depth 0 and the
+        best of the moves that finished, or no move.
+        """
+        start = time.perf_counter()
+        self.nodes = 0
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.node_limit = node_limit
+        self.root_best = None
+        self.tt.new_search()
+        entry = self.tt.probe(position.key)
+        try:
+            move, score = self.search_root(position, moves, depth, entry[3] if entry else None)
+        except SearchAborted:
+            move, score = self.root_best or (None, 0)
+            depth = 0
+        return SearchResult(move, score, depth, self.nodes, time.perf_counter() - start)
+
+    def principal_variation(self, position, max_length=MAX_DEPTH):
+        """Returns the line of best moves from position stored in the transposition table."""
+        line = []
+        seen = set()
+        try:
+            while len(line) < max_length and position.key not in seen:
+                seen.add(position.key)
+                entry = self.tt.probe(position.key)
+                if entry is None or entry[3] not in position.legal_moves():
+                    break
+                line.append(entry[3])
+                position.make_move(entry[3])
+        finally:
+            for _ in line:
+                position.unmake_move()
+        return line
+
+    def search_root(self, position, moves, depth, pv_move):
+        alpha, beta = -INFINITY, INFINITY
+        for move in self.order_moves(position, moves, 0, pv_move):
+            position.make_move(move)
+            try:
+                score = -self.negamax(position, depth - 1, -beta, -alpha, 1)
+            finally:
+                position.unmake_move()
+            if score > alpha:
+                alpha = score
+                self.root_best = (move, score)
+        self.tt.store(position.key, depth, EXACT, score_to_tt(alpha, 0), self.root_best[0])
+        return self.root_best
+
+    def negamax(self, position, depth, alpha, beta, ply):
+        if depth <= 0:
+            return self.quiescence(position, alpha, beta, ply)
+        self.count_node()
+
+        key = position.key
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_depth, bound, tt_score, tt_move = entry
+            if tt_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if bound == EXACT or (bound == LOWER and tt_score >= beta) or (bound == UPPER and tt_score <= alpha):
+                    return tt_score
+
+        # A new list per node: order_moves sorts into a list anyway, and iterating an array('H')
+        # buffer (packed.MoveStack) boxes every move again, which measured slower
+        moves = position.legal_moves()
+        if not moves:
+            # Prefer the quickest mate and the slowest loss
+            return -MATE_SCORE + ply if position.in_check() else 0
+
+        squares = position.squares
+        best_move = None
+        for move in self.order_moves(position, moves, ply, tt_move):
+            quiet = not squares[move % SQUARES]
+            position.make_move(move)
+            try:
+                score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                position.unmake_move()
+            if score >= beta:
+                if quiet:
+                    self.store_killer(move, ply)
+                    self.history[move] = self.history.get(move, 0) + depth * depth
+                self.tt.store(key, depth, LOWER, score_to_tt(beta, ply), move)
+                return beta
+            if score > alpha:
+                alpha = score
+                best_move = move
+        self.tt.store(key, depth, EXACT if best_move is not None else UPPER, score_to_tt(alpha, ply), best_move)
+        return alpha
+
+    def quiescence(self, position, alpha, beta, ply):
+        """Searches captures only until the position is quiet."""
+        self.count_node()
+        stand_pat = evaluate_position(position)
+        if position.side:
+            stand_pat = -stand_pat
+        if stand_pat >= beta:
+            return beta
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        for move in self.order_moves(position, position.legal_moves(captures_only=True), ply, None):
+            position.make_move(move)
+            try:
+                score = -self.quiescence(position, -beta, -alpha, ply + 1)
+            finally:
+                position.unmake_move()
+            if score >= beta:
+                return beta
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def order_moves(self, position, moves, ply, pv_move):
+        """Sorts moves best first: PV move, MVV-LVA captures, killers, history."""
+        killers = self.killers[ply] if ply <= MAX_DEPTH else (None, None)
+        history = self.history
+        squares = position.squares
+
+        def score(move):
+            if move == pv_move:
+                return PV_MOVE_SCORE
+            start, end = divmod(move, SQUARES)
+            target = squares[end]
+            if target:
+                # Most valuable victim first, then least valuable attacker
+                return CAPTURE_SCORE + KIND_VALUES[target & 7] * 16 - KIND_VALUES[squares[start] & 7] // 16
+            if move == killers[0]:
+                return KILLER_SCORE + 1
+            if move == killers[1]:
+                return KILLER_SCORE
+            return history.get(move, 0)
+
+        return sorted(moves, key=score, reverse=True)
+
+    def store_killer(self, move, ply):
+        if ply > MAX_DEPTH:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+    def count_node(self):
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchAborted()
+        if self.nodes % CHECK_INTERVAL == 0 and (
+                self.stopped or self.deadline is not None and time.perf_counter() >= self.deadline):
+            raise SearchAborted()
+
+
+def choose_move(board, player, time_limit=1.0, node_limit=None):
+    """Returns the best move for player found within the budget, or None if there is none."""
+    return Engine().search(board, player, time_limit=time_limit, node_limit=node_limit).move
@@ -0,0 +1,182 @@
+"""Tracing, counters and timing histograms for the rules and the engine.
+
+Tracing goes through the 'chess' logger and is off by default. Call sites
+check the module-level TRACING flag before building a message, so disabled
+tracing costs one attribute lookup and no string formatting:
+
+    if instrumentation.TRACING:
+        instrumentation.trace('debug', "is_valid_move: ...")
+
+Counters and histograms are plain dicts that are always on. snapshot()
+returns them as JSON-ready data, merge() adds a snapshot from another process
+and dump_stats() writes everything to a JSON file, e.g. at the end of a game
+or a batch run.
+
+The rules import this module, so it keeps its own imports light: logging
+and json are only imported once tracing is enabled or stats are written,
+and the 'chess' logger is available as instrumentation.logger on demand.
+"""
+import bisect
+import sys
+
+# logging's level numbers, spelled out so that importing this module does not import logging
+LEVELS = {
+    'error': 40,
+    'warning': 30,
+    'info': 20,
+    'debug': 10,
+}
+DISABLED = 51 # Above logging.CRITICAL
+
+# True while any tracing level is enabled; checked at call sites before tracing
+TRACING = False
+
+COUNTERS = {
+    'is_valid_move': 0,
+    'is_in_check': 0,
+    'get_all_valid_moves': 0,
+    'searches': 0,
+    'nodes': 0,
+}
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+BUCKET_BOUNDS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    """Log-scaled histogram of durations, cheap to record into and to merge."""
+
+    __slots__ = ('counts', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.total += ms
+        self.minimum = ms if self.minimum is None else min(self.minimum, ms)
+        self.maximum = ms if self.maximum is None else max(self.maximum, ms)
+
+    def percentile(self, fraction):
+        """Returns the upper bound of the bucket holding the given fraction of samples."""
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return BUCKET_BOUNDS_MS[index] if index < len(BUCKET_BOUNDS_MS) else self.maximum
+        return None
+
+    def to_dict(self):
+        count = self.count
+        return {
+            'count': count,
+            'mean_ms': self.total / count if count else None,
+            'min_ms': self.minimum,
+            'max_ms': self.maximum,
+            'p50_ms': self.percentile(0.5),
+            'p90_ms': self.percentile(0.9),
+            'p99_ms': self.percentile(0.99),
+            'buckets_ms': list(BUCKET_BOUNDS_MS),
+            'counts': list(self.counts),
+            'total_ms': self.total,
+        }
+
+    def merge(self, data):
+        """Adds the samples of a histogram exported with to_dict."""
+        for index, count in enumerate(data['counts']):
+            self.counts[index] += count
+        self.total += data['total_ms']
+        if data['min_ms'] is not None:
+            self.minimum = data['min_ms'] if self.minimum is None else min(self.minimum, data['min_ms'])
+        if data['max_ms'] is not None:
+            self.maximum = data['max_ms'] if self.maximum is None else max(self.maximum, data['max_ms'])
+
+
+HISTOGRAMS = {}
+
+
+def _logger():
+    import logging
+    return logging.getLogger('chess')
+
+
+def __getattr__(name):
+    if name == 'logger':
+        return _logger()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def set_trace_level(level, stream=None):
+    """Enables tracing at level ('error', 'warning', 'info' or 'debug'), or disables it with None."""
+    global TRACING
+    import logging
+    logger = _logger()
+    if level is None:
+        TRACING = False
+        logger.setLevel(DISABLED)
+        return
+    if level not in LEVELS:
+        raise ValueError(f"Unknown trace level {level!r}, expected one of {sorted(LEVELS)}")
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(LEVELS[level])
+    TRACING = True
+
+
+def trace(level, message):
+    """Logs message at level if tracing is enabled at that level."""
+    if TRACING:
+        _logger().log(LEVELS[level], message)
+
+
+def count(name, amount=1):
+    COUNTERS[name] = COUNTERS.get(name, 0) + amount
+
+
+def record_time(name, seconds):
+    """Records a duration in the histogram called name."""
+    histogram = HISTOGRAMS.get(name)
+    if histogram is None:
+        histogram = HISTOGRAMS[name] = Histogram()
+    histogram.record(seconds)
+
+
+def reset():
+    """Zeroes all counters and empties all histograms."""
+    for name in COUNTERS:
+        COUNTERS[name] = 0
+    HISTOGRAMS.clear()
+
+
+def snapshot():
+    """Returns the counters and histograms as JSON-ready data."""
+    return {
+        'counters': dict(COUNTERS),
+        'histograms': {name: histogram.to_dict() for name, histogram in HISTOGRAMS.items()},
+    }
+
+
+def merge(data):
+    """Adds a snapshot taken in another process, e.g. a self-play worker."""
+    for name, value in data['counters'].items():
+        count(name, value)
+    for name, histogram in data['histograms'].items():
+        HISTOGRAMS.setdefault(name, Histogram()).merge(histogram)
+
+
+def dump_stats(path):
+    """Writes snapshot() to path as JSON."""
+    import json
+    with open(path, 'w') as f:
+        json.dump(snapshot(), f, indent=2, sort_keys=True)
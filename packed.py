@@ -0,0 +1,334 @@
+"""Packed 16-bit moves in reusable move buffers and contiguous game records.
+
+A packed move (position.pack_move) is the int move with the promotion piece
+type in its top four bits, so it fits in an array('H') slot: 2 bytes, where
+a ((row, col), (row, col)) tuple costs three tuple objects. MoveStack keeps
+one array('H') per ply for Position.legal_moves(out=...), so perft refills
+the same buffers instead of building a list at every node. The engine's
+search keeps lists: reading a move back out of an array creates an int
+object, which costs more in CPython than the list it saves.
+
+GameRecords stores games from the start position back to back in a single
+array('H') of packed moves, with an array('Q') of the offsets where each game
+starts and an array('B') of results, so a million games are three buffers
+instead of tens of millions of objects. write() saves the three buffers to a
+file in one go, and MappedGameRecords memory-maps such a file and reads the
+games in place.
+
+Usage:
+    python packed.py pack selfplay.jsonl --output games.rec   # convert selfplay.py output
+    python packed.py bench --games 200 --depth 3              # tuples and lists against packed arrays
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+from position import (
+    QUEEN, Position, move_from_tuple, move_from_uci, move_to_tuple, move_to_uci, pack_move, unpack_move,
+    unpack_tuple,
+)
+from rules import create_board
+
+MAGIC = b'CHGR'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQ') # Magic, version, bytes per move, game count, move count
+
+# Results by their code in GameRecords.results
+RESULTS = ('*', '1-0', '0-1', '1/2-1/2')
+
+
+def pack_game(moves):
+    """Packs a game's moves from the start position, given in coordinate notation.
+
+    The game is replayed to mark pawn moves to the last rank as promotions,
+    since selfplay.py records them without a suffix. Raises ValueError at the
+    first illegal move.
+    """
+    return _pack(move_from_uci(text) for text in moves)
+
+
+def _pack(moves):
+    position = Position.from_board(create_board())
+    packed = array('H')
+    for move, promotion in moves:
+        if move not in position.legal_moves():
+            raise ValueError(f"Illegal move {move_to_uci(move, promotion)} at ply {len(packed) + 1}")
+        if promotion is None and position.is_promotion(move):
+            promotion = QUEEN
+        position.make_move(move, promotion or QUEEN)
+        packed.append(pack_move(move, promotion))
+    return packed
+
+
+class MoveStack:
+    """One reusable array('H') move buffer per ply, grown on demand."""
+
+    def __init__(self):
+        self.buffers = []
+
+    def __getitem__(self, ply):
+        while ply >= len(self.buffers):
+            self.buffers.append(array('H'))
+        return self.buffers[ply]
+
+
+def perft(position, depth, stack=None, ply=0):
+    """Counts the leaf nodes depth plies below position, generating moves into stack's buffers."""
+    if depth == 0:
+        return 1
+    stack = MoveStack() if stack is None else stack
+    moves = position.legal_moves(out=stack[ply])
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1, stack, ply + 1)
+        position.unmake_move()
+    return nodes
+
+
+class GameRecords:
+    """Games as packed moves in one contiguous array, indexed by game offsets."""
+
+    def __init__(self):
+        self.offsets = array('Q', [0]) # Game i is moves[offsets[i]:offsets[i + 1]]
+        self.moves = array('H')
+        self.results = array('B')
+
+    def __len__(self):
+        return len(self.results)
+
+    def append(self, moves, result='*'):
+        """Adds a game given as packed moves (any iterable of ints, ideally an array('H'))."""
+        self.moves.extend(moves)
+        self.offsets.append(len(self.moves))
+        self.results.append(RESULTS.index(result))
+
+    def append_tuples(self, moves, result='*'):
+        """Adds a game given as ((row, col), (row, col)) moves, promoting to queens."""
+        self.append(_pack((move_from_tuple(move), None) for move in moves), result)
+
+    def game(self, index):
+        """Returns the packed moves of a game as an array('H')."""
+        moves = array('H')
+        moves.frombytes(self.moves[self.offsets[index]:self.offsets[index + 1]].tobytes())
+        return moves
+
+    def result(self, index):
+        return RESULTS[self.results[index]]
+
+    def tuples(self, index):
+        """Returns a game's moves as ((row, col), (row, col)) tuples."""
+        return [unpack_tuple(packed) for packed in self.game(index)]
+
+    def uci_moves(self, index):
+        """Returns a game's moves in coordinate notation, with promotion suffixes."""
+        return [move_to_uci(*unpack_move(packed)) for packed in self.game(index)]
+
+    def replay(self, index):
+        """Yields the Position after each move of a game; the same Position object every time."""
+        position = Position.from_board(create_board())
+        for packed in self.game(index):
+            move, promotion = unpack_move(packed)
+            position.make_move(move, promotion or QUEEN)
+            yield position
+
+    def write(self, path):
+        """Writes all games to path in one pass; MappedGameRecords reads the file back."""
+        buffers = [self.offsets, self.moves, self.results]
+        if sys.byteorder != 'little':
+            buffers = [array(buffer.typecode, buffer) for buffer in buffers]
+            for buffer in buffers:
+                buffer.byteswap()
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.moves.itemsize, len(self), len(self.moves)))
+            for buffer in buffers:
+                buffer.tofile(f)
+        os.replace(temporary, path) # A reader never sees a half-written file
+
+
+class MappedGameRecords(GameRecords):
+    """Read-only GameRecords over a memory-mapped file written by GameRecords.write().
+
+    Opening the file reads nothing but the header; the offsets, moves and
+    results are memoryviews into the map.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = self.moves = self.results = None
+        if len(self.map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a game records file")
+        magic, version, move_size, games, moves = HEADER.unpack_from(self.map)
+        moves_at = HEADER.size + 8 * (games + 1)
+        results_at = moves_at + move_size * moves
+        if magic != MAGIC or version != VERSION or move_size != 2 or len(self.map) != results_at + games:
+            self.close()
+            raise ValueError(f"{path} is not a game records file of version {VERSION}")
+
+        view = memoryview(self.map)
+        self.offsets = view[HEADER.size:moves_at].cast('Q')
+        self.moves = view[moves_at:results_at].cast('H')
+        self.results = view[results_at:]
+        view.release()
+        if sys.byteorder != 'little':
+            # Mapped buffers are little-endian; a big-endian host reads copies
+            for name, typecode in (('offsets', 'Q'), ('moves', 'H')):
+                buffer = getattr(self, name)
+                copy = array(typecode, buffer.cast('B').tobytes())
+                copy.byteswap()
+                buffer.release()
+                setattr(self, name, copy)
+
+    def append(self, moves, result='*'):
+        raise TypeError("Mapped game records are read-only")
+
+    def close(self):
+        for buffer in (self.offsets, self.moves, self.results):
+            if isinstance(buffer, memoryview):
+                buffer.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_selfplay(path):
+    """Packs the games of a selfplay.py JSON lines file into GameRecords."""
+    records = GameRecords()
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                game = json.loads(line)
+                records.append(pack_game(game['moves']), game['result'])
+    return records
+
+
+# --- Benchmark ---
+
+def _measure(build):
+    """Runs build() under tracemalloc; returns (result, bytes kept, blocks kept, peak bytes)."""
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    result = build()
+    blocks = sys.getallocatedblocks() - blocks
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, blocks, peak
+
+
+def _list_perft(position, depth):
+    """perft with a new list of moves at every node, as before move buffers."""
+    moves = position.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += _list_perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def _count_move_containers(run):
+    """Runs run() and returns the number of distinct objects Position.legal_moves returned."""
+    returned = {}
+    legal_moves = Position.legal_moves
+
+    def counting(position, *args, **kwargs):
+        moves = legal_moves(position, *args, **kwargs)
+        returned[id(moves)] = moves # Kept alive, so that no later list reuses a freed list's id
+        return moves
+
+    Position.legal_moves = counting
+    try:
+        run()
+    finally:
+        Position.legal_moves = legal_moves
+    return len(returned)
+
+
+def benchmark(games, depth, seed=0):
+    """Compares tuple and list storage with packed arrays; returns rows of (name, measurements)."""
+    from selfplay import play_game
+
+    played = [play_game(seed + index) for index in range(games)]
+    plies = sum(game['plies'] for game in played)
+    scale = 1_000_000 / games
+    rows = []
+
+    def tuple_games():
+        return [[move_to_tuple(move_from_uci(text)[0]) for text in game['moves']] for game in played]
+
+    def packed_games():
+        records = GameRecords()
+        for game in played:
+            records.append(pack_game(game['moves']), game['result'])
+        return records
+
+    for name, build in (('games as tuple lists', tuple_games), ('games as GameRecords', packed_games)):
+        stored, kept, blocks, _ = _measure(build)
+        rows.append((name, {'bytes/game': kept / games, 'blocks/game': blocks / games,
+                            'MB per million games': kept * scale / 1e6}))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.rec')
+        stored.write(path)
+        selfplay_bytes = sum(len(json.dumps(game)) + 1 for game in played)
+        rows.append(('selfplay JSON lines on disk', {'MB per million games': selfplay_bytes * scale / 1e6}))
+        rows.append(('GameRecords file on disk', {'MB per million games': os.path.getsize(path) * scale / 1e6}))
+
+    start = Position.from_board(create_board())
+    for name, run in (('perft with move lists', lambda: _list_perft(start.copy(), depth)),
+                      ('perft with MoveStack', lambda: perft(start.copy(), depth))):
+        nodes, _, _, peak = _measure(run)
+        lists = _count_move_containers(run)
+        seconds = time.perf_counter()
+        run() # Timed again without tracemalloc slowing it down
+        seconds = time.perf_counter() - seconds
+        rows.append((name, {'nodes': nodes, 'move lists allocated': lists, 'peak KB': peak / 1e3,
+                            'ms': seconds * 1000}))
+    return plies / games, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack games into contiguous move arrays.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack = commands.add_parser('pack', help="convert a selfplay.py JSON lines file to a game records file")
+    pack.add_argument('selfplay', help="JSON lines file written by selfplay.py")
+    pack.add_argument('--output', default='games.rec', help="game records file to write")
+    bench = commands.add_parser('bench', help="measure memory and allocations before and after packing")
+    bench.add_argument('--games', type=int, default=200, help="random games to store")
+    bench.add_argument('--depth', type=int, default=3, help="perft depth for the move buffer comparison")
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        records = read_selfplay(args.selfplay)
+        records.write(args.output)
+        print(f"Wrote {len(records)} games, {len(records.moves)} moves to {args.output}")
+        return 0
+
+    average, rows = benchmark(args.games, args.depth)
+    print(f"{args.games} random games, {average:.0f} plies on average")
+    for name, values in rows:
+        print(f"{name:>28}: " + ', '.join(f"{key} {value:,.1f}" if isinstance(value, float) else
+                                          f"{key} {value:,}" for key, value in values.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Perft driver and move generation benchmark.
+
+Counts the leaf nodes of the move tree to a fixed depth. Node counts are the
+standard way to check a move generator for correctness, and nodes per second
+is a direct measure of how fast `get_all_valid_moves` and `is_in_check` are.
+
+The rules here have no castling or en passant, and a pawn reaching the last
+rank is one move that always promotes to a queen, so the reference counts in
+BENCHMARK_POSITIONS only match the published perft numbers where none of
+those come up.
+
+Usage:
+    python perft.py --depth 4
+    python perft.py --fen "<fen>" --depth 3 --divide
+    python perft.py --bench
+    python perft.py --bench --record
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from rules import board_from_fen, board_to_fen, create_board, get_all_valid_moves, make_move, unmake_move
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perft_baseline.json')
+
+# A run slower than this fraction of the recorded nodes per second fails
+DEFAULT_TOLERANCE = 0.75
+
+START_FEN = board_to_fen(create_board(), 'white')
+
+BENCHMARK_POSITIONS = [
+    {
+        'name': 'startpos',
+        'fen': START_FEN,
+        'nodes': {1: 20, 2: 400, 3: 8902, 4: 197281},
+    },
+    {
+        'name': 'kiwipete',
+        'fen': 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w - - 0 1',
+        'nodes': {1: 46, 2: 1865, 3: 86585},
+    },
+    {
+        'name': 'rook-endgame',
+        'fen': '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+        'nodes': {1: 14, 2: 191, 3: 2810, 4: 43087},
+    },
+    {
+        'name': 'promotions',
+        'fen': 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w - - 0 1',
+        'nodes': {1: 6, 2: 222, 3: 7855, 4: 305965},
+    },
+    {
+        'name': 'middlegame',
+        'fen': 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+        'nodes': {1: 46, 2: 2079, 3: 89890},
+    },
+]
+
+
+def perft(board, player, depth):
+    """Returns the number of leaf nodes depth plies below the position."""
+    if depth == 0:
+        return 1
+    moves = get_all_valid_moves(board, player)
+    if depth == 1:
+        return len(moves)
+
+    opponent = 'black' if player == 'white' else 'white'
+    nodes = 0
+    for move in moves:
+        undo = make_move(board, move)
+        nodes += perft(board, opponent, depth - 1)
+        unmake_move(board, move, undo)
+    return nodes
+
+
+def divide(board, player, depth):
+    """Returns (move, nodes) for every legal move, the perft of each subtree."""
+    opponent = 'black' if player == 'white' else 'white'
+    results = []
+    for move in get_all_valid_moves(board, player):
+        undo = make_move(board, move)
+        results.append((move, perft(board, opponent, depth - 1)))
+        unmake_move(board, move, undo)
+    return results
+
+
+def format_move(move):
+    """Formats ((r, c), (r, c)) in coordinate notation, e.g. e2e4."""
+    (r, c), (end_row, end_col) = move
+    return f"{'abcdefgh'[c]}{8 - r}{'abcdefgh'[end_col]}{8 - end_row}"
+
+
+def run_benchmark(max_depth=None, positions=BENCHMARK_POSITIONS):
+    """Runs perft on every benchmark position at its deepest known depth.
+
+    Returns one result dict per position with the expected and actual node
+    counts, elapsed time and nodes per second.
+    """
+    results = []
+    for position in positions:
+        depths = [d for d in position['nodes'] if max_depth is None or d <= max_depth]
+        if not depths:
+            continue
+        depth = max(depths)
+        board, player = board_from_fen(position['fen'])
+        start = time.perf_counter()
+        nodes = perft(board, player, depth)
+        elapsed = time.perf_counter() - start
+        results.append({
+            'name': position['name'],
+            'depth': depth,
+            'expected': position['nodes'][depth],
+            'nodes': nodes,
+            'seconds': elapsed,
+            'nps': nodes / elapsed if elapsed > 0 else float('inf'),
+        })
+    return results
+
+
+def load_baseline(path=BASELINE_FILE):
+    """Returns the recorded nodes per second by position name, or None."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def record_baseline(results, path=BASELINE_FILE):
+    """Writes the nodes per second of a benchmark run as the new baseline."""
+    baseline = {result['name']: {'depth': result['depth'], 'nps': result['nps']} for result in results}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    return baseline
+
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Returns the results that are wrong or slower than the baseline allows."""
+    failures = []
+    for result in results:
+        if result['nodes'] != result['expected']:
+            failures.append(f"{result['name']}: {result['nodes']} nodes at depth {result['depth']}, "
+                            f"expected {result['expected']}")
+            continue
+        recorded = baseline.get(result['name']) if baseline else None
+        if recorded is None or recorded['depth'] != result['depth']:
+            continue
+        if result['nps'] < recorded['nps'] * tolerance:
+            failures.append(f"{result['name']}: {result['nps']:.0f} nps, "
+                            f"below {tolerance:.0%} of recorded {recorded['nps']:.0f} nps")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count perft leaf nodes and benchmark move generation.")
+    parser.add_argument('--fen', default=START_FEN, help="position to search (default: start position)")
+    parser.add_argument('--depth', type=int, default=3, help="search depth in plies")
+    parser.add_argument('--divide', action='store_true', help="print the node count below each move")
+    parser.add_argument('--bench', action='store_true', help="run the benchmark suite")
+    parser.add_argument('--max-depth', type=int, help="limit the benchmark suite to this depth")
+    parser.add_argument('--record', action='store_true', help="record the benchmark run as the new baseline")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline file for --bench")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="fail if slower than this fraction of the baseline")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        results = run_benchmark(args.max_depth)
+        for result in results:
+            print(f"{result['name']:<14} depth {result['depth']}  {result['nodes']:>10} nodes  "
+                  f"{result['seconds']:8.3f}s  {result['nps']:>10.0f} nps")
+        if args.record:
+            record_baseline(results, args.baseline)
+            print(f"Recorded baseline in {args.baseline}")
+            return 0
+        failures = find_regressions(results, load_baseline(args.baseline), args.tolerance)
+        for failure in failures:
+            print(f"FAIL {failure}")
+        return 1 if failures else 0
+
+    board, player = board_from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        results = divide(board, player, args.depth)
+        for move, nodes in sorted(results, key=lambda item: format_move(item[0])):
+            print(f"{format_move(move)}: {nodes}")
+        nodes = sum(count for _, count in results)
+    else:
+        nodes = perft(board, player, args.depth)
+    elapsed = time.perf_counter() - start
+    print(f"Nodes: {nodes}")
+    print(f"Time: {elapsed:.3f}s")
+    print(f"NPS: {nodes / elapsed if elapsed > 0 else 0:.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+"""Streaming FEN and PGN readers with bulk legality validation.
+
+Files are read in fixed-size chunks and parsed by generators, so only the
+current chunk and the current game are held in memory however large the file
+is. SAN moves are resolved against Position.legal_moves, so a game that
+replays here is legal under the same rules as the engine and the GUI.
+
+The rules have no castling or en passant, so games that castle or capture en
+passant are reported as errors at that move rather than silently misread.
+
+Usage:
+    python pgn.py games.pgn
+    python pgn.py games.pgn --workers 4 --errors errors.txt
+    python pgn.py positions.fen --fen
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from position import (
+    BISHOP, BLACK, KING, KNIGHT, PAWN, PROMOTION_ROW, QUEEN, ROOK, SQUARES, WHITE, Position,
+)
+from rules import BOARD_SIZE, board_from_fen, create_board
+
+# Characters read from the file at a time
+CHUNK_SIZE = 1 << 16
+# Games or positions handed to a worker process per task
+BATCH_SIZE = 256
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+SAN_KINDS = {'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+
+_SAN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?[+#]?[!?]*$')
+_HEADER = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$')
+_TOKEN = re.compile(r'\{|;|\(|\)|\$\d+|\d+\.+|[^\s{};()$]+')
+_MOVE_NUMBER = re.compile(r'^\d+\.+')
+
+
+class ParseError(ValueError):
+    """A FEN or game that cannot be read or replayed, and exactly where."""
+
+    def __init__(self, message, line=None, ply=None, san=None):
+        self.message = message
+        self.line = line
+        self.ply = ply
+        self.san = san
+        where = [f"line {line}"] if line is not None else []
+        if ply is not None:
+            where.append(f"ply {ply + 1} ({san})")
+        super().__init__(f"{', '.join(where)}: {message}" if where else message)
+
+
+class Game:
+    """One game as read from a PGN file: tag pairs, SAN moves and result."""
+
+    __slots__ = ('headers', 'moves', 'result', 'line')
+
+    def __init__(self, line):
+        self.headers = {}
+        self.moves = []
+        self.result = None
+        self.line = line
+
+    def start_position(self):
+        """Returns the Position the game starts from, honouring a FEN tag."""
+        fen = self.headers.get('FEN')
+        if fen is None:
+            return Position.from_board(create_board())
+        return parse_fen(fen, self.line)
+
+    def __repr__(self):
+        return f"Game(line={self.line}, moves={len(self.moves)}, result={self.result!r})"
+
+
+# --- Reading ---
+
+def read_lines(source, chunk_size=CHUNK_SIZE):
+    """Yields the lines of a text file, reading chunk_size characters at a time.
+
+    source is a path or an open text file.
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, encoding='utf-8', errors='replace') as f:
+            yield from read_lines(f, chunk_size)
+        return
+    rest = ''
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    if rest:
+        yield rest.rstrip('\r')
+
+
+def read_fens(source, chunk_size=CHUNK_SIZE):
+    """Yields (line_number, fen) for every non-blank line of a FEN file."""
+    for number, line in enumerate(read_lines(source, chunk_size), 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield number, line
+
+
+def read_games(source, chunk_size=CHUNK_SIZE):
+    """Yields a Game for every game in a PGN file, without replaying the moves.
+
+    Comments, variations, NAGs and move numbers are skipped. Malformed
+    movetext is left for replay() to report at the offending move.
+    """
+    game = None
+    in_comment = False
+    depth = 0 # Variation nesting
+    for number, line in enumerate(read_lines(source, chunk_size), 1):
+        if in_comment:
+            end = line.find('}')
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            in_comment = False
+        elif line.startswith('%'):
+            continue
+
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith('[') and depth == 0:
+            header = _HEADER.match(stripped)
+            if header:
+                if game is not None and (game.moves or game.result):
+                    yield game
+                    game = None
+                if game is None:
+                    game = Game(number)
+                game.headers[header.group(1)] = header.group(2).replace('\\"', '"').replace('\\\\', '\\')
+                continue
+
+        position = 0
+        while position < len(line):
+            token = _TOKEN.search(line, position)
+            if token is None:
+                break
+            position = token.end()
+            text = token.group()
+            if text == '{':
+                end = line.find('}', position)
+                if end < 0:
+                    in_comment = True
+                    break
+                position = end + 1
+            elif text == ';':
+                break
+            elif text == '(':
+                depth += 1
+            elif text == ')':
+                depth = max(depth - 1, 0)
+            elif depth or text.startswith('$'):
+                continue
+            else:
+                if game is None:
+                    game = Game(number)
+                text = _MOVE_NUMBER.sub('', text) # e.g. '12.e4'
+                if not text:
+                    continue
+                if text in RESULTS:
+                    game.result = text
+                    yield game
+                    game = None
+                else:
+                    game.moves.append(text)
+    if game is not None:
+        yield game
+
+
+# --- Replaying ---
+
+def validate_position(position):
+    """Returns position if it can arise under these rules, otherwise raises ValueError."""
+    for color, name in ((WHITE, 'white'), (BLACK, 'black')):
+        kings = [square for square in position.pieces[color] if position.squares[square] & 7 == KING]
+        if len(kings) != 1:
+            raise ValueError(f"{name} has {len(kings)} kings")
+    for square in range(BOARD_SIZE):
+        for row_square in (square, SQUARES - BOARD_SIZE + square):
+            if position.squares[row_square] & 7 == PAWN:
+                raise ValueError("pawn on the first or last rank")
+    if position.in_check(position.side ^ 1):
+        raise ValueError("the side not to move is in check")
+    return position
+
+
+def parse_san(position, san):
+    """Returns the int move and promotion piece type for a SAN move in position.
+
+    Raises ValueError saying why if the move is malformed, illegal or
+    ambiguous.
+    """
+    if san.rstrip('+#!?') in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+        raise ValueError("castling is not supported by these rules")
+    match = _SAN.match(san)
+    if match is None:
+        raise ValueError("not a SAN move")
+    letter, file, rank, capture, target, promotion = match.groups()
+    kind = SAN_KINDS[letter] if letter else PAWN
+    end = (BOARD_SIZE - int(target[1])) * BOARD_SIZE + ord(target[0]) - ord('a')
+    squares = position.squares
+
+    candidates = []
+    for move in position.legal_moves():
+        start, move_end = divmod(move, SQUARES)
+        if move_end != end or squares[start] & 7 != kind:
+            continue
+        if file is not None and start % BOARD_SIZE != ord(file) - ord('a'):
+            continue
+        if rank is not None and start // BOARD_SIZE != BOARD_SIZE - int(rank):
+            continue
+        candidates.append(move)
+    if not candidates:
+        if capture and kind == PAWN and not squares[end]:
+            raise ValueError("en passant is not supported by these rules")
+        raise ValueError("illegal move")
+    if len(candidates) > 1:
+        raise ValueError("ambiguous move")
+    if capture and not squares[end]:
+        raise ValueError("capture marked on an empty square")
+
+    if kind == PAWN and end // BOARD_SIZE == PROMOTION_ROW[position.side]:
+        return candidates[0], SAN_KINDS[promotion] if promotion else QUEEN
+    if promotion:
+        raise ValueError("promotion of a piece that is not promoting")
+    return candidates[0], QUEEN
+
+
+def replay(game):
+    """Yields the Position after each move of game, raising ParseError at the first bad move.
+
+    The same Position object is yielded every time; copy() or to_fen() it to
+    keep a ply.
+    """
+    position = game.start_position()
+    for ply, san in enumerate(game.moves):
+        try:
+            move, promotion = parse_san(position, san)
+        except ValueError as e:
+            raise ParseError(str(e), game.line, ply, san) from None
+        position.make_move(move, promotion)
+        yield position
+
+
+def replay_games(source, chunk_size=CHUNK_SIZE):
+    """Yields (game, fens, error) per game: the FEN after every move, or the ParseError."""
+    for game in read_games(source, chunk_size):
+        try:
+            fens = [position.to_fen() for position in replay(game)]
+        except ParseError as e:
+            yield game, None, e
+        else:
+            yield game, fens, None
+
+
+def parse_fen(fen, line=None):
+    """Returns a validated Position for fen, or raises ParseError."""
+    try:
+        return validate_position(Position.from_board(*board_from_fen(fen)))
+    except (ValueError, KeyError) as e:
+        raise ParseError(f"invalid FEN {fen!r}: {e}", line) from None
+
+
+# --- Batch validation ---
+
+def _check_games(games):
+    plies = 0
+    errors = []
+    for game in games:
+        try:
+            for _ in replay(game):
+                plies += 1
+        except ParseError as e:
+            errors.append(str(e))
+    return len(games), plies, errors
+
+
+def _check_fens(fens):
+    errors = []
+    for line, fen in fens:
+        try:
+            parse_fen(fen, line)
+        except ParseError as e:
+            errors.append(str(e))
+    return len(fens), 0, errors
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def validate_file(source, fen=False, workers=None, errors=None, batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE):
+    """Validates every game (or FEN, with fen=True) of source across a process pool.
+
+    The file is streamed in batches and at most a few batches per worker are
+    in flight, so memory stays constant however large the file is. errors,
+    if given, is called with the message of every invalid game or FEN.
+    Returns a dict with the totals and games (or positions) per second.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 4
+    items = read_fens(source, chunk_size) if fen else read_games(source, chunk_size)
+    check = _check_fens if fen else _check_games
+    totals = {'items': 0, 'valid': 0, 'invalid': 0, 'plies': 0}
+    start = time.perf_counter()
+
+    def collect(done):
+        for future in done:
+            count, plies, messages = future.result()
+            totals['items'] += count
+            totals['invalid'] += len(messages)
+            totals['valid'] += count - len(messages)
+            totals['plies'] += plies
+            if errors is not None:
+                for message in messages:
+                    errors(message)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for batch in _batches(items, batch_size):
+            pending.add(executor.submit(check, batch))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    elapsed = time.perf_counter() - start
+    totals['seconds'] = elapsed
+    totals['per_second'] = totals['items'] / elapsed if elapsed > 0 else 0.0
+    totals['workers'] = workers
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate the games of a PGN file or the positions of a FEN file.")
+    parser.add_argument('file', help="PGN file, or FEN file with one position per line with --fen")
+    parser.add_argument('--fen', action='store_true', help="the file holds one FEN per line")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="games or positions per worker task")
+    parser.add_argument('--errors', help="write one line per invalid game or position to this file")
+    args = parser.parse_args(argv)
+
+    out = open(args.errors, 'w') if args.errors else None
+    try:
+        report = (lambda message: out.write(message + '\n')) if out else None
+        totals = validate_file(args.file, fen=args.fen, workers=args.workers, errors=report,
+                               batch_size=args.batch_size)
+    finally:
+        if out:
+            out.close()
+    noun = 'Positions' if args.fen else 'Games'
+    print(f"{noun}: {totals['items']} ({totals['valid']} valid, {totals['invalid']} invalid) "
+          f"on {totals['workers']} workers in {totals['seconds']:.2f}s")
+    if not args.fen:
+        print(f"Plies replayed: {totals['plies']}")
+    print(f"{noun}/sec: {totals['per_second']:.0f}")
+    return 0 if totals['invalid'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
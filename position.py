@@ -0,0 +1,525 @@
+"""Compact board position with make/unmake.
+
+A Position keeps the 64 squares in a bytearray indexed by row * 8 + col (row
+0 is the 8th rank, as in the list board), the set of occupied squares for
+each side, both king squares and the Zobrist key. make_move updates all of
+them incrementally and pushes a single int undo record; unmake_move pops it.
+
+Moves are ints, start * 64 + end, and convert to and from the
+((row, col), (row, col)) tuples used by the rules module with
+move_from_tuple and move_to_tuple, and to and from coordinate notation
+(e2e4, e7e8n) with move_from_uci and move_to_uci. pack_move adds a
+promotion piece type in the top bits, giving a 16-bit move that fits an
+array('H') slot; pack_tuple and unpack_tuple pack tuples directly.
+"""
+from rules import BOARD_SIZE, board_from_fen, board_to_fen
+from zobrist import BLACK_TO_MOVE_KEY, PIECE_KEYS
+
+WHITE, BLACK = 0, 1
+PLAYERS = ('white', 'black')
+
+# Piece codes are the piece type, plus 8 for black pieces
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+COLOR_SHIFT = 3
+PIECE_CHARS = ' PNBRQK  pnbrqk'
+PIECE_CODES = {char: code for code, char in enumerate(PIECE_CHARS) if char != ' '}
+
+SQUARES = BOARD_SIZE * BOARD_SIZE
+
+# Zobrist keys indexed by piece code, matching zobrist.hash_board
+PIECE_KEYS_BY_CODE = tuple(PIECE_KEYS.get(char, (0,) * SQUARES) for char in PIECE_CHARS)
+
+
+def _targets(offsets):
+    table = []
+    for square in range(SQUARES):
+        row, col = divmod(square, BOARD_SIZE)
+        table.append(tuple((row + dr) * BOARD_SIZE + col + dc for dr, dc in offsets
+                           if 0 <= row + dr < BOARD_SIZE and 0 <= col + dc < BOARD_SIZE))
+    return tuple(table)
+
+
+def _rays(directions):
+    table = []
+    for square in range(SQUARES):
+        row, col = divmod(square, BOARD_SIZE)
+        rays = []
+        for dr, dc in directions:
+            ray = []
+            r, c = row + dr, col + dc
+            while 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                ray.append(r * BOARD_SIZE + c)
+                r += dr
+                c += dc
+            rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return tuple(table)
+
+
+KNIGHT_TARGETS = _targets(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_TARGETS = _targets(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+ROOK_RAYS = _rays(((-1, 0), (1, 0), (0, -1), (0, 1)))
+BISHOP_RAYS = _rays(((-1, -1), (-1, 1), (1, -1), (1, 1)))
+QUEEN_RAYS = tuple(ROOK_RAYS[square] + BISHOP_RAYS[square] for square in range(SQUARES))
+SLIDER_RAYS = {BISHOP: BISHOP_RAYS, ROOK: ROOK_RAYS, QUEEN: QUEEN_RAYS}
+# Squares attacked by a pawn of each color standing on a square
+PAWN_ATTACKS = (_targets(((-1, -1), (-1, 1))), _targets(((1, -1), (1, 1))))
+
+PAWN_FORWARD = (-BOARD_SIZE, BOARD_SIZE)
+PAWN_START_ROW = (BOARD_SIZE - 2, 1)
+PROMOTION_ROW = (0, BOARD_SIZE - 1)
+
+
+def move_from_tuple(move):
+    """Converts ((row, col), (row, col)) to an int move."""
+    (r, c), (end_row, end_col) = move
+    return (r * BOARD_SIZE + c) * SQUARES + end_row * BOARD_SIZE + end_col
+
+
+def move_to_tuple(move):
+    """Converts an int move to ((row, col), (row, col))."""
+    start, end = divmod(move, SQUARES)
+    return divmod(start, BOARD_SIZE), divmod(end, BOARD_SIZE)
+
+
+FILES = 'abcdefgh'
+PROMOTION_CHARS = {'q': QUEEN, 'r': ROOK, 'b': BISHOP, 'n': KNIGHT}
+
+
+def _square_name(square):
+    row, col = divmod(square, BOARD_SIZE)
+    return f"{FILES[col]}{BOARD_SIZE - row}"
+
+
+def move_to_uci(move, promotion=None):
+    """Formats an int move in coordinate notation, e.g. e2e4, or e7e8q with a promotion piece type."""
+    start, end = divmod(move, SQUARES)
+    suffix = ' PNBRQ'[promotion].lower() if promotion else ''
+    return _square_name(start) + _square_name(end) + suffix
+
+
+def move_from_uci(text):
+    """Parses coordinate notation into (int move, promotion piece type or None); raises ValueError."""
+    if len(text) not in (4, 5) or text[0] not in FILES or text[2] not in FILES or \
+       text[1] not in '12345678' or text[3] not in '12345678' or \
+       (len(text) == 5 and text[4] not in PROMOTION_CHARS):
+        raise ValueError(f"Malformed move {text!r}, expected e.g. e2e4 or e7e8q")
+    start = (BOARD_SIZE - int(text[1])) * BOARD_SIZE + FILES.index(text[0])
+    end = (BOARD_SIZE - int(text[3])) * BOARD_SIZE + FILES.index(text[2])
+    return start * SQUARES + end, PROMOTION_CHARS[text[4]] if len(text) == 5 else None
+
+
+# A packed move is the int move (end square in bits 0-5, start square in bits
+# 6-11) with the promotion piece type, or 0 for none, in bits 12-15
+MOVE_MASK = 0xFFF
+PROMOTION_SHIFT = 12
+
+
+def pack_move(move, promotion=None):
+    """Packs an int move and an optional promotion piece type into 16 bits."""
+    return move | (promotion or 0) << PROMOTION_SHIFT
+
+
+def unpack_move(packed):
+    """Splits a packed move into (int move, promotion piece type or None)."""
+    return packed & MOVE_MASK, (packed >> PROMOTION_SHIFT) or None
+
+
+def pack_tuple(move, promotion=None):
+    """Packs a ((row, col), (row, col)) move and an optional promotion piece type."""
+    return pack_move(move_from_tuple(move), promotion)
+
+
+def unpack_tuple(packed):
+    """Returns the ((row, col), (row, col)) move of a packed move, without its promotion."""
+    return move_to_tuple(packed & MOVE_MASK)
+
+
+class Position:
+    """Board state with incremental make/unmake, piece sets and king squares."""
+
+    __slots__ = ('squares', 'side', 'pieces', 'kings', 'key', 'history')
+
+    def __init__(self):
+        self.squares = bytearray(SQUARES)
+        self.side = WHITE
+        self.pieces = (set(), set())
+        self.kings = [-1, -1]
+        self.key = 0
+        # Undo records: move | captured << 12 | moved piece << 16 | previous key << 20
+        self.history = []
+
+    @classmethod
+    def from_board(cls, board, player='white'):
+        """Builds a Position from a list board and the player to move."""
+        position = cls()
+        squares = position.squares
+        for r, row in enumerate(board):
+            for c, char in enumerate(row):
+                if char != ' ':
+                    square = r * BOARD_SIZE + c
+                    code = PIECE_CODES[char]
+                    squares[square] = code
+                    color = code >> COLOR_SHIFT
+                    position.pieces[color].add(square)
+                    position.key ^= PIECE_KEYS_BY_CODE[code][square]
+                    if code & 7 == KING:
+                        position.kings[color] = square
+        if player == 'black':
+            position.side = BLACK
+            position.key ^= BLACK_TO_MOVE_KEY
+        return position
+
+    @classmethod
+    def from_squares(cls, squares, side=WHITE):
+        """Builds a Position from 64 piece codes (e.g. the bytes of another Position's squares)."""
+        position = cls()
+        position.squares[:] = squares
+        for square, code in enumerate(squares):
+            if code:
+                color = code >> COLOR_SHIFT
+                position.pieces[color].add(square)
+                position.key ^= PIECE_KEYS_BY_CODE[code][square]
+                if code & 7 == KING:
+                    position.kings[color] = square
+        if side == BLACK:
+            position.side = BLACK
+            position.key ^= BLACK_TO_MOVE_KEY
+        return position
+
+    @classmethod
+    def from_fen(cls, fen):
+        return cls.from_board(*board_from_fen(fen))
+
+    def to_board(self):
+        """Returns the position as a list board."""
+        squares = self.squares
+        return [[PIECE_CHARS[squares[r * BOARD_SIZE + c]] for c in range(BOARD_SIZE)] for r in range(BOARD_SIZE)]
+
+    def to_fen(self):
+        return board_to_fen(self.to_board(), self.player)
+
+    @property
+    def player(self):
+        """The side to move as 'white' or 'black'."""
+        return PLAYERS[self.side]
+
+    def copy(self):
+        """Returns an independent copy, history included, e.g. to hand to a worker."""
+        position = Position.__new__(Position)
+        position.squares = self.squares[:]
+        position.side = self.side
+        position.pieces = (set(self.pieces[WHITE]), set(self.pieces[BLACK]))
+        position.kings = self.kings[:]
+        position.key = self.key
+        position.history = self.history[:]
+        return position
+
+    def __eq__(self, other):
+        return isinstance(other, Position) and self.squares == other.squares and self.side == other.side
+
+    def __repr__(self):
+        return f"Position({self.to_fen()!r})"
+
+    # --- Making moves ---
+
+    def make_move(self, move, promotion=QUEEN):
+        """Plays move, promoting pawns that reach the last rank to promotion (a queen by default)."""
+        squares = self.squares
+        start, end = divmod(move, SQUARES)
+        piece = squares[start]
+        captured = squares[end]
+        color = self.side
+        keys = PIECE_KEYS_BY_CODE
+        self.history.append(move | captured << 12 | piece << 16 | self.key << 20)
+
+        key = self.key ^ keys[piece][start] ^ BLACK_TO_MOVE_KEY
+        if captured:
+            own, other = self.pieces[color], self.pieces[color ^ 1]
+            other.discard(end)
+            key ^= keys[captured][end]
+            if captured & 7 == KING:
+                self.kings[color ^ 1] = -1
+        else:
+            own = self.pieces[color]
+        own.discard(start)
+        own.add(end)
+
+        kind = piece & 7
+        if kind == PAWN and end >> 3 == PROMOTION_ROW[color]:
+            piece = promotion | color << COLOR_SHIFT
+        elif kind == KING:
+            self.kings[color] = end
+        squares[end] = piece
+        squares[start] = EMPTY
+        self.key = key ^ keys[piece][end]
+        self.side = color ^ 1
+
+    def unmake_move(self):
+        """Takes back the last move played with make_move."""
+        record = self.history.pop()
+        start, end = divmod(record & 0xFFF, SQUARES)
+        captured = (record >> 12) & 0xF
+        piece = (record >> 16) & 0xF
+        color = self.side ^ 1
+        squares = self.squares
+
+        squares[start] = piece
+        squares[end] = captured
+        own = self.pieces[color]
+        own.discard(end)
+        own.add(start)
+        if captured:
+            self.pieces[color ^ 1].add(end)
+            if captured & 7 == KING:
+                self.kings[color ^ 1] = end
+        if piece & 7 == KING:
+            self.kings[color] = start
+        self.key = record >> 20
+        self.side = color
+
+    def last_move(self):
+        """Returns (int move, moved piece code, key before the move) for the last move played."""
+        record = self.history[-1]
+        return record & 0xFFF, (record >> 16) & 0xF, record >> 20
+
+    # --- Attacks and move generation ---
+
+    def is_attacked(self, square, by_color):
+        """Checks if any piece of by_color attacks square."""
+        squares = self.squares
+        base = by_color << COLOR_SHIFT
+        pawn, knight, bishop, rook, queen, king = (base | PAWN, base | KNIGHT, base | BISHOP,
+                                                   base | ROOK, base | QUEEN, base | KING)
+        # A pawn of by_color attacks square from where an opposite pawn on square would attack
+        for origin in PAWN_ATTACKS[by_color ^ 1][square]:
+            if squares[origin] == pawn:
+                return True
+        for origin in KNIGHT_TARGETS[square]:
+            if squares[origin] == knight:
+                return True
+        for origin in KING_TARGETS[square]:
+            if squares[origin] == king:
+                return True
+        for ray in ROOK_RAYS[square]:
+            for origin in ray:
+                piece = squares[origin]
+                if piece:
+                    if piece == rook or piece == queen:
+                        return True
+                    break
+        for ray in BISHOP_RAYS[square]:
+            for origin in ray:
+                piece = squares[origin]
+                if piece:
+                    if piece == bishop or piece == queen:
+                        return True
+                    break
+        return False
+
+    def in_check(self, color=None):
+        """Checks if color's king (the side to move by default) is attacked."""
+        if color is None:
+            color = self.side
+        king = self.kings[color]
+        return king >= 0 and self.is_attacked(king, color ^ 1)
+
+    def pseudo_legal_moves(self, moves=None):
+        """Generates the side to move's moves without testing for check.
+
+        The moves are appended to moves if it is given (a list or an array('H'))
+        and to a new list otherwise.
+        """
+        squares = self.squares
+        color = self.side
+        if moves is None:
+            moves = []
+        append = moves.append
+        forward = PAWN_FORWARD[color]
+        start_row = PAWN_START_ROW[color]
+        pawn_attacks = PAWN_ATTACKS[color]
+
+        for start in self.pieces[color]:
+            kind = squares[start] & 7
+            base = start * SQUARES
+            if kind == PAWN:
+                target = start + forward
+                if not 0 <= target < SQUARES:
+                    continue
+                if not squares[target]:
+                    append(base + target)
+                    if start >> 3 == start_row and not squares[target + forward]:
+                        append(base + target + forward)
+                for target in pawn_attacks[start]:
+                    piece = squares[target]
+                    if piece and piece >> COLOR_SHIFT != color:
+                        append(base + target)
+            elif kind == KNIGHT or kind == KING:
+                for target in (KNIGHT_TARGETS if kind == KNIGHT else KING_TARGETS)[start]:
+                    piece = squares[target]
+                    if not piece or piece >> COLOR_SHIFT != color:
+                        append(base + target)
+            else:
+                for ray in SLIDER_RAYS[kind][start]:
+                    for target in ray:
+                        piece = squares[target]
+                        if not piece:
+                            append(base + target)
+                        else:
+                            if piece >> COLOR_SHIFT != color:
+                                append(base + target)
+                            break
+        return moves
+
+    def attack_map(self, by_color, ignore=-1):
+        """Returns a bytearray marking every square attacked by by_color.
+
+        The square ignore is treated as empty, so that a king does not block
+        the rays of the sliders attacking it.
+        """
+        squares = self.squares
+        attacked = bytearray(SQUARES)
+        removed = squares[ignore] if ignore >= 0 else EMPTY
+        if removed:
+            squares[ignore] = EMPTY
+        pawn_attacks = PAWN_ATTACKS[by_color]
+        for start in self.pieces[by_color]:
+            kind = squares[start] & 7
+            if kind == PAWN:
+                for target in pawn_attacks[start]:
+                    attacked[target] = 1
+            elif kind == KNIGHT or kind == KING:
+                for target in (KNIGHT_TARGETS if kind == KNIGHT else KING_TARGETS)[start]:
+                    attacked[target] = 1
+            else:
+                for ray in SLIDER_RAYS[kind][start]:
+                    for target in ray:
+                        attacked[target] = 1
+                        if squares[target]:
+                            break
+        if removed:
+            squares[ignore] = removed
+        return attacked
+
+    def checkers_and_pins(self):
+        """Finds the enemy pieces giving check and the side to move's pinned pieces.
+
+        Returns (checkers, evasions, pins): the checking squares, the squares a
+        non-king move must land on to answer a single check (the checker and
+        any squares between it and the king), and a dict mapping each pinned
+        piece's square to the squares it may still move to along its pin ray.
+        """
+        squares = self.squares
+        color = self.side
+        king = self.kings[color]
+        enemy_base = (color ^ 1) << COLOR_SHIFT
+        checkers = []
+        evasions = ()
+        pins = {}
+
+        for square in PAWN_ATTACKS[color][king]:
+            if squares[square] == enemy_base | PAWN:
+                checkers.append(square)
+                evasions = (square,)
+        for square in KNIGHT_TARGETS[king]:
+            if squares[square] == enemy_base | KNIGHT:
+                checkers.append(square)
+                evasions = (square,)
+        enemy_king = self.kings[color ^ 1]
+        if enemy_king in KING_TARGETS[king]:
+            # Only in positions built by hand, but the rules count it as check
+            checkers.append(enemy_king)
+            evasions = (enemy_king,)
+
+        for index, ray in enumerate(QUEEN_RAYS[king]):
+            slider = enemy_base | (ROOK if index < 4 else BISHOP)
+            pinned = -1
+            for distance, square in enumerate(ray):
+                piece = squares[square]
+                if not piece:
+                    continue
+                if piece >> COLOR_SHIFT == color:
+                    if pinned >= 0:
+                        break # Two of our pieces in the way
+                    pinned = square
+                    continue
+                if piece == slider or piece == enemy_base | QUEEN:
+                    if pinned < 0:
+                        checkers.append(square)
+                        evasions = ray[:distance + 1]
+                    else:
+                        pins[pinned] = ray[:distance + 1]
+                break
+        return checkers, evasions, pins
+
+    def legal_moves(self, captures_only=False, out=None):
+        """Generates the side to move's moves that do not leave its king in check.
+
+        Instead of playing each move and testing for check, legality comes from
+        one pass over the position: the enemy attack map restricts king moves,
+        a single check restricts other moves to capturing or blocking the
+        checker, a double check allows king moves only, and pinned pieces may
+        only move along their pin ray.
+
+        The moves are returned in a new list, or written into out if it is
+        given: an array('H') (or list) that is cleared and refilled in place,
+        so that a search can keep one buffer per ply instead of allocating a
+        list at every node.
+        """
+        if out is not None:
+            del out[:]
+        moves = self.pseudo_legal_moves(out)
+        color = self.side
+        king = self.kings[color]
+        squares = self.squares
+        # Moves are filtered in place, keeping the first kept ones and deleting the tail
+        kept = 0
+        if king < 0:
+            if not captures_only:
+                return moves
+            for move in moves:
+                if squares[move % SQUARES]:
+                    moves[kept] = move
+                    kept += 1
+            del moves[kept:]
+            return moves
+
+        attacked = self.attack_map(color ^ 1, ignore=king)
+        checkers, evasions, pins = self.checkers_and_pins()
+        if not checkers and not pins and not captures_only:
+            # Only king moves can be illegal
+            king_base = king * SQUARES
+            for move in moves:
+                if king_base <= move < king_base + SQUARES and attacked[move - king_base]:
+                    continue
+                moves[kept] = move
+                kept += 1
+            del moves[kept:]
+            return moves
+
+        double_check = len(checkers) > 1
+        for move in moves:
+            start, end = divmod(move, SQUARES)
+            if captures_only and not squares[end]:
+                continue
+            if start == king:
+                if attacked[end]:
+                    continue
+            elif double_check:
+                continue
+            elif checkers and end not in evasions:
+                continue
+            elif start in pins and end not in pins[start]:
+                continue
+            moves[kept] = move
+            kept += 1
+        del moves[kept:]
+        return moves
+
+    def is_capture(self, move):
+        return self.squares[move % SQUARES] != EMPTY
+
+    def is_promotion(self, move):
+        start, end = divmod(move, SQUARES)
+        return self.squares[start] & 7 == PAWN and end // BOARD_SIZE == PROMOTION_ROW[self.side]
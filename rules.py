@@ -0,0 +1,321 @@
+"""Chess rules: board setup, move validation and move generation.
+
+This module is pure Python and has no pygame dependency, so it can be
+imported by tests, batch jobs and worker processes that only need the rules.
+"""
+
+import instrumentation
+from instrumentation import COUNTERS
+
+# --- Constants ---
+BOARD_SIZE = 8
+
+WHITE_PIECES = frozenset('PNBRQK')
+BLACK_PIECES = frozenset('pnbrqk')
+
+# Move generation tables as (row, col) offsets
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+# --- Functions ---
+def create_board():
+    """Creates the initial chess board setup."""
+    return [
+        ['r', 'n', 'b', 'q', 'k', 'b', 'n', 'r'],
+        ['p', 'p', 'p', 'p', 'p', 'p', 'p', 'p'],
+        [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
+        [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
+        [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
+        [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
+        ['P', 'P', 'P', 'P', 'P', 'P', 'P', 'P'],
+        ['R', 'N', 'B', 'Q', 'K', 'B', 'N', 'R']
+    ]
+
+def board_from_fen(fen):
+    """Builds a board and side to move from a FEN string.
+
+    Castling and en passant fields are accepted but ignored, since the rules
+    here support neither.
+    """
+    fields = fen.split()
+    if len(fields) < 2 or fields[1] not in ('w', 'b'):
+        raise ValueError(f"Invalid FEN: {fen!r}")
+    rows = fields[0].split('/')
+    if len(rows) != BOARD_SIZE:
+        raise ValueError(f"Invalid FEN: expected {BOARD_SIZE} ranks in {fen!r}")
+
+    board = []
+    for rank in rows:
+        row = []
+        for char in rank:
+            if char.isdigit():
+                row.extend(' ' * int(char))
+            elif char in WHITE_PIECES or char in BLACK_PIECES:
+                row.append(char)
+            else:
+                raise ValueError(f"Invalid FEN: unknown piece {char!r} in {fen!r}")
+        if len(row) != BOARD_SIZE:
+            raise ValueError(f"Invalid FEN: rank {rank!r} does not have {BOARD_SIZE} squares")
+        board.append(row)
+    return board, 'white' if fields[1] == 'w' else 'black'
+
+def board_to_fen(board, player):
+    """Returns the FEN string for board with player to move."""
+    ranks = []
+    for row in board:
+        rank = ''
+        empty = 0
+        for piece in row:
+            if piece == ' ':
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            rank += piece
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+    return f"{'/'.join(ranks)} {'w' if player == 'white' else 'b'} - - 0 1"
+
+def is_path_clear(board, start_pos, end_pos):
+    start_row, start_col = start_pos
+    end_row, end_col = end_pos
+
+    # Horizontal move
+    if start_row == end_row:
+        step = 1 if end_col > start_col else -1
+        for col in range(start_col + step, end_col, step):
+            if board[start_row][col] != ' ':
+                return False
+        return True
+    # Vertical move
+    elif start_col == end_col:
+        step = 1 if end_row > start_row else -1
+        for row in range(start_row + step, end_row, step):
+            if board[row][start_col] != ' ':
+                return False
+        return True
+    # Diagonal move
+    elif abs(start_row - end_row) == abs(start_col - end_col):
+        row_step = 1 if end_row > start_row else -1
+        col_step = 1 if end_col > start_col else -1
+        r, c = start_row + row_step, start_col + col_step
+        while r != end_row:
+            if board[r][c] != ' ':
+                return False
+            r += row_step
+            c += col_step
+        return True
+    return False # Not a straight or diagonal move
+
+def is_valid_move(board, start_pos, end_pos, current_player, check_for_check=True):
+    """Checks if a move is valid according to chess rules."""
+    COUNTERS['is_valid_move'] += 1
+    start_row, start_col = start_pos
+    end_row, end_col = end_pos
+    piece = board[start_row][start_col]
+    target_piece = board[end_row][end_col]
+
+    # Basic checks
+    if start_pos == end_pos:
+        if instrumentation.TRACING:
+            instrumentation.trace('debug', "is_valid_move: start_pos == end_pos")
+        return False
+    if not (0 <= end_row < BOARD_SIZE and 0 <= end_col < BOARD_SIZE):
+        if instrumentation.TRACING:
+            instrumentation.trace('debug', "is_valid_move: end_pos out of bounds")
+        return False
+
+    # Check if the piece belongs to the current player
+    if (current_player == 'white' and piece.islower()) or \
+       (current_player == 'black' and piece.isupper()):
+        if instrumentation.TRACING:
+            instrumentation.trace('debug', f"is_valid_move: piece {piece} does not belong to current player {current_player}")
+        return False
+
+    # Check if target square contains own piece
+    if (current_player == 'white' and target_piece.isupper()) or \
+       (current_player == 'black' and target_piece.islower()):
+        if instrumentation.TRACING:
+            instrumentation.trace('debug', f"is_valid_move: target square {target_piece} contains own piece for player {current_player}")
+        return False
+
+    # Pawn moves
+    if piece.lower() == 'p':
+        # White pawns (moving up, decreasing row index)
+        if current_player == 'white':
+            # Single square move
+            if end_col == start_col and end_row == start_row - 1 and target_piece == ' ':
+                if instrumentation.TRACING:
+                    instrumentation.trace('debug', "is_valid_move: White pawn single move valid")
+                return True
+            # Two square initial move
+            if start_row == 6 and end_col == start_col and end_row == start_row - 2 and target_piece == ' ' and board[start_row - 1][start_col] == ' ':
+                if instrumentation.TRACING:
+                    instrumentation.trace('debug', "is_valid_move: White pawn two square initial move valid")
+                return True
+            # Capture
+            if abs(end_col - start_col) == 1 and end_row == start_row - 1 and target_piece != ' ' and target_piece.islower():
+                if instrumentation.TRACING:
+                    instrumentation.trace('debug', "is_valid_move: White pawn capture valid")
+                return True
+        # Black pawns (moving down, increasing row index)
+        else:
+            # Single square move
+            if end_col == start_col and end_row == start_row + 1 and target_piece == ' ':
+                if instrumentation.TRACING:
+                    instrumentation.trace('debug', "is_valid_move: Black pawn single move valid")
+                return True
+            # Two square initial move
+            if start_row == 1 and end_col == start_col and end_row == start_row + 2 and target_piece == ' ' and board[start_row + 1][start_col] == ' ':
+                if instrumentation.TRACING:
+                    instrumentation.trace('debug', "is_valid_move: Black pawn two square initial move valid")
+                return True
+            # Capture
+            if abs(end_col - start_col) == 1 and end_row == start_row + 1 and target_piece != ' ' and target_piece.isupper():
+                if instrumentation.TRACING:
+                    instrumentation.trace('debug', "is_valid_move: Black pawn capture valid")
+                return True
+        if instrumentation.TRACING:
+            instrumentation.trace('debug', "is_valid_move: Pawn move invalid by pawn rules")
+        return False # If none of the above pawn moves are valid
+
+    # Rook moves
+    elif piece.lower() == 'r':
+        if (start_row == end_row or start_col == end_col) and is_path_clear(board, start_pos, end_pos):
+            if instrumentation.TRACING:
+                instrumentation.trace('debug', "is_valid_move: Rook move valid")
+            return True
+    # Knight moves
+    elif piece.lower() == 'n':
+        dr = abs(start_row - end_row)
+        dc = abs(start_col - end_col)
+        if (dr == 1 and dc == 2) or (dr == 2 and dc == 1):
+            if instrumentation.TRACING:
+                instrumentation.trace('debug', "is_valid_move: Knight move valid")
+            return True
+    # Bishop moves
+    elif piece.lower() == 'b':
+        if abs(start_row - end_row) == abs(start_col - end_col) and is_path_clear(board, start_pos, end_pos):
+            if instrumentation.TRACING:
+                instrumentation.trace('debug', "is_valid_move: Bishop move valid")
+            return True
+    # Queen moves
+    elif piece.lower() == 'q':
+        if ((start_row == end_row or start_col == end_col) or \
+            (abs(start_row - end_row) == abs(start_col - end_col))) and \
+           is_path_clear(board, start_pos, end_pos):
+            if instrumentation.TRACING:
+                instrumentation.trace('debug', "is_valid_move: Queen move valid")
+            return True
+    # King moves
+    elif piece.lower() == 'k':
+        dr = abs(start_row - end_row)
+        dc = abs(start_col - end_col)
+        if dr <= 1 and dc <= 1:
+            if instrumentation.TRACING:
+                instrumentation.trace('debug', "is_valid_move: King move valid")
+            return True
+
+    if instrumentation.TRACING:
+        instrumentation.trace('debug', "is_valid_move: No specific piece rule matched")
+    return False
+
+def find_king(board, player):
+    king_piece = 'K' if player == 'white' else 'k'
+    for r in range(BOARD_SIZE):
+        for c in range(BOARD_SIZE):
+            if board[r][c] == king_piece:
+                return r, c
+    return None
+
+def is_square_attacked(board, pos, by_player):
+    """Checks if any piece of by_player attacks the square at pos.
+
+    Works outwards from the target square along knight, king and sliding
+    rays instead of asking every enemy piece whether it can reach pos.
+    """
+    row, col = pos
+    if by_player == 'white':
+        pawn, knight, bishop, rook, queen, king = 'P', 'N', 'B', 'R', 'Q', 'K'
+        pawn_row = row + 1 # White pawns attack towards row 0
+    else:
+        pawn, knight, bishop, rook, queen, king = 'p', 'n', 'b', 'r', 'q', 'k'
+        pawn_row = row - 1
+
+    # Pawns
+    if 0 <= pawn_row < BOARD_SIZE:
+        for c in (col - 1, col + 1):
+            if 0 <= c < BOARD_SIZE and board[pawn_row][c] == pawn:
+                return True
+
+    # Knights and king
+    for dr, dc in KNIGHT_OFFSETS:
+        r, c = row + dr, col + dc
+        if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE and board[r][c] == knight:
+            return True
+    for dr, dc in KING_OFFSETS:
+        r, c = row + dr, col + dc
+        if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE and board[r][c] == king:
+            return True
+
+    # Sliding pieces: the first piece met on each ray is the only candidate
+    for directions, slider in ((ROOK_DIRECTIONS, rook), (BISHOP_DIRECTIONS, bishop)):
+        for dr, dc in directions:
+            r, c = row + dr, col + dc
+            while 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                piece = board[r][c]
+                if piece != ' ':
+                    if piece == slider or piece == queen:
+                        return True
+                    break
+                r += dr
+                c += dc
+    return False
+
+def is_in_check(board, player):
+    COUNTERS['is_in_check'] += 1
+    king_pos = find_king(board, player)
+    if king_pos is None:
+        return False # Should not happen in a valid game
+
+    opponent_player = 'black' if player == 'white' else 'white'
+    return is_square_attacked(board, king_pos, opponent_player)
+
+def get_all_valid_moves(board, player):
+    """Returns player's legal moves as ((row, col), (row, col)) tuples.
+
+    Legality is decided by Position.legal_moves from the enemy attack map,
+    the checking pieces and the pinned pieces, without playing each move.
+    """
+    COUNTERS['get_all_valid_moves'] += 1
+    # Imported here because position builds on this module
+    from position import Position, move_to_tuple
+    return [move_to_tuple(move) for move in Position.from_board(board, player).legal_moves()]
+
+def make_move(board, move):
+    """Plays move on board and returns the undo record for unmake_move.
+
+    Pawns reaching the last rank are promoted to queens.
+    """
+    (r, c), (end_row, end_col) = move
+    piece = board[r][c]
+    captured = board[end_row][end_col]
+    if piece == 'P' and end_row == 0:
+        board[end_row][end_col] = 'Q'
+    elif piece == 'p' and end_row == BOARD_SIZE - 1:
+        board[end_row][end_col] = 'q'
+    else:
+        board[end_row][end_col] = piece
+    board[r][c] = ' '
+    return piece, captured
+
+def unmake_move(board, move, undo):
+    """Takes back a move played with make_move."""
+    (r, c), (end_row, end_col) = move
+    piece, captured = undo
+    board[r][c] = piece
+    board[end_row][end_col] = captured
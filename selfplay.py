@@ -0,0 +1,170 @@
+"""Headless engine-vs-engine self-play across a process pool.
+
+Each game is played by play_game from its own seed, so any game can be
+replayed exactly from its record. run_games spreads the games over a
+ProcessPoolExecutor and appends every finished game to a JSON lines file as
+soon as it comes back, so an interrupted run keeps what it has produced.
+
+Usage:
+    python selfplay.py --games 1000 --output games.jsonl
+    python selfplay.py --games 100 --policy search --depth 2 --workers 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import instrumentation
+from engine import Engine
+from perft import format_move
+from position import BLACK, WHITE, Position, move_to_tuple
+from rules import create_board
+
+POLICIES = ('random', 'search')
+
+# Plies after which an unfinished game is scored as a draw
+DEFAULT_MAX_PLIES = 300
+# Search games play this many random plies first, so that seeds give different games
+DEFAULT_OPENING_PLIES = 4
+
+
+def play_game(seed, policy='random', depth=2, max_plies=DEFAULT_MAX_PLIES, opening_plies=DEFAULT_OPENING_PLIES,
+              hash_mb=4):
+    """Plays one game from the start position and returns its record as a dict.
+
+    policy 'random' picks uniformly among the legal moves, as the GUI used to;
+    'search' plays the engine's best move at a fixed depth after opening_plies
+    random moves. The same arguments always give the same game.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy {policy!r}, expected one of {POLICIES}")
+    rng = random.Random(seed)
+    engine = Engine(hash_mb) if policy == 'search' else None
+    position = Position.from_board(create_board(), 'white')
+    seen = {position.key: 1}
+    moves = []
+    start = time.perf_counter()
+
+    result, termination = '1/2-1/2', 'max-plies'
+    while len(moves) < max_plies:
+        legal = position.legal_moves()
+        if not legal:
+            if position.in_check():
+                result, termination = ('0-1' if position.side == WHITE else '1-0'), 'checkmate'
+            else:
+                termination = 'stalemate'
+            break
+        if engine is None or len(moves) < opening_plies:
+            move = rng.choice(legal)
+        else:
+            move = engine.search_position(position, max_depth=depth).move
+        position.make_move(move)
+        moves.append(format_move(move_to_tuple(move)))
+
+        seen[position.key] = seen.get(position.key, 0) + 1
+        if seen[position.key] >= 3:
+            termination = 'repetition'
+            break
+        if len(position.pieces[WHITE]) == 1 and len(position.pieces[BLACK]) == 1:
+            termination = 'insufficient-material'
+            break
+
+    return {
+        'seed': seed,
+        'policy': policy,
+        'depth': depth if policy == 'search' else None,
+        'result': result,
+        'termination': termination,
+        'plies': len(moves),
+        'moves': moves,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def _play_game(args):
+    # Each task reports only its own counters and timings
+    seed, kwargs = args
+    instrumentation.reset()
+    record = play_game(seed, **kwargs)
+    instrumentation.record_time('game', record['seconds'])
+    return record, instrumentation.snapshot()
+
+
+def run_games(games, output, workers=None, seed=0, progress=None, **game_options):
+    """Plays games games over a process pool, appending each record to output.
+
+    Game i is played from seed + i. workers defaults to the number of cores.
+    progress, if given, is called with every finished record. Returns a dict
+    with the totals and games and plies per second. The workers' counters and
+    timings are merged into this process's instrumentation stats.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Enough queued work to keep every worker busy without queueing all games at once
+    max_pending = workers * 4
+    seeds = iter(range(seed, seed + games))
+    totals = {'games': 0, 'plies': 0, 'results': {}}
+    start = time.perf_counter()
+
+    with open(output, 'a') as out, ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for game_seed in seeds:
+            pending.add(executor.submit(_play_game, (game_seed, game_options)))
+            if len(pending) < max_pending:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            _write_records(done, out, totals, progress)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            _write_records(done, out, totals, progress)
+
+    elapsed = time.perf_counter() - start
+    totals['seconds'] = elapsed
+    totals['games_per_second'] = totals['games'] / elapsed if elapsed > 0 else 0.0
+    totals['plies_per_second'] = totals['plies'] / elapsed if elapsed > 0 else 0.0
+    totals['workers'] = workers
+    return totals
+
+
+def _write_records(futures, out, totals, progress):
+    for future in futures:
+        record, stats = future.result()
+        instrumentation.merge(stats)
+        out.write(json.dumps(record) + '\n')
+        totals['games'] += 1
+        totals['plies'] += record['plies']
+        totals['results'][record['result']] = totals['results'].get(record['result'], 0) + 1
+        if progress is not None:
+            progress(record)
+    out.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play engine-vs-engine games across all cores.")
+    parser.add_argument('--games', type=int, default=100, help="number of games to play")
+    parser.add_argument('--output', default='selfplay.jsonl', help="JSON lines file the games are appended to")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first game; game i uses seed + i")
+    parser.add_argument('--policy', choices=POLICIES, default='random', help="how moves are chosen")
+    parser.add_argument('--depth', type=int, default=2, help="search depth for the search policy")
+    parser.add_argument('--max-plies', type=int, default=DEFAULT_MAX_PLIES, help="plies before a game is drawn")
+    parser.add_argument('--opening-plies', type=int, default=DEFAULT_OPENING_PLIES,
+                        help="random plies before the search policy takes over")
+    parser.add_argument('--stats', help="write the counters and timing histograms of the run to this JSON file")
+    args = parser.parse_args(argv)
+
+    totals = run_games(args.games, args.output, workers=args.workers, seed=args.seed, policy=args.policy,
+                       depth=args.depth, max_plies=args.max_plies, opening_plies=args.opening_plies)
+    print(f"Games: {totals['games']} on {totals['workers']} workers in {totals['seconds']:.2f}s")
+    print(f"Results: {', '.join(f'{result} x{count}' for result, count in sorted(totals['results'].items()))}")
+    print(f"Games/sec: {totals['games_per_second']:.2f}")
+    print(f"Plies/sec: {totals['plies_per_second']:.0f}")
+    if args.stats:
+        instrumentation.dump_stats(args.stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,480 @@
+"""Asyncio server hosting many concurrent headless games over JSON lines.
+
+Clients connect over TCP and send one JSON object per line. Each request gets
+one JSON line back carrying the same "id", so a client can keep requests for
+many games in flight on one connection:
+
+    {"id": 1, "op": "new", "color": "white", "depth": 2}
+        -> {"id": 1, "ok": true, "game": 7, "fen": "...", "status": "playing"}
+    {"id": 2, "op": "move", "game": 7, "move": "e2e4"}
+        -> {"id": 2, "ok": true, "game": 7, "reply": "e7e5", "fen": "...", "status": "playing"}
+    {"id": 3, "op": "state", "game": 7}
+    {"id": 4, "op": "close", "game": 7}
+    {"id": 5, "op": "stats"}
+
+A failed request gets {"id": ..., "ok": false, "error": "..."}. Moves are in
+coordinate notation (e7e8n to underpromote) and are checked against
+Position.legal_moves; the computer always promotes to a queen.
+
+A session keeps only its squares as 64 bytes and a few small ints, so a
+server holds many thousands of games in a few megabytes. The computer's
+moves are searched in a ProcessPoolExecutor with at most PENDING_PER_WORKER
+searches per worker submitted at a time; the event loop only awaits their
+futures, so a slow search never holds up other games. Sessions idle for
+longer than the idle timeout are dropped.
+
+Usage:
+    python server.py serve --port 8765 --workers 4
+    python server.py loadtest --port 8765 --games 1000 --concurrency 200
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import Engine
+from instrumentation import Histogram
+from position import BLACK, PLAYERS, QUEEN, WHITE, Position, move_from_uci, move_to_uci
+from rules import create_board
+from tablebase import open_tablebases
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_DEPTH = 2
+MAX_DEPTH = 6
+# Seconds a single computer move may take, whatever the depth asked for
+DEFAULT_MOVE_TIME = 1.0
+DEFAULT_MAX_SESSIONS = 100000
+DEFAULT_IDLE_TIMEOUT = 600.0
+# Plies after which a game is over as a draw
+DEFAULT_MAX_PLIES = 300
+# Searches submitted to the pool at once, per worker; the rest wait their turn
+PENDING_PER_WORKER = 4
+# Transposition table of each worker's engine
+WORKER_HASH_MB = 16
+# Longest request line accepted
+MAX_LINE = 4096
+
+PLAYING = 'playing'
+CHECKMATE = 'checkmate'
+STALEMATE = 'stalemate'
+MAX_PLIES = 'max-plies'
+
+START_SQUARES = bytes(Position.from_board(create_board()).squares)
+
+
+class RequestError(ValueError):
+    """A request the server cannot carry out; its message is sent back to the client."""
+
+
+class Session:
+    """One game: the squares as bytes, the side to move and the human's color."""
+
+    __slots__ = ('squares', 'side', 'human', 'depth', 'plies', 'status', 'touched')
+
+    def __init__(self, human, depth, touched):
+        self.squares = START_SQUARES
+        self.side = WHITE
+        self.human = human
+        self.depth = depth
+        self.plies = 0
+        self.status = PLAYING
+        self.touched = touched
+
+    def position(self):
+        return Position.from_squares(self.squares, self.side)
+
+    def save(self):
+        return self.squares, self.side, self.plies, self.status
+
+    def restore(self, saved):
+        """Goes back to the state returned by save(), e.g. when the computer's reply failed."""
+        self.squares, self.side, self.plies, self.status = saved
+
+    def play(self, position, move, promotion, max_plies):
+        """Plays move on position (this session's position) and stores the result."""
+        position.make_move(move, promotion or QUEEN)
+        self.squares = bytes(position.squares)
+        self.side = position.side
+        self.plies += 1
+        if not position.legal_moves():
+            self.status = CHECKMATE if position.in_check() else STALEMATE
+        elif self.plies >= max_plies:
+            self.status = MAX_PLIES
+
+
+# --- Worker processes ---
+
+_engine = None
+
+
+def _search(squares, side, depth, time_limit):
+    """Returns the computer's int move for a position; runs in a worker process."""
+    global _engine
+    if _engine is None:
+        _engine = Engine(WORKER_HASH_MB, tablebases=open_tablebases())
+    return _engine.search_position(Position.from_squares(squares, side), time_limit, max_depth=depth).move
+
+
+# --- Server ---
+
+class GameServer:
+    """Holds the sessions and answers requests from any number of connections."""
+
+    def __init__(self, workers=None, max_sessions=DEFAULT_MAX_SESSIONS, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 move_time=DEFAULT_MOVE_TIME, max_plies=DEFAULT_MAX_PLIES):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.move_time = move_time
+        self.max_plies = max_plies
+        self.sessions = {}
+        self.game_ids = itertools.count(1)
+        self.latency = {}
+        self.games_started = 0
+        self.searching = 0
+        self.waiting = 0
+        self.executor = None
+        self.search_slots = None
+        self.server = None
+        self.sweeper = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Starts listening; port 0 picks a free port (see .port)."""
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.search_slots = asyncio.Semaphore(self.workers * PENDING_PER_WORKER)
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE)
+        self.sweeper = asyncio.create_task(self.sweep())
+        return self
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.sweeper.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+        # Joining the workers blocks, so it happens on a thread rather than in the event loop
+        await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.executor.shutdown, cancel_futures=True))
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def sweep(self):
+        """Drops sessions nobody has used for idle_timeout seconds."""
+        while True:
+            await asyncio.sleep(self.idle_timeout / 4)
+            cutoff = time.monotonic() - self.idle_timeout
+            for game in [game for game, session in self.sessions.items() if session.touched < cutoff]:
+                del self.sessions[game]
+
+    async def handle_connection(self, reader, writer):
+        pending = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError: # Longer than MAX_LINE
+                    await self.send(writer, {'id': None, 'ok': False,
+                                             'error': f"Request longer than {MAX_LINE} bytes"})
+                    break
+                if not line:
+                    break
+                task = asyncio.create_task(self.respond(line, writer))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            await asyncio.gather(*pending)
+        except ConnectionError:
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+
+    async def respond(self, line, writer):
+        start = time.perf_counter()
+        request_id = None
+        op = 'invalid' # Latency of requests without a known op is recorded under this name
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("A request must be a JSON object")
+            request_id = request.get('id')
+            name = request.get('op')
+            handler = self.HANDLERS.get(name) if isinstance(name, str) else None
+            if handler is None:
+                raise RequestError(f"Unknown op {name!r}, expected one of {sorted(self.HANDLERS)}")
+            op = name
+            response = await handler(self, request)
+            response['ok'] = True
+        except ValueError as error: # RequestError, and lines that are not UTF-8 or not JSON
+            response = {'ok': False, 'error': str(error)}
+        except Exception as error: # A broken worker pool must not leave the client waiting
+            response = {'ok': False, 'error': f"Internal error: {error!r}"}
+        response['id'] = request_id
+        await self.send(writer, response)
+        if op not in self.latency:
+            self.latency[op] = Histogram()
+        self.latency[op].record(time.perf_counter() - start)
+
+    async def send(self, writer, response):
+        try:
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+        except ConnectionError:
+            pass # The client has gone; handle_connection notices at its next read
+
+    def session(self, request):
+        game = request.get('game')
+        if isinstance(game, bool) or not isinstance(game, int):
+            raise RequestError(f"game must be an integer, not {game!r}")
+        session = self.sessions.get(game)
+        if session is None:
+            raise RequestError(f"No game {request.get('game')!r}")
+        session.touched = time.monotonic()
+        return session
+
+    def describe(self, game, session):
+        return {'game': game, 'fen': session.position().to_fen(), 'status': session.status,
+                'turn': PLAYERS[session.side], 'plies': session.plies}
+
+    async def computer_move(self, session):
+        """Searches and plays the computer's move in a worker; returns it in coordinate notation."""
+        self.waiting += 1
+        async with self.search_slots:
+            self.waiting -= 1
+            self.searching += 1
+            try:
+                move = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, _search, session.squares, session.side, session.depth, self.move_time)
+            finally:
+                self.searching -= 1
+        position = session.position()
+        text = move_to_uci(move, QUEEN if position.is_promotion(move) else None)
+        session.play(position, move, QUEEN, self.max_plies)
+        return text
+
+    async def new_game(self, request):
+        color = request.get('color', 'white')
+        if color not in PLAYERS:
+            raise RequestError(f"Unknown color {color!r}, expected 'white' or 'black'")
+        depth = request.get('depth', DEFAULT_DEPTH)
+        if isinstance(depth, bool) or not isinstance(depth, int) or not 1 <= depth <= MAX_DEPTH:
+            raise RequestError(f"depth must be an integer from 1 to {MAX_DEPTH}")
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError("Too many games; try again later")
+        game = next(self.game_ids)
+        session = self.sessions[game] = Session(PLAYERS.index(color), depth, time.monotonic())
+        self.games_started += 1
+        response = {}
+        if session.human == BLACK:
+            try:
+                response['reply'] = await self.computer_move(session)
+            except BaseException: # Also on cancellation: the client never learns of the game
+                del self.sessions[game]
+                self.games_started -= 1
+                raise
+        response.update(self.describe(game, session))
+        return response
+
+    async def move(self, request):
+        session = self.session(request)
+        if session.status != PLAYING:
+            raise RequestError(f"The game is over ({session.status})")
+        if session.side != session.human:
+            raise RequestError("It is not your turn")
+        text = request.get('move')
+        if not isinstance(text, str):
+            raise RequestError("move must be a string such as e2e4")
+        try:
+            move, promotion = move_from_uci(text)
+        except ValueError as error:
+            raise RequestError(str(error)) from error
+        position = session.position()
+        if move not in position.legal_moves():
+            raise RequestError(f"Illegal move {text}")
+        if position.is_promotion(move) != (promotion is not None):
+            raise RequestError(f"{text}: a promotion needs a piece, e.g. {text[:4]}q, and only a promotion")
+        saved = session.save()
+        session.play(position, move, promotion, self.max_plies)
+        response = {}
+        if session.status == PLAYING:
+            try:
+                response['reply'] = await self.computer_move(session)
+            except BaseException: # Take the move back, so the client can simply send it again
+                session.restore(saved)
+                raise
+        response.update(self.describe(request['game'], session))
+        return response
+
+    async def state(self, request):
+        return self.describe(request['game'], self.session(request))
+
+    async def close_game(self, request):
+        self.session(request)
+        del self.sessions[request['game']]
+        return {'game': request['game']}
+
+    async def stats(self, request):
+        return self.snapshot()
+
+    def snapshot(self):
+        """Session counts, search pool usage and latency percentiles per op."""
+        active = sum(1 for session in self.sessions.values() if session.status == PLAYING)
+        return {
+            'active_games': active,
+            'finished_games': len(self.sessions) - active,
+            'games_started': self.games_started,
+            'searching': self.searching,
+            'waiting_for_search': self.waiting,
+            'latency_ms': {op: {key: value for key, value in histogram.to_dict().items()
+                                if key in ('count', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')}
+                           for op, histogram in sorted(self.latency.items())},
+        }
+
+    HANDLERS = {'new': new_game, 'move': move, 'state': state, 'close': close_game, 'stats': stats}
+
+
+# --- Load test ---
+
+class Client:
+    """Sends requests over one connection and matches the responses to them by id."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count(1)
+        self.waiting = {}
+        self.receiver = asyncio.create_task(self.receive())
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def receive(self):
+        while line := await self.reader.readline():
+            response = json.loads(line)
+            future = self.waiting.pop(response.get('id'), None)
+            if future is not None:
+                future.set_result(response)
+        for future in self.waiting.values():
+            future.set_exception(ConnectionError("The server closed the connection"))
+
+    async def request(self, op, **fields):
+        request_id = next(self.ids)
+        future = self.waiting[request_id] = asyncio.get_running_loop().create_future()
+        self.writer.write(json.dumps({'id': request_id, 'op': op, **fields}).encode() + b'\n')
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.receiver.cancel()
+
+
+async def _play_random_game(client, rng, depth, max_plies, latency):
+    """Plays random legal moves as white until the game ends; returns the plies played."""
+    start = time.perf_counter()
+    response = await client.request('new', color='white', depth=depth)
+    latency.record(time.perf_counter() - start)
+    game = response['game']
+    position = Position.from_board(create_board())
+    while response['status'] == PLAYING and len(position.history) < max_plies:
+        move = rng.choice(position.legal_moves())
+        promotion = QUEEN if position.is_promotion(move) else None
+        start = time.perf_counter()
+        response = await client.request('move', game=game, move=move_to_uci(move, promotion))
+        latency.record(time.perf_counter() - start)
+        if not response['ok']:
+            raise RuntimeError(f"Server rejected a legal move: {response['error']}")
+        position.make_move(move)
+        if 'reply' in response:
+            position.make_move(move_from_uci(response['reply'])[0])
+    await client.request('close', game=game)
+    return len(position.history)
+
+
+async def load_test(host=DEFAULT_HOST, port=DEFAULT_PORT, games=100, concurrency=50, connections=10, depth=1,
+                    max_plies=40, seed=0):
+    """Plays games of random moves against the computer, concurrency at a time; returns a report dict."""
+    clients = [await Client.connect(host, port) for _ in range(connections)]
+    latency = Histogram()
+    slots = asyncio.Semaphore(concurrency)
+    plies = 0
+
+    async def one(index):
+        nonlocal plies
+        async with slots:
+            played = await _play_random_game(clients[index % connections], random.Random(seed + index), depth,
+                                             max_plies, latency)
+            plies += played
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(games)))
+    seconds = time.perf_counter() - start
+    stats = await clients[0].request('stats')
+    for client in clients:
+        await client.close()
+    report = {key: value for key, value in latency.to_dict().items()
+              if key in ('count', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')}
+    report.update(games=games, plies=plies, seconds=seconds, requests_per_second=latency.count / seconds,
+                  server=stats)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many headless games over JSON lines, or load-test a server.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help="run the game server")
+    serve.add_argument('--host', default=DEFAULT_HOST)
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--workers', type=int, help="search worker processes (default: one per core)")
+    serve.add_argument('--max-sessions', type=int, default=DEFAULT_MAX_SESSIONS)
+    serve.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                       help="seconds after which an unused game is dropped")
+    serve.add_argument('--move-time', type=float, default=DEFAULT_MOVE_TIME,
+                       help="seconds the computer may spend on a move")
+    test = commands.add_parser('loadtest', help="play many games against a running server")
+    test.add_argument('--host', default=DEFAULT_HOST)
+    test.add_argument('--port', type=int, default=DEFAULT_PORT)
+    test.add_argument('--games', type=int, default=100)
+    test.add_argument('--concurrency', type=int, default=50, help="games in progress at once")
+    test.add_argument('--connections', type=int, default=10)
+    test.add_argument('--depth', type=int, default=1, help="search depth of the computer's moves")
+    test.add_argument('--max-plies', type=int, default=40, help="plies after which a game is abandoned")
+    args = parser.parse_args(argv)
+
+    if args.command == 'loadtest':
+        report = asyncio.run(load_test(args.host, args.port, args.games, args.concurrency, args.connections,
+                                       args.depth, args.max_plies))
+        print(json.dumps(report, indent=2))
+        return 0
+
+    async def serve_games():
+        server = await GameServer(args.workers, args.max_sessions, args.idle_timeout, args.move_time).start(
+            args.host, args.port)
+        print(f"Serving games on {args.host}:{server.port} with {server.workers} search workers")
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve_games())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,523 @@
+"""Distance-to-mate endgame tablebases generated by retrograde analysis.
+
+A table covers one material set, such as 'KQK' or 'KRKP': the white pieces
+(a king first) followed by the black ones. For every legal position with that
+material it stores the result with best play, as a signed byte from the side
+to move's point of view: n > 0 wins by mating in n plies, -n - 1 loses by
+being mated in n plies and 0 is a draw. Under these rules a pawn always
+promotes to a queen and there is no castling or en passant, so the values are
+exact for this game, with no fifty-move rule.
+
+Positions are indexed by the squares of the pieces and the side to move,
+reduced by symmetry: without pawns the board can be rotated and reflected,
+so the white king only ever stands on one of 10 squares; with pawns it can
+only be mirrored left to right, leaving 32. Each table is one compressed
+array of bytes in a file of its own.
+
+Generation works backwards from the mates. A first pass over every position
+counts its moves and looks up the positions reached by captures and
+promotions in the smaller tables; that pass is split across a process pool.
+A second pass starts from the mates and unmoves pieces: a position with a
+move into a lost position is won, and a position all of whose moves lead to
+won positions is lost, one ply further from mate each round.
+
+Usage:
+    python tablebase.py                   # KQK, KRK and KPK
+    python tablebase.py KQKR KBNK --workers 4
+"""
+import argparse
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from position import (
+    BISHOP, BLACK, COLOR_SHIFT, KING, KING_TARGETS, KNIGHT, KNIGHT_TARGETS, PAWN, PAWN_FORWARD, PAWN_START_ROW,
+    PROMOTION_ROW, QUEEN, ROOK, SLIDER_RAYS, SQUARES, WHITE, Position,
+)
+from rules import BOARD_SIZE
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
+DEFAULT_MATERIALS = ('KQK', 'KRK', 'KPK')
+MAX_PIECES = 4
+
+MAGIC = b'CHTB'
+VERSION = 1
+HEADER = struct.Struct('<4sH8sQ') # Magic, version, material, number of entries
+
+DRAW = 0
+INVALID = -128 # Index of no legal, canonical position
+_UNRESOLVED = 127
+_NO_EXTERNAL = -128
+_NOT_A_POSITION = 255
+# Longest distance to mate a table can store
+MAX_PLIES = 125
+
+PIECE_KINDS = {'P': PAWN, 'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+# Order of the pieces within a side, strongest first
+_STRENGTH = 'KQRBNP'
+_MATERIAL = re.compile(r'^K[QRBNP]*K[QRBNP]*$')
+
+# Scans a chunk of this many positions per worker task
+CHUNK_POSITIONS = 1 << 14
+
+
+# --- Values ---
+
+def loss_in(plies):
+    return -plies - 1
+
+
+def distance(value):
+    """Plies to mate of a won or lost value."""
+    return value if value > 0 else -value - 1
+
+
+def successor_value(value):
+    """Converts the value of the position after a move to the value of the move for the mover."""
+    if value > 0:
+        return loss_in(value + 1)
+    if value < 0:
+        return distance(value) + 1
+    return DRAW
+
+
+def _rank(value):
+    # Quick wins first, then draws, then long losses
+    if value > 0:
+        return (2, -value)
+    if value == 0:
+        return (1, 0)
+    return (0, -value)
+
+
+# --- Material and indexing ---
+
+def parse_material(name):
+    """Returns (white piece types, black piece types) for a material name such as 'KRKP'."""
+    if not _MATERIAL.match(name) or len(name) > MAX_PIECES:
+        raise ValueError(f"Unsupported material {name!r}: expected e.g. 'KQK' with at most {MAX_PIECES} pieces")
+    split = name.index('K', 1)
+    return name[:split], name[split:]
+
+
+def _strength(side):
+    return len(side), [len(_STRENGTH) - _STRENGTH.index(letter) for letter in side]
+
+
+def normalize_material(white, black):
+    """Returns (table name, flipped) for the sides' piece letters, with the stronger side as white."""
+    white = 'K' + ''.join(sorted(white.replace('K', ''), key=_STRENGTH.index))
+    black = 'K' + ''.join(sorted(black.replace('K', ''), key=_STRENGTH.index))
+    if _strength(black) > _strength(white):
+        return black + white, True
+    return white + black, False
+
+
+def dependencies(name):
+    """Returns the tables reached from name by one capture or promotion, other than bare kings."""
+    white, black = parse_material(name)
+    found = set()
+    for side, other, flip in ((white, black, False), (black, white, True)):
+        for index, letter in enumerate(side):
+            if letter == 'K':
+                continue
+            captured = side[:index] + side[index + 1:]
+            promoted = side[:index] + 'Q' + side[index + 1:] if letter == 'P' else None
+            for changed in (captured, promoted):
+                if changed is None:
+                    continue
+                table, _ = normalize_material(other, changed) if flip else normalize_material(changed, other)
+                if table != 'KK':
+                    found.add(table)
+    return found
+
+
+def _transform(square, symmetry):
+    row, col = divmod(square, BOARD_SIZE)
+    if symmetry & 1:
+        col = BOARD_SIZE - 1 - col
+    if symmetry & 2:
+        row = BOARD_SIZE - 1 - row
+    if symmetry & 4:
+        row, col = col, row
+    return row * BOARD_SIZE + col
+
+
+SYMMETRIES = tuple(tuple(_transform(square, symmetry) for square in range(SQUARES)) for symmetry in range(8))
+# With pawns on the board only the left-right mirror keeps the game the same
+PAWN_SYMMETRIES = SYMMETRIES[:2]
+
+
+class TableLayout:
+    """Maps the positions of one material set to table indexes and back."""
+
+    def __init__(self, name):
+        self.name = name
+        white, black = parse_material(name)
+        self.pieces = tuple((WHITE, PIECE_KINDS[letter]) for letter in white) + \
+            tuple((BLACK, PIECE_KINDS[letter]) for letter in black)
+        self.codes = tuple(kind | color << COLOR_SHIFT for color, kind in self.pieces)
+        self.symmetries = PAWN_SYMMETRIES if 'P' in name else SYMMETRIES
+        # The squares the white king can stand on once a position is made canonical
+        self.king_squares = sorted({min(symmetry[square] for symmetry in self.symmetries)
+                                    for square in range(SQUARES)})
+        self.king_index = [-1] * SQUARES
+        for index, square in enumerate(self.king_squares):
+            self.king_index[square] = index
+        self.size = len(self.king_squares) * SQUARES ** (len(self.pieces) - 1) * 2
+        # Only the symmetries that take the white king to its smallest image can give the canonical form
+        self.king_symmetries = tuple(
+            tuple(symmetry for symmetry in self.symmetries
+                  if symmetry[square] == min(other[square] for other in self.symmetries))
+            for square in range(SQUARES))
+
+    def canonical(self, squares):
+        """Returns the symmetric image of squares the table stores."""
+        symmetries = self.king_symmetries[squares[0]]
+        if len(symmetries) == 1:
+            symmetry = symmetries[0]
+            return tuple([symmetry[square] for square in squares])
+        return min(tuple([symmetry[square] for square in squares]) for symmetry in symmetries)
+
+    def index(self, squares, side):
+        """Index of a canonical squares tuple with side to move."""
+        index = self.king_index[squares[0]]
+        for square in squares[1:]:
+            index = index * SQUARES + square
+        return index * 2 + side
+
+    def decode(self, index):
+        """Returns (squares, side) for an index."""
+        side = index & 1
+        index >>= 1
+        squares = []
+        for _ in range(len(self.pieces) - 1):
+            index, square = divmod(index, SQUARES)
+            squares.append(square)
+        squares.append(self.king_squares[index])
+        squares.reverse()
+        return tuple(squares), side
+
+    def position(self, squares, side):
+        """Builds a Position with the pieces on squares (its Zobrist key is left at 0)."""
+        position = Position()
+        for code, square in zip(self.codes, squares):
+            position.squares[square] = code
+            position.pieces[code >> COLOR_SHIFT].add(square)
+            if code & 7 == KING:
+                position.kings[code >> COLOR_SHIFT] = square
+        position.side = side
+        return position
+
+
+# --- Probing ---
+
+class Tablebases:
+    """Loads tables from a directory on first use and looks positions up in them."""
+
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.directory = directory
+        self.tables = {}
+
+    def path(self, name):
+        return os.path.join(self.directory, f'{name}.tb')
+
+    def table(self, name):
+        """Returns (layout, values) for a material name, or None if there is no such file."""
+        if name not in self.tables:
+            path = self.path(name)
+            self.tables[name] = load_table(path) if os.path.exists(path) else None
+        return self.tables[name]
+
+    def probe(self, position):
+        """Returns the value of position for the side to move, or None if no table covers it."""
+        squares = position.squares
+        white = [squares[square] & 7 for square in position.pieces[WHITE]]
+        black = [squares[square] & 7 for square in position.pieces[BLACK]]
+        if len(white) + len(black) > MAX_PIECES or KING not in white or KING not in black:
+            return None
+        if len(white) + len(black) == 2:
+            return DRAW
+        letters = ' PNBRQK'
+        name, flipped = normalize_material(''.join(letters[kind] for kind in white),
+                                           ''.join(letters[kind] for kind in black))
+        table = self.table(name)
+        if table is None:
+            return None
+        layout, values = table
+
+        # The pieces' squares in table order; a flipped position is mirrored top to bottom
+        swap, flip = (1 << COLOR_SHIFT, SQUARES - BOARD_SIZE) if flipped else (0, 0)
+        by_code = {}
+        for square in position.pieces[WHITE] | position.pieces[BLACK]:
+            by_code.setdefault(squares[square], []).append(square)
+        placed = [by_code[code ^ swap].pop() ^ flip for code in layout.codes]
+        side = position.side ^ 1 if flipped else position.side
+        return values[layout.index(layout.canonical(placed), side)]
+
+    def best_move(self, position):
+        """Returns (move, value) of the move with the best value, or None if a position is not covered.
+
+        Won positions are won by the fastest mate and lost ones lost by the
+        slowest, so following best_move plays the ending perfectly.
+        """
+        if self.probe(position) is None:
+            return None
+        best = None
+        for move in position.legal_moves():
+            position.make_move(move)
+            value = self.probe(position)
+            position.unmake_move()
+            if value is None:
+                return None
+            value = successor_value(value)
+            if best is None or _rank(value) > _rank(best[1]):
+                best = (move, value)
+        return best
+
+
+def open_tablebases(directory=TABLEBASE_DIR):
+    """Returns Tablebases for directory, or None if there is no such directory."""
+    return Tablebases(directory) if os.path.isdir(directory) else None
+
+
+def load_table(path):
+    """Reads a table file and returns (layout, values array)."""
+    with open(path, 'rb') as f:
+        magic, version, name, size = HEADER.unpack(f.read(HEADER.size))
+        data = zlib.decompress(f.read())
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a tablebase of version {VERSION}")
+    layout = TableLayout(name.rstrip(b'\0').decode('ascii'))
+    values = array('b', data)
+    if len(values) != size or size != layout.size:
+        raise ValueError(f"{path} is truncated")
+    return layout, values
+
+
+def write_table(path, layout, values):
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, layout.name.encode('ascii'), len(values)))
+        f.write(zlib.compress(values.tobytes(), 9))
+    os.replace(temporary, path)
+
+
+# --- Generation ---
+
+_worker_tablebases = {}
+
+
+def _scan(args):
+    """First pass over positions start to stop of a table, run in a worker process.
+
+    For every index returns the number of distinct positions of this table
+    its moves lead to (or _NOT_A_POSITION) and the best value among its
+    moves that leave the table, which also marks mate and stalemate.
+    """
+    name, directory, start, stop = args
+    tablebases = _worker_tablebases.setdefault(directory, Tablebases(directory))
+    layout = TableLayout(name)
+    counts = array('B', bytes(stop - start))
+    external = array('b', [_NO_EXTERNAL]) * (stop - start)
+    for index in range(start, stop):
+        squares, side = layout.decode(index)
+        if len(set(squares)) != len(squares) or layout.canonical(squares) != squares or any(
+                code & 7 == PAWN and squares[piece] // BOARD_SIZE in (0, BOARD_SIZE - 1)
+                for piece, code in enumerate(layout.codes)):
+            counts[index - start] = _NOT_A_POSITION
+            continue
+        position = layout.position(squares, side)
+        if position.in_check(side ^ 1):
+            counts[index - start] = _NOT_A_POSITION
+            continue
+
+        moves = position.legal_moves()
+        if not moves:
+            external[index - start] = loss_in(0) if position.in_check() else DRAW
+            continue
+        successors = set()
+        best = None
+        for move in moves:
+            begin, end = divmod(move, SQUARES)
+            code = position.squares[begin]
+            if position.squares[end] or (code & 7 == PAWN and end // BOARD_SIZE == PROMOTION_ROW[side]):
+                position.make_move(move)
+                value = tablebases.probe(position)
+                position.unmake_move()
+                if value is None:
+                    raise RuntimeError(f"{name} needs a table that has not been generated")
+                value = successor_value(value)
+                if best is None or _rank(value) > _rank(best):
+                    best = value
+            else:
+                moved = list(squares)
+                moved[squares.index(begin)] = end
+                successors.add(layout.index(layout.canonical(moved), side ^ 1))
+        counts[index - start] = len(successors)
+        if best is not None:
+            external[index - start] = best
+    return start, counts.tobytes(), external.tobytes()
+
+
+def _predecessors(layout, squares, side):
+    """Indexes of the positions from which a move that stays in the table leads to squares."""
+    mover = side ^ 1
+    occupied = set(squares)
+    found = set()
+    for piece, code in enumerate(layout.codes):
+        if code >> COLOR_SHIFT != mover:
+            continue
+        square = squares[piece]
+        kind = code & 7
+        if kind == PAWN:
+            back = -PAWN_FORWARD[mover]
+            origin = square + back
+            origins = []
+            if origin not in occupied and 0 < origin // BOARD_SIZE < BOARD_SIZE - 1:
+                origins.append(origin)
+                if (origin + back) // BOARD_SIZE == PAWN_START_ROW[mover] and origin + back not in occupied:
+                    origins.append(origin + back)
+        elif kind == KNIGHT or kind == KING:
+            origins = [origin for origin in (KNIGHT_TARGETS if kind == KNIGHT else KING_TARGETS)[square]
+                       if origin not in occupied]
+        else:
+            origins = []
+            for ray in SLIDER_RAYS[kind][square]:
+                for origin in ray:
+                    if origin in occupied:
+                        break
+                    origins.append(origin)
+        for origin in origins:
+            moved = list(squares)
+            moved[piece] = origin
+            found.add(layout.index(layout.canonical(moved), mover))
+    return found
+
+
+def generate_table(name, directory=TABLEBASE_DIR, workers=None, progress=None):
+    """Generates the table for material name into directory and returns (layout, values).
+
+    The tables it depends on must already be in directory; generate() takes
+    care of that.
+    """
+    layout = TableLayout(name)
+    size = layout.size
+    counts = array('B', bytes(size))
+    external = array('b', bytes(size))
+    chunks = [(name, directory, start, min(start + CHUNK_POSITIONS, size))
+              for start in range(0, size, CHUNK_POSITIONS)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for start, chunk_counts, chunk_external in executor.map(_scan, chunks):
+            counts[start:start + len(chunk_counts)] = array('B', chunk_counts)
+            external[start:start + len(chunk_external)] = array('b', chunk_external)
+    if progress is not None:
+        progress(f"{name}: scanned {size} positions")
+
+    # Second pass: settle positions in order of distance to mate
+    values = array('b', [_UNRESOLVED]) * size
+    longest_win = array('B', bytes(size))
+    rounds = [[] for _ in range(MAX_PLIES + 2)]
+    for index in range(size):
+        count = counts[index]
+        if count == _NOT_A_POSITION:
+            values[index] = INVALID
+            continue
+        value = external[index]
+        if value == _NO_EXTERNAL:
+            continue
+        if value >= 0:
+            counts[index] = count + 1 # A draw or win outside the table: never lost
+            if value > 0:
+                rounds[value].append((index, value))
+        elif count == 0:
+            rounds[distance(value)].append((index, value))
+
+    for plies in range(MAX_PLIES + 1):
+        for index, value in rounds[plies]:
+            if values[index] != _UNRESOLVED:
+                continue
+            values[index] = value
+            for predecessor in _predecessors(layout, *layout.decode(index)):
+                if values[predecessor] != _UNRESOLVED:
+                    continue
+                if value < 0:
+                    rounds[plies + 1].append((predecessor, plies + 1))
+                    continue
+                counts[predecessor] -= 1
+                if plies > longest_win[predecessor]:
+                    longest_win[predecessor] = plies
+                if counts[predecessor] == 0:
+                    lost_in = longest_win[predecessor] + 1
+                    if external[predecessor] != _NO_EXTERNAL:
+                        lost_in = max(lost_in, distance(external[predecessor]))
+                    if lost_in > MAX_PLIES:
+                        raise OverflowError(f"{name} has a mate longer than {MAX_PLIES} plies")
+                    rounds[lost_in].append((predecessor, loss_in(lost_in)))
+        rounds[plies] = None
+    if any(rounds[MAX_PLIES + 1]):
+        raise OverflowError(f"{name} has a mate longer than {MAX_PLIES} plies")
+
+    for index in range(size):
+        if values[index] == _UNRESOLVED:
+            values[index] = DRAW
+    os.makedirs(directory, exist_ok=True)
+    write_table(os.path.join(directory, f'{name}.tb'), layout, values)
+    return layout, values
+
+
+def generate(names, directory=TABLEBASE_DIR, workers=None, force=False, progress=None):
+    """Generates the tables for names and every table they depend on, smallest first.
+
+    Tables already in directory are kept unless force is set. Returns the
+    names of the tables generated.
+    """
+    order = []
+
+    def visit(name):
+        if name in order:
+            return
+        for dependency in sorted(dependencies(name)):
+            visit(dependency)
+        order.append(name)
+
+    for name in names:
+        white, black = parse_material(name)
+        table, _ = normalize_material(white, black)
+        visit(table)
+
+    generated = []
+    for name in order:
+        path = os.path.join(directory, f'{name}.tb')
+        if os.path.exists(path) and not (force and name in names):
+            continue
+        start = time.perf_counter()
+        generate_table(name, directory, workers, progress)
+        generated.append(name)
+        if progress is not None:
+            progress(f"{name}: done in {time.perf_counter() - start:.1f}s, {os.path.getsize(path)} bytes")
+    return generated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases by retrograde analysis.")
+    parser.add_argument('materials', nargs='*', default=list(DEFAULT_MATERIALS),
+                        help="material sets such as KQK or KRKP (default: %(default)s)")
+    parser.add_argument('--directory', default=TABLEBASE_DIR, help="where the table files are written")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    parser.add_argument('--force', action='store_true', help="regenerate tables that already exist")
+    args = parser.parse_args(argv)
+
+    for name in args.materials:
+        parse_material(name)
+    generate(args.materials, args.directory, args.workers, args.force, progress=print)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
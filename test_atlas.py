@@ -0,0 +1,56 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+@unittest.skipUnless(importlib.util.find_spec('pygame'), "pygame is not installed")
+class TestSpriteAtlas(unittest.TestCase):
+
+    def setUp(self):
+        import atlas
+        self.atlas = atlas
+        self.cache = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache.cleanup()
+
+    def test_sub_rects_match_scaled_images(self):
+        sprites = self.atlas.SpriteAtlas(40, cache_dir=self.cache.name)
+        self.assertEqual(sprites.surface.get_size(), (40 * 12, 40))
+        for piece in 'Kq':
+            image = self.atlas.pygame.transform.scale(
+                self.atlas.pygame.image.load(self.atlas.image_path(piece)), (40, 40))
+            rect = sprites.rects[piece]
+            for x, y in ((20, 20), (5, 30), (0, 0)):
+                self.assertEqual(sprites.surface.get_at((rect.x + x, rect.y + y)), image.get_at((x, y)))
+
+    def test_cache_is_keyed_by_size_and_mtime(self):
+        sprites = self.atlas.SpriteAtlas(30, cache_dir=self.cache.name)
+        sprites.surface
+        path = sprites.cache_path()
+        self.assertEqual(os.listdir(self.cache.name), [os.path.basename(path)])
+
+        cached = self.atlas.SpriteAtlas(30, cache_dir=self.cache.name)
+        cached.build = None # Loading from the cache must not rebuild
+        self.assertEqual(self.atlas.pygame.image.tobytes(cached.surface, 'RGBA'),
+                         self.atlas.pygame.image.tobytes(sprites.surface, 'RGBA'))
+        self.assertNotEqual(self.atlas.SpriteAtlas(31, cache_dir=self.cache.name).cache_path(), path)
+
+        with tempfile.TemporaryDirectory() as images:
+            for piece in self.atlas.PIECES:
+                with open(self.atlas.image_path(piece), 'rb') as source, \
+                     open(self.atlas.image_path(piece, images), 'wb') as copy:
+                    copy.write(source.read())
+            touched = self.atlas.SpriteAtlas(30, images, self.cache.name)
+            self.assertNotEqual(touched.cache_path(), path)
+            touched.surface
+            self.assertEqual(os.listdir(self.cache.name), [os.path.basename(touched.cache_path())])
+
+    def test_atlas_is_loaded_lazily_once_per_size(self):
+        sprites = self.atlas.get_atlas(24, cache_dir=self.cache.name)
+        self.assertIs(self.atlas.get_atlas(24, cache_dir=self.cache.name), sprites)
+        self.assertIsNone(sprites._surface)
+        self.assertEqual(os.listdir(self.cache.name), [])
+
+if __name__ == '__main__':
+    unittest.main()
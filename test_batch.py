@@ -0,0 +1,62 @@
+import importlib.util
+import unittest
+
+from engine import evaluate_position
+from position import Position
+from rules import create_board, is_in_check
+
+if importlib.util.find_spec('numpy'):
+    import numpy as np
+    import batch
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), "numpy is not installed")
+class TestBatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.positions = batch.random_positions(400, seed=7) + [
+            Position.from_fen('4k3/8/8/8/8/8/8/4K2R b - - 0 1'),
+            Position.from_fen('8/8/8/8/8/8/8/R3K3 w - - 0 1'), # No black king
+            Position.from_fen('k7/8/8/8/8/8/1p6/K7 w - - 0 1'), # Pawn check on the edge
+            Position.from_fen('7k/6P1/8/8/8/8/8/K7 b - - 0 1'),
+        ]
+        cls.codes, cls.sides = batch.pack(cls.positions)
+
+    def test_pack(self):
+        self.assertEqual(self.codes.shape, (len(self.positions), 64))
+        self.assertEqual(self.codes.dtype, np.int8)
+        planes = batch.to_planes(self.codes)
+        self.assertEqual(planes.shape, (len(self.positions), 12, 8, 8))
+        self.assertEqual(planes.dtype, np.int8)
+        for index, position in enumerate(self.positions):
+            self.assertEqual(int(planes[index].sum()), len(position.pieces[0]) + len(position.pieces[1]))
+        codes, sides = batch.pack_boards([create_board()], ['black'])
+        self.assertEqual(codes.tolist(), [list(Position.from_board(create_board()).squares)])
+        self.assertEqual(sides.tolist(), [1])
+
+    def test_matches_scalar_functions(self):
+        scores = batch.evaluate_batch(self.codes)
+        attacks = batch.attack_maps(self.codes)
+        checks = batch.in_check(self.codes, self.sides)
+        for index, position in enumerate(self.positions):
+            self.assertEqual(scores[index], evaluate_position(position))
+            self.assertEqual(attacks[index, 0].tolist(), [bool(square) for square in position.attack_map(0)])
+            self.assertEqual(attacks[index, 1].tolist(), [bool(square) for square in position.attack_map(1)])
+            self.assertEqual(checks[index], position.in_check())
+            if position.kings[0] >= 0 and position.kings[1] >= 0:
+                self.assertEqual(checks[index], is_in_check(position.to_board(), position.player))
+        self.assertEqual(checks[-4:].tolist(), [False, False, True, True])
+
+    def test_chunks(self):
+        chunk_rows = batch.CHUNK_ROWS
+        batch.CHUNK_ROWS = 7
+        try:
+            self.assertEqual(batch.in_check(self.codes, self.sides).tolist(),
+                             [position.in_check() for position in self.positions])
+            self.assertEqual(batch.evaluate_batch(self.codes).tolist(),
+                             [evaluate_position(position) for position in self.positions])
+        finally:
+            batch.CHUNK_ROWS = chunk_rows
+
+if __name__ == '__main__':
+    unittest.main()
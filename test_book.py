@@ -0,0 +1,93 @@
+import os
+import random
+import tempfile
+import tracemalloc
+import unittest
+
+from book import HEADER, RECORD, OpeningBook, build_book, count_book_moves, open_book, write_book
+from pgn import read_games
+from position import Position, move_from_tuple
+from rules import create_board
+
+GAMES = """[Event "1"]
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Event "2"]
+1. e4 c5 2. Nf3 d6 0-1
+
+[Event "3"]
+1. d4 d5 2. c4 e6 1/2-1/2
+
+[Event "4"]
+1. e4 e5 2. Nf3 Nf6 *
+"""
+
+class TestOpeningBook(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pgn = os.path.join(self.tmp.name, 'games.pgn')
+        with open(self.pgn, 'w') as f:
+            f.write(GAMES)
+        self.path = os.path.join(self.tmp.name, 'book.bin')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_build_and_probe(self):
+        records = build_book([self.pgn], self.path, max_plies=3)
+        self.assertEqual(os.path.getsize(self.path), HEADER.size + records * RECORD.size)
+        start = Position.from_board(create_board())
+        e4 = move_from_tuple(((6, 4), (4, 4)))
+        d4 = move_from_tuple(((6, 3), (4, 3)))
+        with OpeningBook(self.path) as book:
+            self.assertEqual(len(book), records)
+            self.assertEqual(book.entries(start.key), sorted([(e4, 3), (d4, 1)]))
+            start.make_move(e4)
+            self.assertEqual(len(book.entries(start.key)), 2) # e5 and c5
+            start.make_move(move_from_tuple(((1, 4), (3, 4))))
+            self.assertEqual(len(book.entries(start.key)), 1) # Nf3, ply 3
+            start.make_move(move_from_tuple(((7, 6), (5, 5))))
+            self.assertEqual(book.entries(start.key), []) # Beyond max_plies
+            self.assertEqual(book.entries(0), [])
+            self.assertEqual(book.entries(2 ** 64 - 1), [])
+
+    def test_choose_is_weighted_and_legal(self):
+        build_book([self.pgn], self.path)
+        with OpeningBook(self.path) as book:
+            rng = random.Random(3)
+            moves = [book.choose_move(create_board(), 'white', rng) for _ in range(200)]
+            self.assertEqual(set(moves), {((6, 4), (4, 4)), ((6, 3), (4, 3))})
+            self.assertGreater(moves.count(((6, 4), (4, 4))), moves.count(((6, 3), (4, 3))))
+            self.assertIsNone(book.choose_move(create_board(), 'black')) # Out of book
+
+    def test_illegal_book_move_is_ignored(self):
+        start = Position.from_board(create_board())
+        write_book({(start.key, move_from_tuple(((6, 4), (3, 4)))): 5}, self.path) # e2e5
+        with OpeningBook(self.path) as book:
+            self.assertEqual(len(book.entries(start.key)), 1)
+            self.assertIsNone(book.choose(start))
+
+    def test_min_count_and_missing_book(self):
+        counts = count_book_moves(read_games(self.pgn))
+        self.assertEqual(write_book(counts, self.path, min_count=2), 3) # e4, e5 and Nf3
+        self.assertIsNone(open_book(os.path.join(self.tmp.name, 'missing.bin')))
+        with open(self.path, 'wb') as f:
+            f.write(b'not a book at all')
+        with self.assertRaises(ValueError):
+            OpeningBook(self.path)
+
+    def test_lookup_allocates_nothing_per_entry(self):
+        start = Position.from_board(create_board())
+        write_book({(key, 1): 1 for key in range(0, 2 ** 63, 2 ** 63 // 200000)} | {(start.key, 796): 1}, self.path)
+        tracemalloc.start()
+        try:
+            with OpeningBook(self.path) as book:
+                self.assertEqual(book.entries(start.key), [(796, 1)])
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 64 * 1024)
+
+if __name__ == '__main__':
+    unittest.main()
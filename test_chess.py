@@ -1,5 +1,14 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
-from chess import is_valid_move, is_in_check, find_king, get_all_valid_moves, create_board
+from unittest.mock import patch
+from engine import Engine
+from rules import is_valid_move, is_in_check, find_king, get_all_valid_moves, create_board
 
 class TestChess(unittest.TestCase):
 
@@ -105,8 +114,175 @@ class TestChess(unittest.TestCase):
         self.assertIn(((1, 0), (2, 0)), valid_moves)
         self.assertIn(((1, 0), (3, 0)), valid_moves)
 
+    def test_get_all_valid_moves_matches_is_valid_move(self):
+        board = board_from_rows([
+            'r.bqk..r',
+            'pp..bppp',
+            '..np.n..',
+            '..p.p..Q',
+            '..B.P...',
+            '..NP.N..',
+            'PPP..PPP',
+            'R.B.K..R',
+        ])
+        for player in ('white', 'black'):
+            expected = []
+            for r in range(8):
+                for c in range(8):
+                    for end_row in range(8):
+                        for end_col in range(8):
+                            if is_valid_move(board, (r, c), (end_row, end_col), player):
+                                trial = list(map(list, board))
+                                trial[end_row][end_col] = trial[r][c]
+                                trial[r][c] = ' '
+                                if not is_in_check(trial, player):
+                                    expected.append(((r, c), (end_row, end_col)))
+            self.assertEqual(sorted(get_all_valid_moves(board, player)), sorted(expected))
+
+    def test_get_all_valid_moves_pinned_piece(self):
+        board = create_empty_board()
+        board[7][4] = 'K'
+        board[5][4] = 'R' # Pinned against the king
+        board[0][4] = 'r'
+        board[0][0] = 'k'
+        moves = get_all_valid_moves(board, 'white')
+        self.assertIn(((5, 4), (0, 4)), moves)
+        self.assertNotIn(((5, 4), (5, 0)), moves)
+
+    def test_get_all_valid_moves_in_check(self):
+        board = create_empty_board()
+        board[7][4] = 'K'
+        board[0][4] = 'r'
+        board[6][0] = 'R'
+        board[0][0] = 'k'
+        moves = get_all_valid_moves(board, 'white')
+        self.assertIn(((6, 0), (6, 4)), moves) # Block
+        self.assertNotIn(((6, 0), (5, 0)), moves)
+        self.assertNotIn(((7, 4), (6, 4)), moves) # Still on the rook's file
+
+class TestRulesImport(unittest.TestCase):
+
+    # Runs in a fresh interpreter so nothing imported by the test run counts
+    MEASURE_IMPORT = """
+import json, resource, sys, time
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+import rules
+seconds = time.perf_counter() - start
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': seconds, 'rss_kb': rss_after - rss_before,
+                  'modules': [name for name in ('pygame', 'logging') if name in sys.modules]}))
+"""
+
+    def test_rules_import_is_headless_and_small(self):
+        output = subprocess.run([sys.executable, '-c', self.MEASURE_IMPORT], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        stats = json.loads(output)
+        self.assertEqual(stats['modules'], [])
+        # Loose bounds, far above the 7 ms and 1 MB an idle machine measures, so only a heavy import fails
+        self.assertLess(stats['seconds'], 0.5)
+        self.assertLess(stats['rss_kb'], 16384)
+
+@unittest.skipUnless(importlib.util.find_spec('pygame'), "pygame is not installed")
+class TestBoardRenderer(unittest.TestCase):
+
+    def setUp(self):
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        import chess
+        self.chess = chess
+        chess.pygame.display.init()
+        chess.screen = chess.pygame.display.set_mode((chess.WIDTH, chess.HEIGHT))
+        self.cache = tempfile.TemporaryDirectory()
+        self.cache_dir = patch('atlas.CACHE_DIR', self.cache.name)
+        self.cache_dir.start()
+        chess.sprites = chess.get_atlas(chess.SQUARE_SIZE)
+        self.size = (chess.SQUARE_SIZE, chess.WIDTH, chess.HEIGHT)
+
+    def tearDown(self):
+        self.chess.SQUARE_SIZE, self.chess.WIDTH, self.chess.HEIGHT = self.size
+        self.chess.pygame.display.quit()
+        self.cache_dir.stop()
+        self.cache.cleanup()
+
+    def test_redraws_only_changed_squares(self):
+        renderer = self.chess.BoardRenderer(self.chess.screen)
+        board = create_board()
+        self.assertEqual(len(renderer.draw(board)), 64) # First frame
+        self.assertEqual(renderer.draw(board), []) # Idle frame
+
+        board[4][4], board[6][4] = 'P', ' '
+        self.assertEqual(len(renderer.draw(board)), 2)
+
+        self.assertEqual(len(renderer.draw(board, (7, 6))), 1) # Selection
+        self.assertEqual(len(renderer.draw(board, (7, 1))), 2) # Old and new selection
+
+        renderer.invalidate()
+        self.assertEqual(len(renderer.draw(board, (7, 1))), 64)
+
+        renderer.invalidate_rect(self.chess.pygame.Rect(70, 10, 60, 20)) # Covers parts of b8 and c8
+        self.assertEqual(len(renderer.draw(board, (7, 1))), 2)
+
+    def test_resize_rebuilds_board_and_sprites(self):
+        renderer = self.chess.BoardRenderer(self.chess.screen)
+        board = create_board()
+        renderer.draw(board)
+        self.assertFalse(self.chess.resize_display(self.chess.WIDTH + 5, self.chess.HEIGHT))
+
+        self.assertTrue(self.chess.resize_display(800, 700))
+        self.assertEqual(self.chess.SQUARE_SIZE, 87)
+        self.assertEqual(self.chess.screen.get_size(), (696, 696))
+        self.assertEqual(self.chess.sprites.square_size, 87)
+        renderer.resize(self.chess.screen)
+        self.assertEqual(renderer.background.get_size(), (696, 696))
+        dirty = renderer.draw(board)
+        self.assertEqual(len(dirty), 64)
+        self.assertEqual(dirty[-1], self.chess.pygame.Rect(609, 609, 87, 87))
+
+        self.chess.resize_display(10, 10)
+        self.assertEqual(self.chess.SQUARE_SIZE, self.chess.MIN_SQUARE_SIZE)
+
+    def test_timed_overlay(self):
+        self.chess.pygame.font.init()
+        renderer = self.chess.BoardRenderer(self.chess.screen)
+        board = create_board()
+        overlay = self.chess.Overlay(30, (255, 0, 0), center=(100, 100))
+        renderer.draw(board)
+
+        overlay.show("Check", seconds=0.05)
+        overlay.update(renderer)
+        self.assertEqual(overlay.draw(self.chess.screen, renderer.draw(board)), [overlay.rect])
+        overlay.update(renderer)
+        self.assertEqual(overlay.draw(self.chess.screen, renderer.draw(board)), []) # Unchanged
+
+        time.sleep(0.06)
+        overlay.update(renderer) # Expired: the squares under it are repainted
+        self.assertFalse(overlay.active)
+        self.assertTrue(renderer.draw(board))
+        self.assertEqual(overlay.draw(self.chess.screen, []), [])
+
+    def test_computer_player_runs_in_background(self):
+        computer = self.chess.ComputerPlayer(Engine())
+        board = create_board()
+        computer.start(board, 'black', 0.2)
+        self.assertTrue(computer.thinking)
+        self.assertIsNone(computer.poll())
+        computer.thread.join()
+        result = computer.poll()
+        self.assertIn(result.move, get_all_valid_moves(board, 'black'))
+        self.assertFalse(computer.thinking)
+
+        computer.start(board, 'black', 30)
+        start = time.perf_counter()
+        computer.cancel()
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertFalse(computer.thinking)
+        self.assertIsNone(computer.poll())
+
 def create_empty_board():
     return [[' '] * 8 for _ in range(8)]
 
+def board_from_rows(rows):
+    return [[' ' if square == '.' else square for square in row] for row in rows]
+
 if __name__ == '__main__':
     unittest.main()
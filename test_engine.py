@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+
+from engine import CHECK_INTERVAL, MATE_THRESHOLD, Engine, choose_move, evaluate
+from position import Position
+from rules import board_from_fen, create_board
+
+class TestEngine(unittest.TestCase):
+
+    def test_evaluate_start_position_is_balanced(self):
+        self.assertEqual(evaluate(create_board()), 0)
+
+    def test_finds_mate_in_one(self):
+        board, player = board_from_fen('6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1')
+        result = Engine().search(board, player, time_limit=5)
+        self.assertEqual(result.move, ((7, 0), (0, 0)))
+        self.assertGreaterEqual(result.score, MATE_THRESHOLD)
+
+    def test_captures_hanging_queen(self):
+        board, player = board_from_fen('4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1')
+        self.assertEqual(choose_move(board, player, time_limit=None, node_limit=2000), ((6, 3), (3, 3)))
+
+    def test_black_avoids_mate(self):
+        # Black must cover the back rank or give the king room
+        board, player = board_from_fen('6k1/5ppp/8/8/8/8/8/R5K1 b - - 0 1')
+        result = Engine().search(board, player, max_depth=3)
+        self.assertLess(result.score, MATE_THRESHOLD)
+        self.assertGreater(result.score, -MATE_THRESHOLD)
+
+    def test_node_budget(self):
+        board = create_board()
+        result = Engine().search(board, 'white', node_limit=300)
+        self.assertIsNotNone(result.move)
+        self.assertLessEqual(result.nodes, 300)
+        self.assertEqual(board, create_board()) # Board is restored after an aborted search
+
+    def test_time_budget(self):
+        board, player = board_from_fen('r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10')
+        start = time.perf_counter()
+        result = Engine().search(board, player, time_limit=0.2)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertIsNotNone(result.move)
+
+    def test_stop_from_another_thread(self):
+        engine = Engine()
+        results = []
+        thread = threading.Thread(target=lambda: results.append(engine.search(create_board(), 'white')))
+        start = time.perf_counter()
+        thread.start()
+        time.sleep(0.1)
+        engine.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertIsNotNone(results[0].move)
+
+    def test_stop_before_the_search_starts_is_kept(self):
+        engine = Engine()
+        engine.stop()
+        start = time.perf_counter()
+        result = engine.search_position(Position.from_board(create_board()))
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertLessEqual(result.nodes, CHECK_INTERVAL) # Aborted at the first check of the flag
+        self.assertIsNotNone(result.move)
+        engine.reset_stop()
+        self.assertEqual(engine.search_position(Position.from_board(create_board()), max_depth=2).depth, 2)
+
+    def test_transposition_table_is_used(self):
+        engine = Engine(hash_mb=1)
+        board = create_board()
+        engine.search(board, 'white', max_depth=3)
+        stats = engine.tt.stats()
+        self.assertGreater(stats['stores'], 0)
+        self.assertGreater(stats['hits'], 0)
+
+    def test_reports_iterations(self):
+        iterations = []
+        result = Engine().search_position(Position.from_board(create_board()), max_depth=3, info=iterations.append)
+        self.assertEqual([iteration.depth for iteration in iterations], [1, 2, 3])
+        self.assertEqual(iterations[-1].move, result.move)
+
+    def test_search_moves_and_principal_variation(self):
+        engine = Engine()
+        position = Position.from_fen('6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1')
+        moves = position.legal_moves()
+        result = engine.search_moves(position, moves[::2], 2)
+        self.assertIn(result.move, moves[::2])
+        self.assertEqual(result.depth, 2)
+        self.assertEqual(engine.search_moves(position, moves, 4, node_limit=10).depth, 0) # Aborted
+
+        result = engine.search_position(position, max_depth=4)
+        line = engine.principal_variation(position)
+        self.assertEqual(line[0], result.move)
+        self.assertEqual(Position.from_fen('6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1'), position)
+
+    def test_no_moves(self):
+        board, player = board_from_fen('7k/5Q2/6K1/8/8/8/8/8 b - - 0 1') # Stalemate
+        result = Engine().search(board, player, time_limit=1)
+        self.assertIsNone(result.move)
+        self.assertEqual(result.score, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+import instrumentation
+from instrumentation import Histogram
+from rules import create_board, get_all_valid_moves, is_in_check, is_valid_move
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        instrumentation.reset()
+
+    def tearDown(self):
+        instrumentation.set_trace_level(None)
+        instrumentation.logger.handlers.clear()
+        instrumentation.reset()
+
+    def test_counters(self):
+        board = create_board()
+        is_valid_move(board, (6, 4), (4, 4), 'white')
+        is_in_check(board, 'white')
+        get_all_valid_moves(board, 'white')
+        counters = instrumentation.snapshot()['counters']
+        self.assertEqual(counters['is_valid_move'], 1)
+        self.assertEqual(counters['get_all_valid_moves'], 1)
+        self.assertGreaterEqual(counters['is_in_check'], 1)
+
+    def test_tracing_disabled_by_default(self):
+        stream = io.StringIO()
+        instrumentation.logger.addHandler(logging.StreamHandler(stream))
+        instrumentation.set_trace_level(None)
+        is_valid_move(create_board(), (6, 4), (6, 4), 'white')
+        self.assertEqual(stream.getvalue(), '')
+
+    def test_tracing_to_stream(self):
+        stream = io.StringIO()
+        instrumentation.set_trace_level('debug', stream)
+        self.assertFalse(is_valid_move(create_board(), (6, 4), (6, 4), 'white'))
+        self.assertIn("start_pos == end_pos", stream.getvalue())
+
+    def test_unknown_trace_level(self):
+        with self.assertRaises(ValueError):
+            instrumentation.set_trace_level('verbose')
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for ms in (1, 1, 1, 8, 300):
+            histogram.record(ms / 1000)
+        data = histogram.to_dict()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['p50_ms'], 1)
+        self.assertEqual(data['p90_ms'], 500)
+        self.assertAlmostEqual(data['max_ms'], 300)
+
+        merged = Histogram()
+        merged.merge(data)
+        merged.merge(data)
+        self.assertEqual(merged.count, 10)
+        self.assertAlmostEqual(merged.minimum, 1)
+
+    def test_merge_and_dump(self):
+        instrumentation.count('nodes', 5)
+        instrumentation.record_time('search', 0.004)
+        instrumentation.merge(instrumentation.snapshot())
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'stats.json')
+            instrumentation.dump_stats(path)
+            with open(path) as f:
+                stats = json.load(f)
+        self.assertEqual(stats['counters']['nodes'], 10)
+        self.assertEqual(stats['histograms']['search']['count'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
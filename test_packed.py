@@ -0,0 +1,122 @@
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from packed import (
+    GameRecords, MappedGameRecords, MoveStack, _count_move_containers, _list_perft, pack_game, perft, read_selfplay,
+)
+from perft import BENCHMARK_POSITIONS
+from position import KNIGHT, QUEEN, Position, move_from_uci, move_to_tuple, pack_tuple, unpack_move, unpack_tuple
+from rules import create_board
+from selfplay import play_game
+
+
+class TestPackedMoves(unittest.TestCase):
+
+    def test_tuple_conversion(self):
+        for move in (((6, 4), (4, 4)), ((0, 0), (7, 7)), ((1, 0), (0, 1))):
+            self.assertEqual(unpack_tuple(pack_tuple(move)), move)
+            self.assertEqual(unpack_tuple(pack_tuple(move, KNIGHT)), move)
+        self.assertEqual(unpack_move(pack_tuple(((1, 0), (0, 0)), KNIGHT))[1], KNIGHT)
+
+    def test_pack_game_marks_promotions(self):
+        packed = pack_game(['a2a4', 'b7b5', 'a4b5', 'a7a6', 'b5a6', 'c8b7', 'a6b7', 'b8c6', 'b7a8', 'c6d4'])
+        self.assertEqual(unpack_move(packed[-2]), (move_from_uci('b7a8')[0], QUEEN))
+        packed = pack_game(['a2a4', 'b7b5', 'a4b5', 'a7a6', 'b5a6', 'c8b7', 'a6b7', 'b8c6', 'b7a8n'])
+        self.assertEqual(unpack_move(packed[-1])[1], KNIGHT)
+        with self.assertRaises(ValueError):
+            pack_game(['e2e4', 'e7e5', 'e4e5'])
+
+    def test_perft_with_move_stack(self):
+        stack = MoveStack()
+        for entry in BENCHMARK_POSITIONS:
+            position = Position.from_fen(entry['fen'])
+            self.assertEqual(perft(position, 3, stack), entry['nodes'][3], entry['name'])
+        self.assertEqual(len(stack.buffers), 3)
+        self.assertEqual(perft(Position.from_fen(BENCHMARK_POSITIONS[0]['fen']), 0), 1)
+
+    def test_move_containers_are_counted(self):
+        start = Position.from_board(create_board())
+        self.assertEqual(_count_move_containers(lambda: perft(start.copy(), 3)), 3)
+        self.assertEqual(_count_move_containers(lambda: _list_perft(start.copy(), 3)), 1 + 20 + 400)
+        self.assertEqual(Position.legal_moves.__name__, 'legal_moves')
+
+
+class TestGameRecords(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.games = [play_game(seed, max_plies=120) for seed in range(6)]
+
+    def records(self):
+        records = GameRecords()
+        for game in self.games:
+            records.append(pack_game(game['moves']), game['result'])
+        return records
+
+    def check(self, records):
+        self.assertEqual(len(records), len(self.games))
+        for index, game in enumerate(self.games):
+            # Seed 2 promotes, which selfplay.py records without a suffix
+            self.assertEqual([text[:4] for text in records.uci_moves(index)], game['moves'])
+            self.assertEqual(records.result(index), game['result'])
+            self.assertEqual(records.tuples(index), [move_to_tuple(move_from_uci(text)[0])
+                                                    for text in game['moves']])
+
+    def test_append_and_convert(self):
+        records = self.records()
+        self.check(records)
+        self.assertIn('q', ''.join(records.uci_moves(2)))
+        copy = GameRecords()
+        copy.append_tuples(records.tuples(2), records.result(2))
+        self.assertEqual(copy.game(0), records.game(2))
+
+    def test_replay(self):
+        records = self.records()
+        position = Position.from_board(create_board())
+        for ply, replayed in enumerate(records.replay(3)):
+            move, promotion = unpack_move(records.game(3)[ply])
+            position.make_move(move, promotion or QUEEN)
+            self.assertEqual(replayed, position)
+
+    def test_write_and_map(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'games.rec')
+            records = self.records()
+            records.write(path)
+            self.assertEqual(os.path.getsize(path), 24 + 8 * 7 + 2 * len(records.moves) + 6)
+            with MappedGameRecords(path) as mapped:
+                self.check(mapped)
+                self.assertEqual(mapped.game(5), records.game(5))
+                with self.assertRaises(TypeError):
+                    mapped.append([])
+
+            with open(path, 'r+b') as f:
+                f.truncate(os.path.getsize(path) - 1)
+            with self.assertRaises(ValueError):
+                MappedGameRecords(path)
+
+    def test_read_selfplay(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'games.jsonl')
+            with open(path, 'w') as f:
+                f.writelines(json.dumps(game) + '\n' for game in self.games)
+            self.check(read_selfplay(path))
+
+    def test_two_bytes_per_move(self):
+        packed = [pack_game(game['moves']) for game in self.games]
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        records = GameRecords()
+        for _ in range(200):
+            for moves, game in zip(packed, self.games):
+                records.append(moves, game['result'])
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        self.assertLess(used / len(records.moves), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+from rules import board_from_fen, board_to_fen, create_board
+from perft import (BENCHMARK_POSITIONS, divide, find_regressions, format_move, load_baseline, perft,
+                   record_baseline, run_benchmark)
+
+class TestPerft(unittest.TestCase):
+
+    def test_start_position(self):
+        board = create_board()
+        self.assertEqual(perft(board, 'white', 1), 20)
+        self.assertEqual(perft(board, 'white', 2), 400)
+        self.assertEqual(perft(board, 'white', 3), 8902)
+        self.assertEqual(board, create_board()) # Board is restored
+
+    def test_benchmark_positions(self):
+        for position in BENCHMARK_POSITIONS:
+            board, player = board_from_fen(position['fen'])
+            for depth in (1, 2):
+                self.assertEqual(perft(board, player, depth), position['nodes'][depth], position['name'])
+
+    def test_divide_sums_to_perft(self):
+        board = create_board()
+        results = divide(board, 'white', 2)
+        self.assertEqual(len(results), 20)
+        self.assertEqual(sum(nodes for _, nodes in results), 400)
+        self.assertIn(('e2e4', 20), [(format_move(move), nodes) for move, nodes in results])
+
+    def test_fen_round_trip(self):
+        for position in BENCHMARK_POSITIONS:
+            board, player = board_from_fen(position['fen'])
+            self.assertEqual(board_from_fen(board_to_fen(board, player)), (board, player))
+        with self.assertRaises(ValueError):
+            board_from_fen('8/8/8 w - - 0 1')
+
+    def test_find_regressions(self):
+        results = run_benchmark(max_depth=2)
+        self.assertEqual(find_regressions(results, None), [])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'baseline.json')
+            record_baseline(results, path)
+            baseline = load_baseline(path)
+        self.assertEqual(find_regressions(results, baseline), [])
+
+        slow = [dict(results[0], nps=results[0]['nps'] / 2)]
+        self.assertEqual(len(find_regressions(slow, baseline)), 1)
+        wrong = [dict(results[0], nodes=results[0]['nodes'] + 1)]
+        self.assertEqual(len(find_regressions(wrong, baseline)), 1)
+
+    @unittest.skipUnless(load_baseline(), "no recorded perft baseline (run: python perft.py --bench --record)")
+    def test_throughput_against_baseline(self):
+        self.assertEqual(find_regressions(run_benchmark(), load_baseline()), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import io
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from pgn import ParseError, Game, parse_fen, parse_san, read_games, read_lines, replay, replay_games, validate_file
+from position import KNIGHT, QUEEN, Position, move_from_tuple
+
+GAMES = """[Event "Scholar's mate"]
+[Result "1-0"]
+
+1. e4 e5 2. Qh5 {a comment
+over two lines} Nc6 (2... g6 3. Qxe5+) 3. Bc4 Nf6?? 4. Qxf7# 1-0
+
+[Event "Castles"]
+1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. O-O Nf6 *
+
+[Event "Underpromotion"]
+[SetUp "1"]
+[FEN "8/P6k/8/8/8/8/8/K7 w - - 0 1"]
+1. a8=N Kg6 2. Nb6 $1 ; rest of line
+1/2-1/2
+"""
+
+class RepeatedGames:
+    """File-like object serving the same game over and over without holding the whole text."""
+
+    def __init__(self, text, count):
+        self.text = text
+        self.left = count
+
+    def read(self, size):
+        if not self.left:
+            return ''
+        self.left -= 1
+        return self.text
+
+class TestPGN(unittest.TestCase):
+
+    def test_read_lines_across_chunks(self):
+        text = "first\r\nsecond line\n\nlast"
+        for chunk_size in (1, 3, 7, 1 << 16):
+            self.assertEqual(list(read_lines(io.StringIO(text), chunk_size)), ['first', 'second line', '', 'last'])
+
+    def test_read_games(self):
+        games = list(read_games(io.StringIO(GAMES), chunk_size=10))
+        self.assertEqual([game.line for game in games], [1, 7, 10])
+        self.assertEqual(games[0].headers, {'Event': "Scholar's mate", 'Result': '1-0'})
+        self.assertEqual(games[0].moves, ['e4', 'e5', 'Qh5', 'Nc6', 'Bc4', 'Nf6??', 'Qxf7#'])
+        self.assertEqual([game.result for game in games], ['1-0', '*', '1/2-1/2'])
+        self.assertEqual(games[2].moves, ['a8=N', 'Kg6', 'Nb6'])
+
+    def test_replay_games(self):
+        (first, fens, error), (second, no_fens, castling), (third, promotion_fens, _) = replay_games(io.StringIO(GAMES))
+        self.assertIsNone(error)
+        self.assertEqual(len(fens), 7)
+        self.assertEqual(fens[-1], 'r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/8/PPPP1PPP/RNB1K1NR b - - 0 1')
+        self.assertIsNone(no_fens)
+        self.assertEqual((castling.line, castling.ply, castling.san), (7, 6, 'O-O'))
+        self.assertIn("castling", str(castling))
+        self.assertEqual(promotion_fens[0], 'N7/7k/8/8/8/8/8/K7 b - - 0 1')
+
+    def test_replay_yields_positions(self):
+        game = Game(1)
+        game.moves = ['e4', 'e5']
+        self.assertEqual([position.to_fen() for position in replay(game)], [
+            'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b - - 0 1',
+            'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w - - 0 1',
+        ])
+
+    def test_parse_san(self):
+        position = Position.from_fen('4k3/P7/8/8/8/8/8/N1N1K3 w - - 0 1')
+        self.assertEqual(parse_san(position, 'Nab3'), (move_from_tuple(((7, 0), (5, 1))), QUEEN))
+        self.assertEqual(parse_san(position, 'a8=N+'), (move_from_tuple(((1, 0), (0, 0))), KNIGHT))
+        self.assertEqual(parse_san(position, 'a8'), (move_from_tuple(((1, 0), (0, 0))), QUEEN))
+        for san, reason in (('Nb3', "ambiguous"), ('Nb4', "illegal"), ('Nxd3', "empty square"),
+                            ('Ke2=Q', "promotion"), ('Zz9', "not a SAN move"), ('O-O-O', "castling")):
+            with self.assertRaisesRegex(ValueError, reason):
+                parse_san(position, san)
+
+    def test_parse_fen(self):
+        self.assertEqual(parse_fen('4k3/8/8/8/8/8/8/4K3 w - - 0 1').to_fen(), '4k3/8/8/8/8/8/8/4K3 w - - 0 1')
+        for fen, reason in (('4k3/8/8/8/8/8/8/8 w', "white has 0 kings"), ('P3k3/8/8/8/8/8/8/4K3 w', "pawn"),
+                            ('4k3/4Q3/8/8/8/8/8/4K3 w', "not to move is in check"), ('4k3/8 w', "ranks")):
+            with self.assertRaisesRegex(ParseError, reason) as context:
+                parse_fen(fen, line=3)
+            self.assertEqual(context.exception.line, 3)
+
+    def test_streaming_memory_is_constant(self):
+        tracemalloc.start()
+        try:
+            games = sum(1 for _ in read_games(RepeatedGames(GAMES, 500)))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(games, 1500)
+        self.assertLess(peak, 256 * 1024)
+
+    def test_validate_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'games.pgn')
+            with open(path, 'w') as f:
+                f.write(GAMES * 5)
+            errors = []
+            totals = validate_file(path, workers=2, errors=errors.append, batch_size=4)
+            self.assertEqual((totals['items'], totals['valid'], totals['invalid']), (15, 10, 5))
+            self.assertEqual(totals['plies'], 5 * (7 + 6 + 3))
+            self.assertEqual(len(errors), 5)
+
+            path = os.path.join(tmp, 'positions.fen')
+            with open(path, 'w') as f:
+                f.write('4k3/8/8/8/8/8/8/4K3 w - - 0 1\n\n8/8/8/8/8/8/8/8 w - - 0 1\n')
+            errors = []
+            totals = validate_file(path, fen=True, workers=1, errors=errors.append)
+            self.assertEqual((totals['items'], totals['invalid']), (2, 1))
+            self.assertTrue(errors[0].startswith("line 3: "))
+
+if __name__ == '__main__':
+    unittest.main()
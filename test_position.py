@@ -0,0 +1,150 @@
+import random
+import unittest
+from array import array
+
+from perft import BENCHMARK_POSITIONS
+from position import (
+    BLACK, KNIGHT, PAWN, QUEEN, WHITE, Position, move_from_tuple, move_from_uci, move_to_tuple, move_to_uci, pack_move,
+    unpack_move,
+)
+from rules import board_from_fen, create_board, get_all_valid_moves
+from zobrist import hash_board
+
+def position_perft(position, depth):
+    moves = position.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += position_perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+def snapshot(position):
+    return (bytes(position.squares), position.side, tuple(map(frozenset, position.pieces)),
+            tuple(position.kings), position.key)
+
+class TestPosition(unittest.TestCase):
+
+    def test_board_round_trip(self):
+        position = Position.from_board(create_board(), 'white')
+        self.assertEqual(position.to_board(), create_board())
+        self.assertEqual(position.kings, [60, 4])
+        self.assertEqual(len(position.pieces[WHITE]), 16)
+        self.assertEqual(position.key, hash_board(create_board(), 'white'))
+        for entry in BENCHMARK_POSITIONS:
+            self.assertEqual(Position.from_fen(entry['fen']).to_fen().split()[:2], entry['fen'].split()[:2])
+
+    def test_move_tuple_conversion(self):
+        move = ((6, 4), (4, 4))
+        self.assertEqual(move_from_tuple(move), 52 * 64 + 36)
+        self.assertEqual(move_to_tuple(move_from_tuple(move)), move)
+
+    def test_coordinate_notation(self):
+        self.assertEqual(move_from_uci('e2e4'), (move_from_tuple(((6, 4), (4, 4))), None))
+        self.assertEqual(move_from_uci('a7a8n'), (move_from_tuple(((1, 0), (0, 0))), KNIGHT))
+        self.assertEqual(move_to_uci(*move_from_uci('a7a8n')), 'a7a8n')
+        self.assertEqual(move_to_uci(move_from_uci('g8f6')[0]), 'g8f6')
+        for text in ('e2e9', 'e2', 'i2e4', 'a7a8k'):
+            with self.assertRaises(ValueError):
+                move_from_uci(text)
+
+    def test_from_squares(self):
+        for entry in BENCHMARK_POSITIONS:
+            position = Position.from_fen(entry['fen'])
+            self.assertEqual(Position.from_squares(bytes(position.squares), position.side), position)
+            self.assertEqual(Position.from_squares(position.squares, position.side).key, position.key)
+
+    def test_perft(self):
+        for entry in BENCHMARK_POSITIONS:
+            position = Position.from_fen(entry['fen'])
+            self.assertEqual(position_perft(position, 2), entry['nodes'][2], entry['name'])
+
+    def test_legal_moves_match_rules(self):
+        for entry in BENCHMARK_POSITIONS:
+            board, player = board_from_fen(entry['fen'])
+            moves = sorted(map(move_to_tuple, Position.from_board(board, player).legal_moves()))
+            self.assertEqual(moves, sorted(get_all_valid_moves(board, player)), entry['name'])
+
+    def test_legal_moves_into_buffer(self):
+        rng = random.Random(5)
+        buffer = array('H', [1, 2, 3])
+        for entry in BENCHMARK_POSITIONS:
+            position = Position.from_fen(entry['fen'])
+            for _ in range(40):
+                for captures_only in (False, True):
+                    moves = position.legal_moves(captures_only)
+                    self.assertIs(position.legal_moves(captures_only, out=buffer), buffer)
+                    self.assertEqual(buffer.tolist(), moves, position.to_fen())
+                if not moves:
+                    break
+                position.make_move(rng.choice(moves))
+
+    def test_packed_moves(self):
+        move = move_from_uci('a7a8')[0]
+        self.assertEqual(unpack_move(pack_move(move)), (move, None))
+        self.assertEqual(unpack_move(pack_move(move, KNIGHT)), (move, KNIGHT))
+        self.assertLess(pack_move(move_from_uci('h2h1')[0], QUEEN), 1 << 16)
+
+    def test_make_unmake_restores_state(self):
+        rng = random.Random(3)
+        position = Position.from_fen('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w - - 0 1')
+        snapshots = []
+        for _ in range(60):
+            moves = position.legal_moves()
+            if not moves:
+                break
+            snapshots.append(snapshot(position))
+            position.make_move(rng.choice(moves))
+            self.assertEqual(position.key, hash_board(position.to_board(), position.player))
+        while snapshots:
+            position.unmake_move()
+            self.assertEqual(snapshot(position), snapshots.pop())
+
+    def test_checkers_and_pins(self):
+        # White king e1, rook e2 pinned by the rook on e8, bishop b4 gives check
+        position = Position.from_fen('k3r3/8/8/8/1b6/8/4R3/4K3 w - - 0 1')
+        checkers, evasions, pins = position.checkers_and_pins()
+        self.assertEqual(checkers, [33])
+        self.assertEqual(set(evasions), {33, 42, 51}) # b4, c3, d2
+        self.assertEqual(set(pins), {52})
+        self.assertEqual(set(pins[52]), {52, 44, 36, 28, 20, 12, 4})
+        # The pinned rook cannot block on d2, so only king moves are left
+        self.assertTrue(all(move // 64 == 60 for move in position.legal_moves()))
+
+    def test_double_check_allows_king_moves_only(self):
+        position = Position.from_fen('k3r3/8/8/8/1b6/8/R7/4K3 w - - 0 1')
+        self.assertEqual(len(position.checkers_and_pins()[0]), 2)
+        self.assertTrue(all(move // 64 == 60 for move in position.legal_moves()))
+
+    def test_king_cannot_retreat_along_checking_ray(self):
+        position = Position.from_fen('k3r3/8/8/8/8/8/8/4K3 w - - 0 1')
+        self.assertTrue(position.attack_map(BLACK, ignore=60)[60])
+        moves = set(map(move_to_tuple, position.legal_moves()))
+        self.assertNotIn(((7, 4), (6, 4)), moves)
+        self.assertIn(((7, 4), (6, 3)), moves)
+
+    def test_promotion(self):
+        position = Position.from_fen('4k3/P7/8/8/8/8/8/4K3 w - - 0 1')
+        key = position.key
+        position.make_move(move_from_tuple(((1, 0), (0, 0))))
+        self.assertEqual(position.to_board()[0][0], 'Q')
+        self.assertEqual(position.side, BLACK)
+        self.assertEqual(position.last_move(), (move_from_tuple(((1, 0), (0, 0))), PAWN, key))
+        position.unmake_move()
+        self.assertEqual(position.to_board()[1][0], 'P')
+        self.assertTrue(position.is_promotion(move_from_tuple(((1, 0), (0, 0)))))
+        self.assertFalse(position.is_promotion(move_from_tuple(((7, 4), (6, 4)))))
+
+    def test_copy_is_independent(self):
+        position = Position.from_board(create_board())
+        copy = position.copy()
+        copy.make_move(move_from_tuple(((6, 4), (4, 4))))
+        self.assertEqual(position.to_board(), create_board())
+        self.assertNotEqual(copy, position)
+        copy.unmake_move()
+        self.assertEqual(copy, position)
+
+if __name__ == '__main__':
+    unittest.main()
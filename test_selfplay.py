@@ -0,0 +1,41 @@
+import json
+import os
+import tempfile
+import unittest
+
+from selfplay import play_game, run_games
+
+class TestSelfPlay(unittest.TestCase):
+
+    def test_random_game_is_reproducible(self):
+        game = play_game(11)
+        self.assertEqual(play_game(11)['moves'], game['moves'])
+        self.assertNotEqual(play_game(12)['moves'], game['moves'])
+        self.assertIn(game['termination'], ('checkmate', 'stalemate', 'repetition', 'insufficient-material',
+                                            'max-plies'))
+        self.assertEqual(game['plies'], len(game['moves']))
+
+    def test_search_game(self):
+        game = play_game(1, policy='search', depth=1, max_plies=12)
+        self.assertEqual(game, dict(play_game(1, policy='search', depth=1, max_plies=12), seconds=game['seconds']))
+        self.assertLessEqual(game['plies'], 12)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            play_game(0, policy='minimax')
+
+    def test_run_games_streams_records(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'games.jsonl')
+            finished = []
+            totals = run_games(6, output, workers=2, seed=100, progress=finished.append, max_plies=40)
+            with open(output) as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual(totals['games'], 6)
+        self.assertEqual(sorted(record['seed'] for record in records), list(range(100, 106)))
+        self.assertEqual(len(finished), 6)
+        self.assertEqual(totals['plies'], sum(record['plies'] for record in records))
+        self.assertGreater(totals['games_per_second'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
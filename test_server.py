@@ -0,0 +1,149 @@
+import asyncio
+import json
+import tracemalloc
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+
+from position import Position, move_from_uci
+from rules import create_board
+from server import MAX_PLIES, PLAYING, Client, GameServer, Session, load_test
+
+
+class TestGameServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = await GameServer(workers=1, idle_timeout=60).start(port=0)
+        self.client = await Client.connect(port=self.server.port)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def test_play_moves(self):
+        response = await self.client.request('new', color='white', depth=1)
+        self.assertTrue(response['ok'])
+        self.assertEqual((response['status'], response['turn']), (PLAYING, 'white'))
+        game = response['game']
+
+        for move, error in (('e2e5', 'Illegal move e2e5'), ('e2', 'Malformed move'), ('e7e5', 'Illegal move')):
+            response = await self.client.request('move', game=game, move=move)
+            self.assertFalse(response['ok'])
+            self.assertIn(error, response['error'])
+
+        response = await self.client.request('move', game=game, move='e2e4')
+        self.assertTrue(response['ok'], response)
+        position = Position.from_board(create_board())
+        position.make_move(move_from_uci('e2e4')[0])
+        self.assertIn(move_from_uci(response['reply'])[0], position.legal_moves())
+        position.make_move(move_from_uci(response['reply'])[0])
+        self.assertEqual(response['fen'], position.to_fen())
+        self.assertEqual((response['turn'], response['plies']), ('white', 2))
+
+        state = await self.client.request('state', game=game)
+        self.assertEqual(state['fen'], response['fen'])
+        self.assertTrue((await self.client.request('close', game=game))['ok'])
+        response = await self.client.request('state', game=game)
+        self.assertEqual(response['error'], f"No game {game}")
+
+    async def test_computer_moves_first_for_black(self):
+        response = await self.client.request('new', color='black', depth=1)
+        self.assertEqual(response['turn'], 'black')
+        self.assertIn(move_from_uci(response['reply'])[0], Position.from_board(create_board()).legal_moves())
+
+    async def test_bad_requests(self):
+        self.assertIn('Unknown op', (await self.client.request('resign'))['error'])
+        self.assertIn('Unknown op', (await self.client.request([]))['error'])
+        self.assertIn('depth', (await self.client.request('new', depth=True))['error'])
+        self.assertIn('game must be an integer', (await self.client.request('state', game=True))['error'])
+        self.assertIn('Unknown color', (await self.client.request('new', color='red'))['error'])
+        self.assertIn('depth', (await self.client.request('new', depth=40))['error'])
+        self.assertIn('game must be an integer', (await self.client.request('state', game=[1]))['error'])
+        response = await self.client.request('move', game={'a': 1}, move='e2e4')
+        self.assertIn('game must be an integer', response['error'])
+        self.client.writer.write(b'not json\n')
+        self.client.writer.write(b'{"id": 99, "op": "stats"}\n')
+        self.assertTrue(await self.client.request('stats'))
+
+        reader, writer = await asyncio.open_connection(port=self.server.port)
+        for line in (b'\xff\xfe\n', b'not json\n'):
+            writer.write(line)
+            response = json.loads(await reader.readline())
+            self.assertEqual((response['ok'], response['id']), (False, None))
+        writer.write(b'{"op": "stats", "pad": "' + b'x' * 5000 + b'"}\n')
+        response = json.loads(await reader.readline())
+        self.assertIn('longer than', response['error'])
+        writer.close()
+        await writer.wait_closed()
+        stats = await self.client.request('stats')
+        self.assertGreaterEqual(stats['latency_ms']['invalid']['count'], 5)
+
+    async def test_worker_failure_takes_the_move_back(self):
+        async def broken(session):
+            raise BrokenProcessPool("A worker died")
+        self.server.computer_move = broken
+        game = (await self.client.request('new', depth=1))['game']
+        response = await self.client.request('move', game=game, move='e2e4')
+        self.assertFalse(response['ok'])
+        self.assertIn('BrokenProcessPool', response['error'])
+        state = await self.client.request('state', game=game)
+        self.assertEqual((state['turn'], state['plies']), ('white', 0))
+
+        response = await self.client.request('new', color='black', depth=1)
+        self.assertFalse(response['ok'])
+        self.assertEqual((await self.client.request('stats'))['games_started'], 1)
+
+        del self.server.computer_move # The pool works again
+        response = await self.client.request('move', game=game, move='e2e4')
+        self.assertTrue(response['ok'], response)
+        self.assertEqual(response['plies'], 2)
+        self.assertEqual((await self.client.request('stats'))['active_games'], 1)
+
+    async def test_concurrent_games_and_stats(self):
+        games = await asyncio.gather(*(self.client.request('new', depth=1) for _ in range(20)))
+        moves = await asyncio.gather(*(self.client.request('move', game=response['game'], move='d2d4')
+                                       for response in games))
+        self.assertTrue(all(response['ok'] for response in moves))
+        stats = await self.client.request('stats')
+        self.assertEqual(stats['active_games'], 20)
+        self.assertEqual(stats['latency_ms']['move']['count'], 20)
+        self.assertIsNotNone(stats['latency_ms']['move']['p99_ms'])
+
+    async def test_idle_sessions_are_dropped(self):
+        self.server.idle_timeout = 0.2
+        self.server.sweeper.cancel()
+        self.server.sweeper = asyncio.create_task(self.server.sweep())
+        await self.client.request('new')
+        await asyncio.sleep(0.4)
+        self.assertEqual((await self.client.request('stats'))['active_games'], 0)
+
+    async def test_load_test(self):
+        report = await load_test(port=self.server.port, games=6, concurrency=3, connections=2, max_plies=6)
+        self.assertEqual(report['games'], 6)
+        self.assertEqual(report['plies'], 36)
+        self.assertEqual(report['server']['games_started'], 6)
+        self.assertEqual(report['server']['active_games'], 0)
+
+
+class TestSession(unittest.TestCase):
+
+    def test_session_is_compact(self):
+        position = Position.from_board(create_board())
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        sessions = {}
+        for game in range(2000):
+            session = sessions[game] = Session(0, 2, 0.0)
+            session.play(position.copy(), move_from_uci('e2e4')[0], None, 300)
+        per_session = (tracemalloc.get_traced_memory()[0] - before) / len(sessions)
+        tracemalloc.stop()
+        self.assertLess(per_session, 512)
+        self.assertEqual(session.status, PLAYING)
+
+    def test_max_plies(self):
+        session = Session(0, 2, 0.0)
+        session.play(session.position(), move_from_uci('g1f3')[0], None, 1)
+        self.assertEqual(session.status, MAX_PLIES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import random
+import tempfile
+import unittest
+
+from engine import MATE_SCORE, Engine
+from position import Position
+from tablebase import (
+    DRAW, INVALID, Tablebases, dependencies, generate, load_table, normalize_material, open_tablebases,
+    parse_material, successor_value,
+)
+
+
+def mirrored(fen):
+    """The same position with the colors swapped and the board turned upside down."""
+    rows, side = fen.split()[:2]
+    rows = '/'.join(row.swapcase() for row in reversed(rows.split('/')))
+    return f"{rows} {'b' if side == 'w' else 'w'} - - 0 1"
+
+
+class TestMaterial(unittest.TestCase):
+
+    def test_parse_material(self):
+        self.assertEqual(parse_material('KRKP'), ('KR', 'KP'))
+        for name in ('KQ', 'QKK', 'KQRKR', 'KXK'):
+            with self.assertRaises(ValueError):
+                parse_material(name)
+
+    def test_normalize_material(self):
+        self.assertEqual(normalize_material('K', 'KQ'), ('KQK', True))
+        self.assertEqual(normalize_material('KR', 'KQ'), ('KQKR', True))
+        self.assertEqual(normalize_material('KPQ', 'K'), ('KQPK', False))
+
+    def test_dependencies(self):
+        self.assertEqual(dependencies('KPK'), {'KQK'})
+        self.assertEqual(dependencies('KQKR'), {'KQK', 'KRK'})
+        self.assertEqual(dependencies('KQK'), set())
+
+    def test_successor_value(self):
+        self.assertEqual(successor_value(-1), 1) # Mating move
+        self.assertEqual(successor_value(1), -3) # Walking into mate in one
+        self.assertEqual(successor_value(DRAW), DRAW)
+
+
+class TestTablebases(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.generated = generate(['KPK'], cls.tmp.name, workers=1)
+        cls.tablebases = Tablebases(cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def probe(self, fen):
+        return self.tablebases.probe(Position.from_fen(fen))
+
+    def test_generates_dependencies_first(self):
+        self.assertEqual(self.generated, ['KQK', 'KPK'])
+        self.assertEqual(generate(['KPK'], self.tmp.name, workers=1), [])
+
+    def test_files(self):
+        layout, values = load_table(os.path.join(self.tmp.name, 'KQK.tb'))
+        self.assertEqual(layout.size, 10 * 64 * 64 * 2)
+        self.assertLess(os.path.getsize(os.path.join(self.tmp.name, 'KQK.tb')), layout.size // 4)
+        valid = [value for value in values if value != INVALID]
+        # The longest win with king and queen is mate in 10
+        self.assertEqual(max(valid), 19)
+        self.assertEqual(min(valid), -21)
+
+    def test_known_positions(self):
+        self.assertEqual(self.probe('7k/8/6K1/8/8/8/8/1Q6 w - - 0 1'), 1)
+        self.assertEqual(self.probe('1Q5k/8/6K1/8/8/8/8/8 b - - 0 1'), -1) # Mated
+        self.assertEqual(self.probe('7k/5Q2/6K1/8/8/8/8/8 b - - 0 1'), DRAW) # Stalemate
+        self.assertEqual(self.probe('7k/8/8/8/8/8/5q2/6K1 w - - 0 1'), DRAW) # Bare king takes the queen
+        self.assertEqual(self.probe('k7/8/8/8/8/8/P7/K7 w - - 0 1'), DRAW) # Rook pawn, king in front
+        self.assertGreater(self.probe('8/8/8/8/8/2k5/4P3/4K3 w - - 0 1'), 0)
+        self.assertIsNone(self.probe('7k/8/6K1/8/8/8/8/1R6 w - - 0 1'))
+        self.assertIsNone(open_tablebases(os.path.join(self.tmp.name, 'missing')))
+
+    def test_mirrored_positions_agree(self):
+        for fen in ('8/8/8/8/8/2k5/4P3/4K3 w - - 0 1', '8/8/3k4/8/8/8/8/KQ6 b - - 0 1',
+                    '8/8/8/8/8/k7/p7/K7 w - - 0 1'):
+            self.assertEqual(self.probe(fen), self.probe(mirrored(fen)), fen)
+
+    def test_best_move_follows_the_table(self):
+        position = Position.from_fen('8/8/3k4/8/8/8/8/KQ6 w - - 0 1')
+        value = self.tablebases.probe(position)
+        while value > 0:
+            move, move_value = self.tablebases.best_move(position)
+            self.assertEqual(move_value, value)
+            position.make_move(move)
+            value = self.tablebases.probe(position)
+            self.assertEqual(successor_value(value), move_value)
+            if value != -1:
+                position.make_move(self.tablebases.best_move(position)[0])
+                value = self.tablebases.probe(position)
+        self.assertEqual(value, -1)
+        self.assertEqual(position.legal_moves(), [])
+
+    def test_search_agrees_with_short_mates(self):
+        layout, values = self.tablebases.table('KQK')
+        rng = random.Random(3)
+        short = [index for index, value in enumerate(values) if 0 < value <= 3]
+        for index in rng.sample(short, 8):
+            position = layout.position(*layout.decode(index))
+            position = Position.from_fen(position.to_fen()) # With its Zobrist key
+            result = Engine().search_position(position, max_depth=values[index] + 1)
+            self.assertEqual(result.score, MATE_SCORE - values[index], position.to_fen())
+
+    def test_engine_plays_from_tables(self):
+        engine = Engine(tablebases=self.tablebases)
+        result = engine.search_position(Position.from_fen('8/8/3k4/8/8/8/8/KQ6 w - - 0 1'))
+        self.assertEqual(result.nodes, 0)
+        self.assertEqual(result.score, MATE_SCORE - self.probe('8/8/3k4/8/8/8/8/KQ6 w - - 0 1'))
+        result = engine.search_position(Position.from_fen('8/8/3k4/8/8/8/8/KQ6 b - - 0 1'))
+        self.assertEqual(result.score, -MATE_SCORE - 1 - self.probe('8/8/3k4/8/8/8/8/KQ6 b - - 0 1'))
+        self.assertEqual(result.nodes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
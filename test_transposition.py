@@ -0,0 +1,60 @@
+import unittest
+
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+class TestTranspositionTable(unittest.TestCase):
+
+    def test_store_and_probe(self):
+        tt = TranspositionTable(1)
+        tt.store(12345, 4, LOWER, -250, 3140)
+        tt.store(67890, 2, UPPER, 99990, None)
+        self.assertEqual(tt.probe(12345), (4, LOWER, -250, 3140))
+        self.assertEqual(tt.probe(67890), (2, UPPER, 99990, None))
+        self.assertIsNone(tt.probe(11111))
+
+    def test_size_is_fixed(self):
+        tt = TranspositionTable(1)
+        self.assertEqual(tt.keys.itemsize * len(tt.keys) + tt.entries.itemsize * len(tt.entries), 1024 * 1024)
+        for key in range(1, 100000):
+            tt.store(key, 1, EXACT, 0, None)
+        self.assertEqual(len(tt.keys), 1024 * 1024 // 16)
+
+    def test_depth_preferred_slot(self):
+        tt = TranspositionTable(1)
+        deep = 5
+        shallow = deep + tt.bucket_count # Same bucket
+        tt.store(deep, 8, EXACT, 10, None)
+        tt.store(shallow, 2, EXACT, 20, None)
+        self.assertEqual(tt.probe(deep)[0], 8)
+        self.assertEqual(tt.probe(shallow)[0], 2)
+
+        # The always-replace slot takes the next shallow entry
+        tt.store(shallow + tt.bucket_count, 1, EXACT, 30, None)
+        self.assertIsNotNone(tt.probe(deep))
+        self.assertIsNone(tt.probe(shallow))
+
+        # Entries from an earlier search can be replaced by shallower ones
+        tt.new_search()
+        tt.store(shallow, 1, EXACT, 40, None)
+        self.assertIsNone(tt.probe(deep))
+
+    def test_keeps_move_when_storing_without_one(self):
+        tt = TranspositionTable(1)
+        tt.store(42, 3, EXACT, 0, 593)
+        tt.store(42, 4, UPPER, -5, None)
+        self.assertEqual(tt.probe(42), (4, UPPER, -5, 593))
+
+    def test_stats(self):
+        tt = TranspositionTable(1)
+        tt.store(1, 1, EXACT, 0, None)
+        tt.probe(1)
+        tt.probe(2)
+        stats = tt.stats()
+        self.assertEqual((stats['probes'], stats['hits'], stats['stores']), (2, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertGreater(stats['fill'], 0)
+        tt.clear()
+        self.assertEqual(tt.stats()['fill'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import io
+import time
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+
+from engine import MATE_SCORE, Engine
+from position import WHITE, Position, move_from_uci
+from rules import create_board
+from uci import UciEngine, format_score, parse_go, time_budget
+
+class TestUciHelpers(unittest.TestCase):
+
+    def test_parse_go(self):
+        self.assertEqual(parse_go('ponder wtime 60000 btime 50000 winc 1000 movestogo 20'.split()),
+                         ({'ponder': True, 'wtime': 60000, 'btime': 50000, 'winc': 1000, 'movestogo': 20}, []))
+        self.assertEqual(parse_go(['infinite']), ({'infinite': True}, []))
+        self.assertEqual(parse_go('depth 2 nodes x'.split()), ({'depth': 2}, ['Invalid go argument nodes x']))
+
+    def test_time_budget(self):
+        self.assertAlmostEqual(time_budget({'movetime': 500}, WHITE), 0.45)
+        self.assertAlmostEqual(time_budget({'wtime': 30000, 'btime': 1000, 'movestogo': 10}, WHITE), 2.95)
+        self.assertAlmostEqual(time_budget({'wtime': 1000, 'btime': 1000, 'winc': 2000}, WHITE), 0.45)
+        self.assertIsNone(time_budget({'depth': 5}, WHITE))
+
+    def test_format_score(self):
+        self.assertEqual(format_score(35), 'cp 35')
+        self.assertEqual(format_score(MATE_SCORE - 1), 'mate 1')
+        self.assertEqual(format_score(MATE_SCORE - 3), 'mate 2')
+        self.assertEqual(format_score(-MATE_SCORE + 2), 'mate -1')
+
+
+class TestUciEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.output = io.StringIO()
+        self.engine = UciEngine(self.output)
+        self.engine.tablebases = None
+
+    def tearDown(self):
+        self.engine.handle('quit')
+
+    def lines(self):
+        return self.output.getvalue().splitlines()
+
+    def wait_for(self, prefix, seconds=10):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            found = [line for line in self.lines() if line.startswith(prefix)]
+            if found:
+                return found[-1]
+            time.sleep(0.01)
+        self.fail(f"No {prefix!r} in {self.lines()}")
+
+    def test_handshake_and_options(self):
+        self.engine.handle('uci')
+        self.assertEqual(self.lines()[-1], 'uciok')
+        self.assertIn('option name Threads type spin default 1 min 1 max 64', self.lines())
+        self.engine.handle('setoption name Hash value 4')
+        self.engine.handle('isready')
+        self.assertEqual(self.lines()[-1], 'readyok')
+        self.assertEqual(self.engine.searcher.tt.size_mb, 4)
+
+    def test_position(self):
+        self.engine.handle('position startpos moves e2e4 e7e5 g1f3')
+        expected = Position.from_board(create_board())
+        for text in ('e2e4', 'e7e5', 'g1f3'):
+            expected.make_move(move_from_uci(text)[0])
+        self.assertEqual(self.engine.position, expected)
+        self.engine.handle('position fen 4k3/P7/8/8/8/8/8/4K3 w - - 0 1 moves a7a8n')
+        self.assertEqual(self.engine.position.to_board()[0][0], 'N')
+        self.engine.handle('position startpos moves e2e5')
+        self.assertEqual(self.lines()[-1], 'info string Illegal move e2e5')
+
+    def test_go_depth_reports_info(self):
+        self.engine.handle('position startpos')
+        self.engine.handle('go depth 3')
+        bestmove = self.wait_for('bestmove')
+        info = [line for line in self.lines() if line.startswith('info depth')]
+        self.assertEqual([line.split()[2] for line in info], ['1', '2', '3'])
+        for field in ('score cp', 'nodes', 'nps', 'time', 'pv'):
+            self.assertIn(f' {field} ', info[-1])
+        move = move_from_uci(bestmove.split()[1])[0]
+        self.assertIn(move, Position.from_board(create_board()).legal_moves())
+        self.assertEqual(bestmove.split()[1], info[-1].split(' pv ')[1].split()[0])
+
+    def test_invalid_go_arguments_are_skipped(self):
+        self.engine.handle('position startpos')
+        self.engine.handle('go depth 2 nodes x')
+        self.assertIn('info string Invalid go argument nodes x', self.lines())
+        self.wait_for('bestmove')
+        self.engine.handle('go wtime abc')
+        self.assertIn('info string Invalid go argument wtime abc', self.lines())
+        self.engine.handle('stop') # Without a valid limit the search runs until stopped
+        self.assertEqual(len([line for line in self.lines() if line.startswith('bestmove')]), 2)
+
+    def test_failed_search_still_answers(self):
+        class Broken(Engine):
+            def search_position(self, *args, **kwargs):
+                raise BrokenProcessPool("A worker died")
+        self.engine.searcher = Broken()
+        self.engine.handle('position startpos')
+        self.engine.handle('go depth 3')
+        bestmove = self.wait_for('bestmove')
+        self.assertIn("info string Search failed: BrokenProcessPool('A worker died')", self.lines())
+        self.assertIn(move_from_uci(bestmove.split()[1])[0], Position.from_board(create_board()).legal_moves())
+
+    def test_mate_score(self):
+        self.engine.handle('position fen 7k/8/6K1/8/8/8/8/1Q6 w - - 0 1')
+        self.engine.handle('go movetime 2000')
+        self.assertEqual(self.wait_for('bestmove'), 'bestmove b1b8')
+        self.assertIn('score mate 1', self.wait_for('info depth'))
+
+    def test_infinite_waits_for_stop(self):
+        self.engine.handle('position fen 7k/8/6K1/8/8/8/8/1Q6 w - - 0 1')
+        self.engine.handle('go infinite')
+        self.wait_for('info depth')
+        time.sleep(0.1)
+        self.assertFalse([line for line in self.lines() if line.startswith('bestmove')]) # Mate found, but no stop
+        self.engine.handle('stop')
+        self.assertEqual(self.lines()[-1], 'bestmove b1b8')
+
+    def test_ponderhit(self):
+        self.engine.handle('position startpos moves e2e4')
+        self.engine.handle('go ponder wtime 10000 btime 3000 movestogo 10')
+        time.sleep(0.3)
+        self.engine.handle('isready')
+        self.assertFalse([line for line in self.lines() if line.startswith('bestmove')])
+        start = time.perf_counter()
+        self.engine.handle('ponderhit')
+        self.wait_for('bestmove', seconds=5)
+        self.assertLess(time.perf_counter() - start, 2)
+
+    def test_threads(self):
+        self.engine.handle('setoption name Threads value 2')
+        self.engine.handle('isready')
+        self.engine.handle('position startpos moves e2e4')
+        self.engine.handle('go depth 3 nodes 100000')
+        bestmove = self.wait_for('bestmove', seconds=30)
+        self.assertEqual(self.wait_for('info depth').split()[2], '3')
+        position = Position.from_board(create_board())
+        position.make_move(move_from_uci('e2e4')[0])
+        self.assertIn(move_from_uci(bestmove.split()[1])[0], position.legal_moves())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+
+from position import Position, move_from_tuple
+from rules import create_board
+from zobrist import hash_board
+
+class TestZobrist(unittest.TestCase):
+
+    def test_side_to_move_changes_key(self):
+        board = create_board()
+        self.assertNotEqual(hash_board(board, 'white'), hash_board(board, 'black'))
+
+    def test_transposition_has_same_key(self):
+        position = Position.from_board(create_board())
+        for move in (((7, 6), (5, 5)), ((0, 6), (2, 5)), ((7, 1), (5, 2))):
+            position.make_move(move_from_tuple(move))
+        other = Position.from_board(create_board())
+        for move in (((7, 1), (5, 2)), ((0, 6), (2, 5)), ((7, 6), (5, 5))):
+            other.make_move(move_from_tuple(move))
+        self.assertEqual(position.key, other.key)
+        self.assertEqual(position.key, hash_board(position.to_board(), position.player))
+
+if __name__ == '__main__':
+    unittest.main()
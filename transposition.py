@@ -0,0 +1,123 @@
+"""Fixed-memory transposition table for the search.
+
+The table is a pair of flat arrays holding 64-bit Zobrist keys and 64-bit
+packed entries (score, depth, bound type, best move and search generation),
+so its memory use is fixed by the size it is created with and storing an
+entry allocates nothing. Moves are the int moves of position.Position.
+
+Slots are grouped in buckets of two. The first slot is depth-preferred: it
+is only replaced by a search at least as deep, or once its entry is left over
+from an earlier search. The second slot is always replaced, so recent
+shallow results are kept too.
+"""
+from array import array
+
+# Bound types
+EXACT = 1
+LOWER = 2 # Score is at least this (fail high)
+UPPER = 3 # Score is at most this (fail low)
+
+SLOT_BYTES = 16 # One 8-byte key plus one 8-byte packed entry
+BUCKET_SLOTS = 2
+
+# Packed entry layout, from the low bits up
+_MOVE_MASK = (1 << 13) - 1 # Move + 1, or 0 for no move
+_BOUND_SHIFT = 13
+_DEPTH_SHIFT = 15
+_GENERATION_SHIFT = 23
+_SCORE_SHIFT = 32
+_SCORE_OFFSET = 1 << 31
+
+
+class TranspositionTable:
+    """Stores search results by Zobrist key in a fixed amount of memory."""
+
+    def __init__(self, size_mb=16):
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        """Reallocates the table for size_mb megabytes, discarding all entries."""
+        self.size_mb = size_mb
+        self.bucket_count = max(1, int(size_mb * 1024 * 1024) // (SLOT_BYTES * BUCKET_SLOTS))
+        slots = self.bucket_count * BUCKET_SLOTS
+        self.keys = array('Q', bytes(8 * slots))
+        self.entries = array('Q', bytes(8 * slots))
+        self.generation = 0
+        self.reset_stats()
+
+    def clear(self):
+        """Empties the table without reallocating it."""
+        self.resize(self.size_mb)
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        """Marks entries stored so far as old, so deeper stale entries can be replaced."""
+        self.generation = (self.generation + 1) & 0xFF
+
+    def probe(self, key):
+        """Returns (depth, bound, score, move) stored for key, or None."""
+        self.probes += 1
+        slot = (key % self.bucket_count) * BUCKET_SLOTS
+        keys = self.keys
+        for index in (slot, slot + 1):
+            if keys[index] == key:
+                entry = self.entries[index]
+                if entry:
+                    self.hits += 1
+                    code = entry & _MOVE_MASK
+                    return (
+                        (entry >> _DEPTH_SHIFT) & 0xFF,
+                        (entry >> _BOUND_SHIFT) & 0x3,
+                        (entry >> _SCORE_SHIFT) - _SCORE_OFFSET,
+                        code - 1 if code else None,
+                    )
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        """Stores a search result for key, following the bucket replacement scheme."""
+        self.stores += 1
+        slot = (key % self.bucket_count) * BUCKET_SLOTS
+        keys, entries = self.keys, self.entries
+        old = entries[slot]
+        if old and keys[slot] != key and ((old >> _DEPTH_SHIFT) & 0xFF) > depth and \
+           ((old >> _GENERATION_SHIFT) & 0xFF) == self.generation:
+            # Keep the deeper entry from this search, use the always-replace slot
+            slot += 1
+            old = entries[slot]
+
+        code = 0 if move is None else move + 1
+        if code == 0 and old and keys[slot] == key:
+            code = old & _MOVE_MASK # Keep the best move we already knew
+        keys[slot] = key
+        entries[slot] = (
+            ((score + _SCORE_OFFSET) << _SCORE_SHIFT)
+            | (self.generation << _GENERATION_SHIFT)
+            | (min(max(depth, 0), 0xFF) << _DEPTH_SHIFT)
+            | (bound << _BOUND_SHIFT)
+            | code
+        )
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def fill(self, sample=1000):
+        """Returns the fraction of slots in use, estimated from the first buckets."""
+        slots = min(sample, self.bucket_count) * BUCKET_SLOTS
+        entries = self.entries
+        return sum(1 for index in range(slots) if entries[index]) / slots
+
+    def stats(self):
+        """Returns the table size, hit rate and fill level as a dict."""
+        return {
+            'size_mb': self.size_mb,
+            'slots': len(self.keys),
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hit_rate(),
+            'stores': self.stores,
+            'fill': self.fill(),
+        }
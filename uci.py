@@ -0,0 +1,460 @@
+"""UCI front end, so chess GUIs and tournament managers can play the engine.
+
+Reads UCI commands on stdin and answers on stdout. The search runs on a
+background thread, so stop, ponderhit and isready are answered while it
+thinks. Supported:
+
+    uci, isready, ucinewgame, quit
+    setoption name Hash value <MB>       transposition table size in total
+    setoption name Threads value <N>     search processes; see ParallelSearch
+    setoption name Ponder value <bool>   announces pondering support to the GUI
+    position startpos|fen <fen> [moves <move> ...]
+    go [ponder] [wtime <ms>] [btime <ms>] [winc <ms>] [binc <ms>] [movestogo <n>]
+       [movetime <ms>] [depth <n>] [nodes <n>] [infinite]
+    stop, ponderhit
+
+After every completed iteration the search reports an info line with depth,
+score, nodes, nps, time and principal variation. With go ponder or go
+infinite, bestmove waits for stop or ponderhit as the protocol requires; on
+ponderhit the search carries on under the time budget of the go command.
+
+Usage:
+    python uci.py
+"""
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import multiprocessing
+
+from engine import MATE_SCORE, MATE_THRESHOLD, MAX_DEPTH, Engine, SearchResult, score_from_tablebase
+from position import QUEEN, WHITE, Position, move_from_uci, move_to_uci
+from rules import create_board
+from tablebase import open_tablebases
+
+ENGINE_NAME = 'Chess'
+ENGINE_AUTHOR = 'GioDev'
+
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 4096
+MAX_THREADS = 64
+# Seconds kept back from every move for the GUI and the pipe
+MOVE_OVERHEAD = 0.05
+# Moves the remaining time is shared between when the GUI does not say
+DEFAULT_MOVES_TO_GO = 30
+# Seconds between checks for stop and the deadline while workers search
+POLL_INTERVAL = 0.01
+
+
+def time_budget(limits, side):
+    """Returns the seconds to spend on a move under a go command's limits, or None for no limit."""
+    if 'movetime' in limits:
+        return max(limits['movetime'] / 1000 - MOVE_OVERHEAD, 0.001)
+    remaining = limits.get('wtime' if side == WHITE else 'btime')
+    if remaining is None:
+        return None
+    increment = limits.get('winc' if side == WHITE else 'binc', 0)
+    budget = remaining / limits.get('movestogo', DEFAULT_MOVES_TO_GO) + increment * 0.8
+    return max(min(budget, remaining / 2) / 1000 - MOVE_OVERHEAD, 0.001)
+
+
+def parse_go(tokens):
+    """Parses the arguments of go into a dict of limits; flags map to True.
+
+    A limit whose value is not an integer is skipped, as UCI asks of unknown
+    tokens; the messages about them are returned with the limits.
+    """
+    limits = {}
+    errors = []
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token in ('ponder', 'infinite'):
+            limits[token] = True
+        elif token in ('wtime', 'btime', 'winc', 'binc', 'movestogo', 'movetime', 'depth', 'nodes', 'mate') \
+                and index + 1 < len(tokens):
+            index += 1
+            try:
+                limits[token] = int(tokens[index])
+            except ValueError:
+                errors.append(f"Invalid go argument {token} {tokens[index]}")
+        index += 1
+    return limits, errors
+
+
+def format_score(score):
+    """Formats an engine score as UCI 'cp <centipawns>' or 'mate <moves>'."""
+    if score >= MATE_THRESHOLD:
+        return f"mate {(MATE_SCORE - score + 1) // 2}"
+    if score <= -MATE_THRESHOLD:
+        return f"mate -{(MATE_SCORE + score) // 2}"
+    return f"cp {score}"
+
+
+def format_move(position, move):
+    """Formats an int move of position in UCI notation; promotions are always to a queen."""
+    return move_to_uci(move, QUEEN if position.is_promotion(move) else None)
+
+
+def format_line(position, line):
+    """Formats a line of int moves starting at position."""
+    texts = []
+    for move in line:
+        texts.append(format_move(position, move))
+        position.make_move(move)
+    for _ in line:
+        position.unmake_move()
+    return ' '.join(texts)
+
+
+# --- Multi-process search ---
+
+_worker_engine = None
+_worker_stop = None
+
+
+class _WorkerEngine(Engine):
+    """An Engine whose stop flag is the event shared with the parent process."""
+
+    @property
+    def stopped(self):
+        return _worker_stop.is_set()
+
+    @stopped.setter
+    def stopped(self, value):
+        pass
+
+
+def _init_worker(stop, hash_mb):
+    global _worker_engine, _worker_stop
+    _worker_stop = stop
+    _worker_engine = _WorkerEngine(hash_mb)
+
+
+def _search_moves(squares, side, moves, depth, time_limit, node_limit):
+    """Searches some root moves in a worker; returns (SearchResult, principal variation)."""
+    position = Position.from_squares(squares, side)
+    result = _worker_engine.search_moves(position, moves, depth, time_limit, node_limit)
+    line = _worker_engine.principal_variation(position) if result.move is not None else []
+    if line[:1] != [result.move]:
+        line = [result.move] if result.move is not None else []
+    return result, line
+
+
+class ParallelSearch:
+    """Iterative deepening with the root moves split between worker processes.
+
+    Each iteration deals the root moves out to the workers, best move of the
+    previous iteration first, and every worker searches its share to the
+    same depth with a full window, so their scores compare directly. Workers
+    keep their engines, and so their transposition tables and move ordering
+    statistics, from one iteration and one move to the next. A shared event
+    stops them all at once. It has the same search_position and stop
+    interface as Engine.
+    """
+
+    def __init__(self, threads, hash_mb=DEFAULT_HASH_MB, tablebases=None):
+        self.threads = threads
+        self.tablebases = tablebases
+        # Forking while the main thread blocks reading stdin would deadlock the child on the stdin lock
+        context = multiprocessing.get_context('spawn')
+        self.stop_event = context.Event()
+        self.executor = ProcessPoolExecutor(max_workers=threads, mp_context=context, initializer=_init_worker,
+                                            initargs=(self.stop_event, max(1, hash_mb // threads)))
+        for _ in range(threads):
+            self.executor.submit(int) # Start the workers now rather than on the first move
+        self.stopped = False
+        self.deadline = None
+        self.line = []
+
+    def stop(self):
+        """Stops the workers' searches and the iteration loop; search_position returns its best so far."""
+        self.stopped = True
+        self.stop_event.set()
+
+    def reset_stop(self):
+        """Clears an earlier stop(); called before the search thread starts, as with Engine."""
+        self.stopped = False
+
+    def close(self):
+        """Stops any search and shuts the worker processes down."""
+        self.stop()
+        self.executor.shutdown(cancel_futures=True)
+
+    def principal_variation(self, position):
+        return list(self.line)
+
+    def search_position(self, position, time_limit=None, node_limit=None, max_depth=MAX_DEPTH, info=None):
+        start = time.perf_counter()
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.line = []
+        moves = position.legal_moves()
+        if not moves:
+            return SearchResult(None, -MATE_SCORE if position.in_check() else 0, 0, 0, time.perf_counter() - start)
+        if self.tablebases is not None:
+            probed = self.tablebases.best_move(position)
+            if probed is not None:
+                self.line = [probed[0]]
+                return SearchResult(probed[0], score_from_tablebase(probed[1]), 0, 0, time.perf_counter() - start)
+
+        squares = bytes(position.squares)
+        best_move, best_score, depth_reached, nodes = moves[0], 0, 0, 0
+        for depth in range(1, max_depth + 1):
+            ordered = [best_move] + [move for move in moves if move != best_move]
+            shares = [ordered[index::self.threads] for index in range(min(self.threads, len(ordered)))]
+            budget = None
+            if node_limit is not None:
+                budget = (node_limit - nodes) // len(shares)
+                if budget <= 0:
+                    break
+            self.stop_event.clear()
+            if self.stopped:
+                break
+            remaining = None if self.deadline is None else max(self.deadline - time.perf_counter(), 0)
+            pending = {self.executor.submit(_search_moves, squares, position.side, share, depth, remaining, budget)
+                       for share in shares}
+            futures = list(pending)
+            while pending:
+                _, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                if self.stopped or self.deadline is not None and time.perf_counter() >= self.deadline:
+                    self.stop_event.set()
+            results = [future.result() for future in futures]
+            nodes += sum(result.nodes for result, _ in results)
+
+            finished = [(result, line) for result, line in results if result.move is not None]
+            best = max(finished, key=lambda entry: entry[0].score) if finished else None
+            if any(result.depth != depth for result, _ in results):
+                # Only a share that beat the last complete iteration is worth switching to
+                if best is not None and (depth_reached == 0 or best[0].score > best_score):
+                    best_move, best_score = best[0].move, best[0].score
+                    self.line = best[1]
+                break
+            best_move, best_score = best[0].move, best[0].score
+            self.line = best[1]
+            depth_reached = depth
+            if info is not None:
+                info(SearchResult(best_move, best_score, depth, nodes, time.perf_counter() - start))
+            if abs(best_score) >= MATE_THRESHOLD or len(moves) == 1:
+                break
+            if self.deadline is not None and time.perf_counter() > start + (self.deadline - start) / 2:
+                break
+        return SearchResult(best_move, best_score, depth_reached, nodes, time.perf_counter() - start)
+
+
+# --- Protocol ---
+
+class UciEngine:
+    """Handles UCI commands one line at a time and writes the replies to output."""
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.threads = 1
+        self.tablebases = open_tablebases()
+        self.searcher = None
+        self.position = Position.from_board(create_board())
+        self.thread = None
+        self.release = threading.Event() # Set when bestmove may be sent
+        self.limits = {}
+        self.timer = None
+        self.reported = False
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def get_searcher(self):
+        if self.searcher is None:
+            if self.threads > 1:
+                self.searcher = ParallelSearch(self.threads, self.hash_mb, self.tablebases)
+            else:
+                self.searcher = Engine(self.hash_mb, tablebases=self.tablebases)
+        return self.searcher
+
+    def close_searcher(self):
+        if isinstance(self.searcher, ParallelSearch):
+            self.searcher.close()
+        self.searcher = None
+
+    def handle(self, line):
+        """Carries out one command; returns False once the engine should exit."""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}")
+            self.send(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+            self.send("option name Ponder type check default false")
+            self.send("uciok")
+        elif command == 'isready':
+            if self.thread is None:
+                self.get_searcher() # Options are set by now; have the search ready for go
+            self.send("readyok")
+        elif command == 'setoption':
+            self.set_option(arguments)
+        elif command == 'ucinewgame':
+            self.finish_search()
+            self.close_searcher()
+        elif command == 'position':
+            self.finish_search()
+            self.set_position(arguments)
+        elif command == 'go':
+            self.finish_search()
+            limits, errors = parse_go(arguments)
+            for error in errors:
+                self.send(f"info string {error}")
+            self.go(limits)
+        elif command == 'stop':
+            self.finish_search()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            self.finish_search()
+            self.close_searcher()
+            return False
+        else:
+            self.send(f"info string Unknown command: {line.strip()}")
+        return True
+
+    def set_option(self, arguments):
+        if 'name' not in arguments:
+            return
+        name_end = arguments.index('value') if 'value' in arguments else len(arguments)
+        name = ' '.join(arguments[arguments.index('name') + 1:name_end]).lower()
+        value = ' '.join(arguments[name_end + 1:])
+        try:
+            if name == 'hash':
+                self.finish_search()
+                self.hash_mb = min(max(int(value), 1), MAX_HASH_MB)
+                self.close_searcher()
+            elif name == 'threads':
+                self.finish_search()
+                self.threads = min(max(int(value), 1), MAX_THREADS)
+                self.close_searcher()
+            elif name != 'ponder':
+                self.send(f"info string Unknown option: {name}")
+        except ValueError:
+            self.send(f"info string Invalid value for {name}: {value}")
+
+    def set_position(self, arguments):
+        if arguments[:1] == ['startpos']:
+            position, rest = Position.from_board(create_board()), arguments[1:]
+        elif arguments[:1] == ['fen']:
+            end = arguments.index('moves') if 'moves' in arguments else len(arguments)
+            try:
+                position = Position.from_fen(' '.join(arguments[1:end]))
+            except ValueError as error:
+                self.send(f"info string {error}")
+                return
+            rest = arguments[end:]
+        else:
+            self.send("info string Expected position startpos or position fen")
+            return
+        for text in rest[1:] if rest[:1] == ['moves'] else []:
+            try:
+                move, promotion = move_from_uci(text)
+            except ValueError as error:
+                self.send(f"info string {error}")
+                break
+            if move not in position.legal_moves():
+                self.send(f"info string Illegal move {text}")
+                break
+            position.make_move(move, promotion or QUEEN)
+        position.history.clear() # Undo records of the game are never needed
+        self.position = position
+
+    def go(self, limits):
+        self.limits = limits
+        self.reported = False
+        searcher = self.get_searcher()
+        waits = limits.get('ponder') or limits.get('infinite')
+        self.release.clear()
+        if not waits:
+            self.release.set()
+        time_limit = None if waits else time_budget(limits, self.position.side)
+        # Cleared here rather than in the search, so that a stop sent right after go is kept
+        searcher.reset_stop()
+        self.thread = threading.Thread(target=self.search, daemon=True,
+                                       args=(searcher, self.position.copy(), time_limit, limits.get('nodes'),
+                                             limits.get('depth', MAX_DEPTH)))
+        self.thread.start()
+
+    def search(self, searcher, position, time_limit, node_limit, max_depth):
+        try:
+            result = searcher.search_position(position, time_limit, node_limit, max_depth, info=self.info)
+            line = searcher.principal_variation(position)
+        except Exception as error: # E.g. a dead worker process; the GUI still needs a bestmove
+            self.send(f"info string Search failed: {error!r}")
+            moves = position.legal_moves()
+            result = SearchResult(moves[0] if moves else None, 0, 0, 0, 0.0)
+            line = []
+        if result.move is not None and line[:1] != [result.move]:
+            line = [result.move]
+        if not self.reported:
+            self.info(result, line)
+        self.release.wait() # Pondering or infinite: the GUI decides when the move is due
+        if result.move is None:
+            self.send("bestmove 0000")
+            return
+        reply = f"bestmove {format_move(position, result.move)}"
+        if len(line) > 1:
+            position.make_move(result.move)
+            reply += f" ponder {format_move(position, line[1])}"
+            position.unmake_move()
+        self.send(reply)
+
+    def info(self, result, line=None):
+        self.reported = True
+        if line is None:
+            line = self.searcher.principal_variation(self.position.copy())
+            if line[:1] != [result.move]:
+                line = [result.move]
+        nps = int(result.nodes / result.seconds) if result.seconds > 0 else 0
+        self.send(f"info depth {result.depth} score {format_score(result.score)} nodes {result.nodes} "
+                  f"nps {nps} time {int(result.seconds * 1000)} pv {format_line(self.position.copy(), line)}".rstrip())
+
+    def ponderhit(self):
+        """The opponent played the expected move: keep searching, now against the clock."""
+        if self.thread is None or not self.limits.get('ponder'):
+            return
+        self.limits.pop('ponder')
+        budget = time_budget(self.limits, self.position.side)
+        if budget is not None:
+            self.timer = threading.Timer(budget, self.get_searcher().stop)
+            self.timer.daemon = True
+            self.timer.start()
+        self.release.set()
+
+    def finish_search(self):
+        """Stops a running search and waits for its bestmove."""
+        if self.thread is None:
+            return
+        self.searcher.stop()
+        self.release.set()
+        self.thread.join()
+        self.thread = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def run(self, lines):
+        for line in lines:
+            if not self.handle(line):
+                break
+        else:
+            self.finish_search()
+            self.close_searcher()
+
+
+def main(argv=None):
+    UciEngine().run(sys.stdin)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
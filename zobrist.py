@@ -0,0 +1,33 @@
+"""Zobrist hashing of board positions.
+
+Every (piece, square) pair and the side to move get a fixed random 64-bit
+number, and a position's key is the XOR of the numbers for everything on the
+board. Since XOR is its own inverse, a move only changes the key by the
+numbers of the squares it touches, so Position.make_move updates its key
+incrementally instead of recomputing it from the whole board.
+"""
+import random
+
+from rules import BLACK_PIECES, BOARD_SIZE, WHITE_PIECES
+
+# Fixed seed so that keys are the same in every process and on every run
+_rng = random.Random(0x5EED)
+
+PIECE_KEYS = {
+    piece: tuple(_rng.getrandbits(64) for _ in range(BOARD_SIZE * BOARD_SIZE))
+    for piece in sorted(WHITE_PIECES | BLACK_PIECES)
+}
+BLACK_TO_MOVE_KEY = _rng.getrandbits(64)
+
+del _rng
+
+
+def hash_board(board, player):
+    """Computes the key of board with player to move from scratch."""
+    key = BLACK_TO_MOVE_KEY if player == 'black' else 0
+    for r, row in enumerate(board):
+        for c, piece in enumerate(row):
+            if piece != ' ':
+                key ^= PIECE_KEYS[piece][r * BOARD_SIZE + c]
+    return key
+